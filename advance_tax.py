@@ -0,0 +1,338 @@
+import bisect
+import datetime
+import functools
+import time
+
+import numpy as np
+import pandas as pd
+
+import rule_packs
+import tax_calendar
+from tax_engine import regime_tax
+
+# --- ADVANCE TAX RULES (Sec 208-211, 234B, 234C) ---
+ADVANCE_TAX_THRESHOLD = 10000 # Sec 208: below this net liability there is no advance tax, so no 234B/234C
+INTEREST_RATE = 0.01 # Per month or part of a month
+SECTION_234B_FLOOR = 0.90 # 234B applies when advance tax paid is below 90% of assessed tax
+INTEREST_MONTHS_234C = (3, 3, 3, 1)
+# Paying 12% by June and 36% by September (of the 15% / 45% due) avoids 234C for those installments
+SAFE_HARBOUR_234C = (0.12 / 0.15, 0.36 / 0.45, None, None)
+# Income that can't be foreseen: its tax only falls due from the installment after it arises (proviso to 234C)
+EXCUSED_INCOME_KINDS = {"capital_gains", "dividend", "winnings"}
+DUE_COLOR = "#0000FF"
+PAID_COLOR = "#008000"
+# --- END RULES ---
+
+
+@functools.lru_cache(maxsize=None)
+def _schedule(fy_start_year):
+    """Installments plus the date boundaries used to bucket income and payments for one financial year."""
+    installments = tax_calendar.advance_tax_due_dates(fy_start_year)
+    due_dates = [due for _, due, _ in installments]
+    return {
+        "installments": installments,
+        "pcts": np.array([pct for _, _, pct in installments]),
+        "fy_start": datetime.date(fy_start_year, 4, 1),
+        "income_bounds": due_dates, # bin i: income arising after due i-1, up to and including due i
+        "payment_bounds": due_dates + [datetime.date(fy_start_year + 1, 3, 31)], # bin 4: 16-31 March; bin 5: after the year
+        "ay_start": datetime.date(fy_start_year + 1, 4, 1),
+    }
+
+
+def filing_deadline(fy_start_year):
+    """Default 'as of' date for 234B: the ITR due date for the year."""
+    return next(datetime.date.fromisoformat(e["start"]) for e in tax_calendar.statutory_deadlines(fy_start_year)
+                if e["title"] == "ITR Filing Deadline")
+
+
+def _months_234b(fy_start_year, as_of):
+    """Months (part months count in full) from 1 April of the assessment year to `as_of`."""
+    ay_start = _schedule(fy_start_year)["ay_start"]
+    if as_of < ay_start:
+        return 0
+    return (as_of.year - ay_start.year) * 12 + as_of.month - ay_start.month + 1
+
+
+def _floor_100(amount):
+    """Rule 119A: interest is worked out on the amount rounded down to a multiple of Rs. 100."""
+    return np.floor(np.maximum(amount, 0) / 100) * 100
+
+
+# --- VECTORIZED CORE (shared by the ledger and the batch run; arrays have one row per taxpayer) ---
+def assessed_tax(total_income, excused_income_bins, regime_is_old, deductions, tds, rules=None):
+    """Tax on the year's income net of TDS, and the part of it attributable to excused income in each bin.
+
+    `rules` is the RulePack of the year (rule_packs.pack_for_financial_year).
+    """
+    taxable = np.maximum(total_income - deductions, 0)
+    tax = np.where(regime_is_old, regime_tax(taxable, "Old", rules), regime_tax(taxable, "New", rules))
+    assessed = np.maximum(tax - tds, 0)
+    average_rate = np.divide(assessed, total_income, out=np.zeros_like(assessed), where=total_income > 0)
+    return assessed, excused_income_bins * average_rate[:, None]
+
+
+def required_installments(assessed, excused_tax_bins, pcts):
+    """(n, 4) cumulative advance tax due by each installment; zero below ADVANCE_TAX_THRESHOLD."""
+    regular = assessed - excused_tax_bins.sum(axis=1)
+    required = regular[:, None] * pcts + np.cumsum(excused_tax_bins, axis=1)[:, :len(pcts)]
+    return np.where((assessed >= ADVANCE_TAX_THRESHOLD)[:, None], required, 0.0)
+
+
+def interest_234c(required, paid, quarter):
+    """(shortfall, interest) for one installment, given cumulative amounts due and paid by its due date."""
+    shortfall = np.maximum(required - paid, 0)
+    safe_harbour = SAFE_HARBOUR_234C[quarter]
+    if safe_harbour is not None:
+        shortfall = np.where(paid >= safe_harbour * required, 0.0, shortfall)
+    return shortfall, _floor_100(shortfall) * INTEREST_RATE * INTEREST_MONTHS_234C[quarter]
+
+
+def interest_234b(assessed, advance_paid, self_assessed_by_month):
+    """234B interest; self-assessment tax paid during a month reduces the base from the next month on."""
+    liable = (assessed >= ADVANCE_TAX_THRESHOLD) & (advance_paid < SECTION_234B_FLOOR * assessed)
+    paid_before = np.cumsum(self_assessed_by_month, axis=1) - self_assessed_by_month
+    base = _floor_100((assessed - advance_paid)[:, None] - paid_before)
+    return np.where(liable, base.sum(axis=1) * INTEREST_RATE, 0.0)
+# --- END VECTORIZED CORE ---
+
+
+# --- INCREMENTAL LEDGER (one taxpayer) ---
+class AdvanceTaxLedger:
+    """One taxpayer's advance tax position for a financial year, updated one event at a time.
+
+    Income and payments are kept as per-window totals, and each installment's 234C result is
+    cached on its (required, paid) inputs, so a payment only recomputes the installments due
+    on or after its date (plus 234B). New income changes the tax, so it recomputes everything.
+    """
+
+    def __init__(self, fy_start_year, regime="New", deductions=None, tds=0.0, as_of=None):
+        self.fy_start_year = fy_start_year
+        self.rules = rule_packs.pack_for_financial_year(fy_start_year)
+        if deductions is None:
+            deductions = self.rules.standard_deduction["Old" if regime == "Old" else "New"]
+        self.regime, self.deductions, self.tds = regime, deductions, tds
+        self.as_of = as_of or filing_deadline(fy_start_year)
+        self.incomes, self.payments = [], [] # Raw events, e.g. to replay into a ledger with another regime
+        self._schedule = _schedule(fy_start_year)
+        self._income_total = 0.0
+        self._excused_income = np.zeros(len(self._schedule["income_bounds"]) + 1)
+        self._paid = np.zeros(len(self._schedule["payment_bounds"]) + 1)
+        self._self_assessed = np.zeros(_months_234b(fy_start_year, self.as_of))
+        self._partials = {} # name -> (input key, value)
+        self.recomputed = [] # partials recomputed on the last result()
+
+    def _check_date(self, date):
+        if date < self._schedule["fy_start"]:
+            raise ValueError(f"{date} is before the start of {tax_calendar.fy_label(self.fy_start_year)}")
+
+    def add_income(self, date, amount, kind="regular"):
+        """Records income earned on `date`; kinds in EXCUSED_INCOME_KINDS only count from the next installment."""
+        self._check_date(date)
+        if date >= self._schedule["ay_start"]:
+            raise ValueError(f"{date} is after the end of {tax_calendar.fy_label(self.fy_start_year)}")
+        self.incomes.append((date, amount, kind))
+        self._income_total += amount
+        if kind in EXCUSED_INCOME_KINDS:
+            self._excused_income[bisect.bisect_left(self._schedule["income_bounds"], date)] += amount
+
+    def add_payment(self, date, amount):
+        """Records tax paid on `date`: advance tax up to 31 March, self-assessment tax after it."""
+        self._check_date(date)
+        self.payments.append((date, amount))
+        window = bisect.bisect_left(self._schedule["payment_bounds"], date)
+        self._paid[window] += amount
+        if window == len(self._schedule["payment_bounds"]):
+            month = _months_234b(self.fy_start_year, date) - 1
+            if month < len(self._self_assessed): # Paid after `as_of`: no effect on interest to that date
+                self._self_assessed[month] += amount
+
+    def _cached(self, name, key, compute):
+        hit = self._partials.get(name)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        value = compute()
+        self._partials[name] = (key, value)
+        self.recomputed.append(name)
+        return value
+
+    def result(self):
+        """Installments with shortfalls and 234C interest, plus 234B, as plain floats."""
+        self.recomputed = []
+        pcts = self._schedule["pcts"]
+        income_key = (self._income_total, tuple(self._excused_income))
+        assessed, excused_tax = self._cached(
+            "assessed", income_key,
+            lambda: assessed_tax(np.array([self._income_total]), self._excused_income[None, :],
+                                 np.array([self.regime == "Old"]), self.deductions, self.tds, self.rules)
+        )
+        required = self._cached("required", income_key,
+                                lambda: required_installments(assessed, excused_tax, pcts)[0])
+        paid_by_due = np.cumsum(self._paid)
+
+        installments = []
+        for q, (title, due, pct) in enumerate(self._schedule["installments"]):
+            shortfall, interest = self._cached(
+                f"234C:{q + 1}", (float(required[q]), float(paid_by_due[q])),
+                lambda: tuple(float(v[0]) for v in interest_234c(required[q:q + 1], paid_by_due[q:q + 1], q))
+            )
+            installments.append({
+                "title": title, "due_date": due, "cumulative_pct": pct, "required": float(required[q]),
+                "paid": float(paid_by_due[q]), "shortfall": shortfall, "interest_234c": interest,
+            })
+
+        advance_paid = float(paid_by_due[len(self._schedule["payment_bounds"]) - 1])
+        i234b = self._cached(
+            "234B", (float(assessed[0]), advance_paid, tuple(self._self_assessed)),
+            lambda: float(interest_234b(assessed, np.array([advance_paid]), self._self_assessed[None, :])[0])
+        )
+        i234c = sum(i["interest_234c"] for i in installments)
+        return {
+            "fy_start_year": self.fy_start_year,
+            "assessed_tax": float(assessed[0]),
+            "liable": float(assessed[0]) >= ADVANCE_TAX_THRESHOLD,
+            "installments": installments,
+            "advance_tax_paid": advance_paid,
+            "self_assessment_paid": float(self._paid[-1]),
+            "interest_234c": i234c,
+            "interest_234b": i234b,
+            "total_interest": i234c + i234b,
+            "as_of": self.as_of,
+        }
+# --- END INCREMENTAL LEDGER ---
+
+
+def installment_events(result):
+    """Calendar events for each installment, with the amount still due; see tax_calendar.window_events."""
+    events = []
+    for inst in result["installments"]:
+        if not result["liable"]:
+            continue
+        due = inst["shortfall"] if inst["shortfall"] > 0 else max(inst["required"] - inst["paid"], 0)
+        title = f"{inst['title']}: Rs. {due:,.0f} due" if due > 0 else f"{inst['title']}: ✅ paid"
+        events.append({
+            "title": title, "rule_title": inst["title"], "start": inst["due_date"].isoformat(),
+            "color": DUE_COLOR if due > 0 else PAID_COLOR,
+            "description": f"Cumulative {inst['cumulative_pct']:.0%} due: Rs. {inst['required']:,.0f}; "
+                           f"paid by this date: Rs. {inst['paid']:,.0f}.",
+        })
+    return events
+
+
+# --- BATCH (many taxpayers) ---
+def _day_bins(dates, bounds):
+    return np.searchsorted(np.array(bounds, dtype="datetime64[D]"), dates, side="left")
+
+
+def compute_batch(taxpayers, incomes, payments, fy_start_year, as_of=None):
+    """Advance tax position for many taxpayers at once.
+
+    taxpayers: taxpayer_id, regime, tds (optional: deductions, default the year's standard deduction for the regime)
+    incomes:   taxpayer_id, date, amount (optional: kind)
+    payments:  taxpayer_id, date, amount
+    Returns one row per taxpayer with required / paid / shortfall / 234C per installment and 234B.
+    """
+    schedule = _schedule(fy_start_year)
+    rules = rule_packs.pack_for_financial_year(fy_start_year)
+    as_of = as_of or filing_deadline(fy_start_year)
+    n, n_months = len(taxpayers), _months_234b(fy_start_year, as_of)
+    ids = pd.Index(taxpayers["taxpayer_id"])
+
+    def _rows(frame, label):
+        rows = ids.get_indexer(frame["taxpayer_id"])
+        if (rows < 0).any():
+            raise ValueError(f"{label} has {(rows < 0).sum()} row(s) for unknown taxpayer_id")
+        dates = pd.to_datetime(frame["date"]).to_numpy().astype("datetime64[D]")
+        if (dates < np.datetime64(schedule["fy_start"])).any():
+            raise ValueError(f"{label} has dates before the start of {tax_calendar.fy_label(fy_start_year)}")
+        return rows, dates, frame["amount"].to_numpy(dtype=float)
+
+    rows, dates, amounts = _rows(incomes, "incomes")
+    total_income = np.bincount(rows, weights=amounts, minlength=n)
+    excused_income = np.zeros((n, len(schedule["income_bounds"]) + 1))
+    if "kind" in incomes.columns:
+        excused = incomes["kind"].isin(EXCUSED_INCOME_KINDS).to_numpy()
+        np.add.at(excused_income, (rows[excused], _day_bins(dates[excused], schedule["income_bounds"])), amounts[excused])
+
+    rows, dates, amounts = _rows(payments, "payments")
+    paid = np.zeros((n, len(schedule["payment_bounds"]) + 1))
+    windows = _day_bins(dates, schedule["payment_bounds"])
+    np.add.at(paid, (rows, windows), amounts)
+    self_assessed = np.zeros((n, n_months))
+    months = (dates.astype("datetime64[M]") - np.datetime64(schedule["ay_start"], "M")).astype(int)
+    late = (windows == len(schedule["payment_bounds"])) & (months < n_months)
+    np.add.at(self_assessed, (rows[late], months[late]), amounts[late])
+
+    is_old = taxpayers["regime"].astype(str).str.strip().str.lower().eq("old").to_numpy()
+    if "deductions" in taxpayers.columns:
+        deductions = taxpayers["deductions"].to_numpy(dtype=float)
+    else:
+        deductions = np.where(is_old, rules.standard_deduction["Old"], rules.standard_deduction["New"])
+    assessed, excused_tax = assessed_tax(total_income, excused_income, is_old, deductions,
+                                         taxpayers["tds"].fillna(0).to_numpy(dtype=float), rules)
+    required = required_installments(assessed, excused_tax, schedule["pcts"])
+    paid_by_due = np.cumsum(paid, axis=1)
+
+    out = {"taxpayer_id": ids.to_numpy(), "assessed_tax": assessed}
+    total_234c = np.zeros(n)
+    for q in range(len(schedule["installments"])):
+        shortfall, interest = interest_234c(required[:, q], paid_by_due[:, q], q)
+        out.update({f"required_q{q + 1}": required[:, q], f"paid_q{q + 1}": paid_by_due[:, q],
+                    f"shortfall_q{q + 1}": shortfall, f"interest_234c_q{q + 1}": interest})
+        total_234c += interest
+    advance_paid = paid_by_due[:, len(schedule["payment_bounds"]) - 1]
+    out["advance_tax_paid"] = advance_paid
+    out["interest_234c"] = total_234c
+    out["interest_234b"] = interest_234b(assessed, advance_paid, self_assessed)
+    out["total_interest"] = out["interest_234c"] + out["interest_234b"]
+    return pd.DataFrame(out)
+# --- END BATCH ---
+
+
+# --- BENCHMARK ---
+def _synthetic_batch(n, fy_start_year, seed=17):
+    rng = np.random.default_rng(seed)
+    fy_start = np.datetime64(f"{fy_start_year}-04-01")
+    taxpayers = pd.DataFrame({
+        "taxpayer_id": np.arange(n),
+        "regime": np.where(rng.random(n) < 0.3, "Old", "New"),
+        "tds": rng.uniform(0, 200000, n).round(0),
+    })
+    incomes = pd.DataFrame({
+        "taxpayer_id": np.concatenate([np.arange(n), rng.integers(0, n, n // 4)]),
+        "date": np.concatenate([np.full(n, fy_start), fy_start + rng.integers(0, 365, n // 4)]),
+        "amount": np.concatenate([rng.uniform(500000, 5000000, n), rng.uniform(10000, 2000000, n // 4)]).round(0),
+        "kind": ["regular"] * n + ["capital_gains"] * (n // 4),
+    })
+    n_payments = n * 3
+    payments = pd.DataFrame({
+        "taxpayer_id": rng.integers(0, n, n_payments),
+        "date": fy_start + rng.integers(0, 480, n_payments),
+        "amount": rng.uniform(5000, 300000, n_payments).round(0),
+    })
+    return taxpayers, incomes, payments
+
+
+if __name__ == "__main__":
+    fy = 2024
+    n = 100_000
+    taxpayers_df, incomes_df, payments_df = _synthetic_batch(n, fy)
+    start = time.perf_counter()
+    batch = compute_batch(taxpayers_df, incomes_df, payments_df, fy)
+    elapsed = time.perf_counter() - start
+    print(f"--- Advance tax batch: {n:,} taxpayers, {len(payments_df):,} payments ({tax_calendar.fy_label(fy)}) ---")
+    print(f"Computed in {elapsed:.3f}s | 234B: Rs. {batch['interest_234b'].sum():,.0f} | 234C: Rs. {batch['interest_234c'].sum():,.0f}")
+
+    ledger = AdvanceTaxLedger(fy, regime="New", tds=60000)
+    ledger.add_income(datetime.date(fy, 4, 1), 2400000)
+    ledger.add_income(datetime.date(fy, 11, 20), 800000, kind="capital_gains")
+    for due in (datetime.date(fy, 6, 10), datetime.date(fy, 9, 12)):
+        ledger.add_payment(due, 60000)
+    ledger.result()
+    start = time.perf_counter()
+    ledger.add_payment(datetime.date(fy, 12, 1), 90000)
+    after = ledger.result()
+    elapsed = time.perf_counter() - start
+    print(f"--- Incremental ledger: one payment on {fy}-12-01 ---")
+    print(f"Recomputed: {', '.join(ledger.recomputed)} in {elapsed * 1000:.2f} ms | "
+          f"234B: Rs. {after['interest_234b']:,.0f} | 234C: Rs. {after['interest_234c']:,.0f}")
+# --- END BENCHMARK ---
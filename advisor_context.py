@@ -0,0 +1,160 @@
+import datetime
+import json
+import math
+import re
+
+from tax_engine import _amount, deductions_by_section, gross_total_income
+
+# --- SETTINGS ---
+ADVISOR_MODEL = "gemini-2.5-flash"
+MIN_CACHED_TOKENS = 1024 # Smallest prefix Gemini's explicit context cache accepts (2.5 Flash)
+CACHE_TTL = datetime.timedelta(hours=1)
+ADVISOR_INSTRUCTIONS = (
+    "You are TaxBuddy's AI tax advisor for Indian income tax. The user's tax profile is below "
+    "(amounts in rupees). Answer their questions using it and the conversation so far."
+)
+# --- END SETTINGS ---
+
+
+def _money(value):
+    return f"{_amount(value):,.0f}"
+
+
+def compile_profile(extracted_data, final_calc_json):
+    """Compact, deduplicated text summary of the extracted data and the calculation for the advisor.
+
+    Nulls and zero amounts are dropped, repeated sources and sections are merged, and fields that
+    appear in both inputs (assessment year, deductions, gross income) are written once. Deductions
+    are the ones the calculation used (80D adjustments, tracker rows, what-if values); the
+    document's own claims are listed too when they differ.
+    """
+    extracted_data, calc = extracted_data or {}, dict(final_calc_json or {})
+    personal = extracted_data.get('personal_info') or {}
+    lines = []
+
+    year = personal.get('assessment_year') or calc.get('assessment_year')
+    header = [f"AY {year}" if year not in (None, "N/A") else None, personal.get('name')]
+    if any(header):
+        lines.append("Profile: " + "; ".join(h for h in header if h))
+
+    income = {}
+    for source in extracted_data.get('income_sources') or []:
+        if _amount(source.get('amount')):
+            kind = str(source.get('type') or "Other")
+            income[kind] = income.get(kind, 0.0) + _amount(source.get('amount'))
+    gross = gross_total_income(extracted_data)
+    if income:
+        lines.append("Income: " + "; ".join(f"{k} {_money(v)}" for k, v in income.items())
+                     + (f" (total {_money(gross)})" if len(income) > 1 else ""))
+
+    claimed = {k: v for k, v in deductions_by_section(extracted_data).items() if v}
+    used = calc.get('deductions_used_for_old_regime')
+    used = claimed if used is None else {k: v for k, v in deductions_by_section({'deductions_claimed': used}).items() if v}
+    if used:
+        label = "Deductions claimed" if used == claimed else "Deductions used in calculation"
+        lines.append(f"{label}: " + "; ".join(f"{k} {_money(v)}" for k, v in used.items()))
+    if claimed and used != claimed:
+        lines.append("Deductions on document: " + "; ".join(f"{k} {_money(v)}" for k, v in claimed.items()))
+
+    paid = extracted_data.get('taxes_paid') or {}
+    paid_parts = [f"{label} {_money(paid.get(key))}" for key, label in (("tds", "TDS"), ("advance_tax", "Advance tax"))
+                  if _amount(paid.get(key))]
+    if paid_parts:
+        lines.append("Taxes paid: " + "; ".join(paid_parts))
+
+    # Written above (deductions from the calculation itself), or repeated inside the calculation
+    for key in ("assessment_year", "deductions_used_for_old_regime", "total_taxes_paid"):
+        calc.pop(key, None)
+    if 'gross_total_income' in calc and _amount(calc['gross_total_income']) == gross:
+        del calc['gross_total_income']
+
+    if calc:
+        result = []
+        if calc.get('gross_total_income') is not None:
+            result.append(f"GTI {_money(calc.pop('gross_total_income'))}")
+        for regime in ("old", "new"):
+            key = f"{regime}_regime_tax_liability"
+            if calc.get(key) is not None:
+                result.append(f"{regime.title()} regime tax {_money(calc.pop(key))}")
+        if calc.get('recommended_regime'):
+            saving = calc.pop('tax_saving_with_recommendation', None)
+            result.append(f"Recommended {calc.pop('recommended_regime')}"
+                          + (f" (saves {_money(saving)})" if _amount(saving) else ""))
+        due = calc.pop('final_amount_due_under_recommendation', None)
+        status = calc.pop('status', None)
+        if status or due is not None:
+            result.append(f"{status or 'Balance'} {_money(abs(_amount(due)))}")
+        lines.append("Calculation: " + " | ".join(result))
+        others = [f"{k} {v:,.0f}" if isinstance(v, (int, float)) else f"{k} {v}"
+                  for k, v in calc.items() if v not in (None, "", [], {}) and not isinstance(v, (list, dict))]
+        if others:
+            lines.append("Other: " + "; ".join(others))
+    return "\n".join(lines)
+
+
+def estimate_tokens(text):
+    """Rough token count without calling the API: ~4 characters per token within words, 1 per symbol."""
+    return sum(math.ceil(len(tok) / 4) if tok[0].isalnum() else 1 for tok in re.findall(r"\w+|[^\w\s]", text))
+
+
+def advisor_model(genai, profile, model_name=ADVISOR_MODEL):
+    """(model, cached) for chatting about `profile`, built once per calculation and reused across turns.
+
+    The instructions and profile go into Gemini's context cache when they are long enough for it,
+    so later turns send only the history and the question. Shorter profiles (the usual case after
+    compile_profile) become the model's system instruction instead.
+    """
+    instruction = f"{ADVISOR_INSTRUCTIONS}\n\n{profile}"
+    if estimate_tokens(instruction) >= MIN_CACHED_TOKENS:
+        try:
+            cached = genai.caching.CachedContent.create(model=f"models/{model_name}", system_instruction=instruction,
+                                                        ttl=CACHE_TTL)
+            return genai.GenerativeModel.from_cached_content(cached), True
+        except Exception:
+            pass # Context caching not available for this model or key: fall back to a system instruction
+    return genai.GenerativeModel(model_name, system_instruction=instruction), False
+
+
+# --- MEASUREMENT: PROMPT TOKENS PER TURN, BEFORE vs AFTER ---
+if __name__ == "__main__":
+    extracted = {
+        "personal_info": {"name": "Asha Rao", "pan_number": "ABCDE1234F", "assessment_year": "2025-26"},
+        "income_sources": [{"type": "Salary", "amount": 1450000}, {"type": "Interest", "amount": 18000},
+                           {"type": "Salary", "amount": 120000}, {"type": "Dividend", "amount": None}],
+        "deductions_claimed": [{"section": "80C", "amount": 150000}, {"section": "80D", "amount": 25000},
+                               {"section": "80CCD(1B)", "amount": None}, {"section": "80TTA", "amount": 10000}],
+        "taxes_paid": {"tds": 165000, "advance_tax": None},
+    }
+    final_calc = {
+        "gross_total_income": 1588000, "total_taxes_paid": 165000, "old_regime_tax_liability": 214760,
+        "new_regime_tax_liability": 172640, "recommended_regime": "New", "tax_saving_with_recommendation": 42120,
+        "final_amount_due_under_recommendation": 7640, "status": "Tax Due", "assessment_year": "2025-26",
+        "deductions_used_for_old_regime": extracted["deductions_claimed"],
+    }
+    questions = ["What is my refund?", "Should I switch to the old regime?", "How much more 80C can I invest?",
+                 "Do I need to pay advance tax next year?", "What if my salary goes up by 2 lakh?", "Is my 80D capped?"]
+    answer = "Based on your profile, " + "here is a detailed answer. " * 12
+
+    # Before: raw JSON of both dicts re-sent in the prompt on every turn
+    raw_context = f"Context:\n{json.dumps(extracted)}\n{json.dumps(final_calc)}"
+    profile = compile_profile(extracted, final_calc)
+    compact_prefix = f"{ADVISOR_INSTRUCTIONS}\n\n{profile}"
+
+    print("--- Compiled profile ---")
+    print(profile)
+    print(f"\n--- Prompt tokens per turn (estimated; {len(questions)}-turn chat) ---")
+    print(f"{'turn':>4} {'before':>8} {'after':>8} {'history':>8}")
+    history, total_before, total_after = "", 0, 0
+    for turn, question in enumerate(questions, start=1):
+        history_tokens = estimate_tokens(history)
+        turn_tail = f"--- NEW USER QUESTION ---\n[USER]: {question}\n\nPlease provide a helpful, personalized response."
+        before = estimate_tokens(f"SYSTEM CONTEXT: {raw_context}\n\n--- CONVERSATION HISTORY ---\n{history}\n{turn_tail}")
+        after = estimate_tokens(f"{compact_prefix}\n--- CONVERSATION HISTORY ---\n{history}\n{turn_tail}")
+        total_before, total_after = total_before + before, total_after + after
+        print(f"{turn:>4} {before:>8} {after:>8} {history_tokens:>8}")
+        history += f"[USER]: {question}\n[ASSISTANT]: {answer}\n"
+    print(f"Context block: {estimate_tokens(raw_context)} -> {estimate_tokens(compact_prefix)} tokens per turn")
+    print(f"Whole chat: {total_before:,} -> {total_after:,} prompt tokens ({1 - total_after / total_before:.0%} fewer)")
+    print(f"Context cache: used when the prefix reaches {MIN_CACHED_TOKENS} tokens "
+          f"(this one is {estimate_tokens(compact_prefix)}), so it is sent as the system instruction here.")
+# --- END MEASUREMENT ---
@@ -0,0 +1,227 @@
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# --- SETTINGS ---
+TTL_SECONDS = 24 * 3600 # Tax answers change with the rules, so don't keep them forever
+MAX_ENTRIES = 2000
+NUM_PERM = 64 # MinHash signature length
+BANDS = 16 # LSH bands (NUM_PERM / BANDS rows each)
+SIMILARITY_THRESHOLD = 0.7 # Estimated Jaccard over shingles needed to reuse an answer
+# --- END SETTINGS ---
+
+
+# --- NORMALIZATION ---
+# Questions that mention the user's own figures or refer back to the conversation can't be shared
+_PERSONAL = re.compile(
+    r"\b(my|mine|me|our|us|we)\b"
+    r"|\bi\s+(owe|pay|paid|get|got|earn|earned|have|had|save|saved|claimed|should|need|am)\b"
+    r"|\b(should|can|could|do|did|must|shall|will|would|may|am)\s+i\b" # 'Should I opt for...', 'Can I claim...'
+    r"|\b[a-z]{5}\d{4}[a-z]\b" # A PAN
+)
+_ADDRESSED_TO_BOT = re.compile(r"\b(tell|show|explain to|give|help) me\b") # 'tell me the 80C limit' is still generic
+_FOLLOW_UP = re.compile(r"^(and|also|what about|how about|then)\b|\b(it|that|this|those|these|above|same)\b")
+_CONTRACTIONS = {"what's": "what is", "whats": "what is", "how's": "how is", "it's": "it is", "can't": "cannot",
+                 "u/s": "section"}
+_MULTIPLIERS = {"lpa": 100000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000, "l": 100000,
+                "crore": 10000000, "crores": 10000000, "cr": 10000000, "k": 1000}
+_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)\s*(" + "|".join(sorted(_MULTIPLIERS, key=len, reverse=True)) + r")\b")
+_STOPWORDS = {"a", "an", "the", "is", "are", "was", "what", "which", "of", "for", "to", "in", "on", "under",
+              "section", "sec", "please", "tell", "can", "do", "does", "i", "you", "about", "with", "and",
+              "or", "there", "any", "rs", "inr", "rupees", "per", "annum", "year", "yearly", "by", "me", "show",
+              "explain", "give", "help"}
+
+
+def _text(question):
+    text = unicodedata.normalize("NFKC", question).lower().replace("₹", " ")
+    for short, full in _CONTRACTIONS.items():
+        text = text.replace(short, full)
+    return text
+
+
+def needs_personal_context(question):
+    """True when the answer depends on the asker's data or on earlier messages, so it mustn't be shared."""
+    text = _ADDRESSED_TO_BOT.sub(" ", _text(question))
+    return bool(_PERSONAL.search(text) or _FOLLOW_UP.search(text))
+
+
+def normalize(question):
+    """Canonical form: lower case, amounts in rupees ('12 LPA' -> '1200000'), no punctuation or stopwords.
+
+    Hyphenated names stay one token, so 'ITR-U' is 'itr-u' and not 'itr' plus 'u'.
+    """
+    text = re.sub(r"(?<=\d),(?=\d)", "", _text(question))
+    text = _AMOUNT.sub(lambda m: f" {int(round(float(m.group(1)) * _MULTIPLIERS[m.group(2)]))} ", text)
+    tokens = re.findall(r"[a-z0-9()]+(?:-[a-z0-9()]+)*", text)
+    return " ".join(t for t in tokens if t not in _STOPWORDS)
+
+
+def identifiers(normalized):
+    """Tokens that name one specific thing: amounts, sections and forms ('1200000', '80c', 'itr-u', 'itr u').
+
+    Two questions that differ in any of these ask different things, however similar the rest is.
+    """
+    return frozenset(t for t in normalized.split() if len(t) == 1 or "-" in t or any(ch.isdigit() for ch in t))
+
+
+def _shingles(normalized):
+    """Words plus unordered adjacent pairs, so 'limit 80c' and '80c limit' match."""
+    tokens = normalized.split()
+    return set(tokens) | {" ".join(sorted(pair)) for pair in zip(tokens, tokens[1:])}
+# --- END NORMALIZATION ---
+
+
+# --- MINHASH ---
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(2024) # Fixed seed: signatures stay comparable across restarts
+_PERM_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+_ROWS = NUM_PERM // BANDS
+
+
+def minhash(shingles):
+    """NUM_PERM-long MinHash signature of a set of string shingles."""
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * _PERM_A + _PERM_B) % _PRIME).min(axis=0)
+
+
+def _bands(signature):
+    return [(band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes()) for band in range(BANDS)]
+# --- END MINHASH ---
+
+
+class AnswerCache:
+    """Process-wide cache of advisor answers to generic (non-personal) questions.
+
+    Lookups try the exact normalized text first, then LSH buckets over MinHash signatures
+    for near-duplicates. The question's identifiers (income levels, sections, form names) must
+    match exactly, so '12 LPA' never reuses the answer for '15 LPA', nor 'ITR' the one for
+    'ITR-U'. Entries expire after `ttl` seconds and the least recently used are evicted
+    past `max_entries`.
+    """
+
+    def __init__(self, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES, threshold=SIMILARITY_THRESHOLD):
+        self.ttl, self.max_entries, self.threshold = ttl, max_entries, threshold
+        self._entries = OrderedDict() # normalized question -> entry dict, least recently used first
+        self._buckets = {} # (band, band bytes) -> set of normalized questions
+        self._lock = threading.Lock() # Streamlit sessions run on separate threads
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "personal": 0, "llm_calls_saved": 0,
+                      "evicted": 0, "expired": 0}
+
+    @staticmethod
+    def _key(question):
+        normalized = normalize(question)
+        shingles = _shingles(normalized)
+        return normalized, shingles, identifiers(normalized)
+
+    def _drop(self, normalized):
+        entry = self._entries.pop(normalized)
+        for band in _bands(entry["signature"]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(normalized)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _live(self, normalized, now):
+        entry = self._entries.get(normalized)
+        if entry is not None and now - entry["created"] > self.ttl:
+            self._drop(normalized)
+            self.stats["expired"] += 1
+            return None
+        return entry
+
+    def get(self, question):
+        """Cached (answer, status) for a generic question, or None. Personal questions always miss."""
+        if needs_personal_context(question):
+            with self._lock:
+                self.stats["personal"] += 1
+            return None
+        normalized, shingles, names = self._key(question)
+        if not shingles:
+            return None
+        now = time.time()
+        with self._lock:
+            entry, near = self._live(normalized, now), False
+            if entry is None:
+                signature = minhash(shingles)
+                candidates = set()
+                for band in _bands(signature):
+                    candidates |= self._buckets.get(band, set())
+                best = 0.0
+                for other in candidates:
+                    candidate = self._live(other, now)
+                    if candidate is None or candidate["identifiers"] != names:
+                        continue
+                    similarity = float(np.mean(candidate["signature"] == signature))
+                    if similarity >= self.threshold and similarity > best:
+                        entry, near, best = candidate, True, similarity
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(entry["normalized"])
+            self.stats["near_hits" if near else "hits"] += 1
+            self.stats["llm_calls_saved"] += entry["llm_calls"]
+            return entry["answer"], entry["status"]
+
+    def put(self, question, answer, status, llm_calls):
+        """Stores the answer to a generic question; `llm_calls` is what a future hit will save."""
+        if needs_personal_context(question):
+            return
+        normalized, shingles, names = self._key(question)
+        if not shingles:
+            return
+        signature = minhash(shingles)
+        with self._lock:
+            if normalized in self._entries:
+                self._drop(normalized)
+            self._entries[normalized] = {
+                "normalized": normalized, "answer": answer, "status": status, "identifiers": names,
+                "signature": signature, "created": time.time(), "llm_calls": llm_calls,
+            }
+            for band in _bands(signature):
+                self._buckets.setdefault(band, set()).add(normalized)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evicted"] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --- BENCHMARK: PARAPHRASED GENERIC QUESTIONS ---
+if __name__ == "__main__":
+    import random
+
+    templates = [
+        "What is the {s} limit?", "what's the limit under section {s}", "Tell me the {s} deduction limit please",
+        "Which regime is better for {n} LPA?", "which tax regime is better for {n} lakh", "old or new regime for {n} LPA",
+        "How is HRA exemption calculated?", "how to calculate HRA exemption", "What is the due date for advance tax?",
+        "What is my refund?", "Should I pay advance tax on my bonus?", "and what about 80D?",
+    ]
+    rng = random.Random(1)
+    questions = [rng.choice(templates).format(s=rng.choice(["80C", "80D", "80CCD(1B)"]), n=rng.choice([8, 12, 15, 20]))
+                 for _ in range(5000)]
+    cache = AnswerCache()
+    calls = 0
+    start = time.perf_counter()
+    for q in questions:
+        if cache.get(q) is None:
+            calls += 2 # Relevance check + chat call
+            cache.put(q, f"answer to {normalize(q)}", "relevant", llm_calls=2)
+    elapsed = time.perf_counter() - start
+    print(f"--- Answer cache: {len(questions):,} questions, {len(cache)} cached answers ---")
+    print(f"LLM calls made: {calls:,} of {len(questions) * 2:,} | saved: {cache.stats['llm_calls_saved']:,} | "
+          f"exact hits: {cache.stats['hits']:,} | near-duplicate hits: {cache.stats['near_hits']:,} | "
+          f"personal (not cached): {cache.stats['personal']:,}")
+    print(f"Average lookup + store: {elapsed / len(questions) * 1e6:.0f} µs")
+    for a, b in [("Which regime is better for 12 LPA?", "which tax regime is better for 12 lakh"),
+                 ("Which regime is better for 12 LPA?", "Which regime is better for 15 LPA?"),
+                 ("What is the penalty for late filing of ITR?", "What is the penalty for late filing of ITR-U?")]:
+        print(f"{a!r} ~ {b!r}: {normalize(a)!r} vs {normalize(b)!r}")
+# --- END BENCHMARK ---
@@ -1,23 +1,20 @@
 import streamlit as st
-import google.generativeai as genai
 import json
 import os
 import time
-from fpdf import FPDF
 import datetime
-import pandas as pd
-
-# --- NEW IMPORTS ---
-import plotly.graph_objects as go
-from streamlit_calendar import calendar
-import plotly.express as px
 
 # --- IMPORTS FOR AUTH & DB ---
+# Heavy modules (pandas, plotly, fpdf, streamlit_calendar, google.generativeai and the
+# numpy/pandas engines) are imported inside the page or function that uses them, so the
+# login screen paints without loading them.
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
 import db_utils
-# --- END NEW IMPORTS ---
+import tax_calendar
+import job_queue
+# --- END IMPORTS ---
 
 
 # 1. Set the page title
@@ -31,17 +28,32 @@ if 'pdf_output_bytes' not in st.session_state: st.session_state.pdf_output_bytes
 if 'user_80d' not in st.session_state: st.session_state.user_80d = 0.0 # Use float
 if "messages" not in st.session_state: st.session_state.messages = []
 if 'api_model' not in st.session_state: st.session_state.api_model = "gemini-2.5-flash"
+if 'pending_jobs' not in st.session_state: st.session_state.pending_jobs = {} # kind -> job id
+if 'investment_advice' not in st.session_state: st.session_state.investment_advice = None
+if 'tradebook_result' not in st.session_state: st.session_state.tradebook_result = None
+if 'uploader_generation' not in st.session_state: st.session_state.uploader_generation = 0 # Bumped to empty the uploader
 # --- END SESSION STATE ---
 
-# --- DATABASE INITIALIZATION ---
-db_utils.create_tables()
+# --- DATABASE INITIALIZATION (once per process) ---
+@st.cache_resource
+def init_database():
+    """Runs the schema setup/migrations once per server process."""
+    db_utils.create_tables()
+    return True
+
+init_database()
 # --- END DB INIT ---
 
 
 # --- AUTHENTICATOR SETUP ---
-try:
+@st.cache_resource
+def load_auth_config():
+    """Parses .streamlit/config.yaml once per server process."""
     with open('.streamlit/config.yaml') as file:
-        config = yaml.load(file, Loader=SafeLoader)
+        return yaml.load(file, Loader=SafeLoader)
+
+try:
+    config = load_auth_config()
 except FileNotFoundError:
     st.error("FATAL ERROR: '.streamlit/config.yaml' file not found.")
     st.stop()
@@ -50,166 +62,177 @@ except Exception as e:
     st.stop()
 
 
-authenticator = stauth.Authenticate(
-    config['credentials'],
-    config['cookie']['name'],
-    config['cookie']['key'],
-    config['cookie']['expiry_days']
-)
+# Built once per session, not per process: Authenticate creates a per-browser cookie manager
+if 'authenticator' not in st.session_state:
+    st.session_state.authenticator = stauth.Authenticate(
+        config['credentials'],
+        config['cookie']['name'],
+        config['cookie']['key'],
+        config['cookie']['expiry_days']
+    )
+authenticator = st.session_state.authenticator
 
 # Render the login widget
 authenticator.login(location='main')
 # --- END AUTHENTICATOR SETUP ---
 
 
-# --- MASTER EXTRACTOR PROMPT (FIXED FORMAT) ---
-extractor_prompt = (
-    "You are \"TaxScan,\" an AI-powered data extraction specialist.\n"
-    "Your sole objective is to analyze the provided financial document (image or PDF) and extract key financial information.\n"
-    "Return the information in a strict JSON format.\n\n"
-    "**Entities to Extract:**\n"
-    "* `personal_info`: { `name`, `pan_number`, `assessment_year` }\n"
-    "* `income_sources`: [ { `type` (e.g., 'Salary', 'Interest'), `amount` } ]\n"
-    "* `deductions_claimed`: [ { `section` (e.g., '80C', '80D'), `amount` } ]\n"
-    "* `taxes_paid`: { `tds` (Tax Deducted at Source), `advance_tax` }\n\n"
-    "**Rules:**\n"
-    "1.  If a value or section is not found, use `null`.\n"
-    "2.  Do not infer or calculate. Only extract what is explicitly written.\n"
-    "3.  Your response MUST be *only* the valid JSON.\n"
-    "4.  Do not add ```json or any other markdown.\n"
-    "5.  Start your response *immediately* with { and end it *immediately* with }."
-)
-# --- END EXTRACTOR PROMPT ---
-
-
-# --- MASTER CALCULATOR PROMPT (UPDATED FOR PROFESSIONAL TAX & ROBUST PARSING) ---
-calculator_prompt = (
-    "You are \"TaxLogic,\" an expert tax calculation engine.\n"
-    "Your task is to calculate the user's final tax liability based on the provided JSON data under BOTH the Old and New tax regimes, and then recommend the best one.\n"
-    "You MUST follow a strict Chain-of-Thought process. Show every step for both calculations.\n\n"
-    "**Knowledge Base (Current Tax Rules):**\n"
-    "1.  **Standard Deduction:** Flat ₹50,000. *Applicable to BOTH Old and New regimes* for salaried employees.\n"
-    "2.  **Professional Tax:** This is provided in the JSON as `professional_tax`. It is capped at ₹2,500. *Applicable to BOTH Old and New regimes*.\n"
-    "3.  **Chapter VI-A Deductions (80C, 80D, etc.):** *Applicable ONLY to OLD REGIME*.\n"
-    "    * Section 80C: Max ₹150,000.\n"
-    "    * Section 80D: Use the value from the JSON.\n"
-    "4.  **Rebate 87A:**\n"
-    "    * **Old Regime:** If Taxable Income <= ₹5L, rebate is ₹12,500.\n"
-    "    * **New Regime (Sec 87A):** If Taxable Income <= ₹7L, rebate is ₹25,000 (making 0 tax).\n"
-    "5.  **Cess:** 4% Health and Education Cess on final tax (for both).\n\n"
-    "**Tax Slabs (Old Regime):**\n"
-    "* 0 - 2.5L: 0%\n* 2.5L - 5L: 5%\n* 5L - 10L: 20%\n* > 10L: 30%\n\n"
-    "**Tax Slabs (New Regime - Sec 115BAC):**\n"
-    "* 0 - 3L: 0%\n* 3L - 6L: 5%\n* 6L - 9L: 10%\n* 9L - 12L: 15%\n* 12L - 15L: 20%\n* > 15L: 30%\n\n"
-    "**Instructions & Output Format:**\n"
-    "1.  **Analyze Input:** Read the provided JSON. Note the `professional_tax` amount.\n"
-    "2.  **Calculate Gross Total Income:** Sum all `income_sources`.\n"
-    "3.  **--- CALCULATION (OLD REGIME) ---**\n"
-    "    a. Calculate Total Old Regime Deductions (Standard Ded. + Professional Tax (max 2.5k) + 80C(max 1.5L) + 80D + etc.).\n"
-    "    b. Calculate Old Regime Taxable Income: (Gross Total Income) - (Total Old Regime Deductions).\n"
-    "    c. Apply Old Regime Slabs, Rebate 87A, and 4% Cess.\n"
-    "    d. State the 'Final Tax (Old Regime)'.\n"
-    "4.  **--- CALCULATION (NEW REGIME) ---**\n"
-    "    a. Calculate Total New Regime Deductions (Standard Ded. + Professional Tax (max 2.5k) only).\n"
-    "    b. Calculate New Regime Taxable Income: (Gross Total Income) - (Total New Regime Deductions).\n"
-    "    c. Apply New Regime Slabs, Rebate 87A, and 4% Cess.\n"
-    "    d. State the 'Final Tax (New Regime)'.\n"
-    "5.  **--- FINAL COMPARISON ---**\n"
-    "    a. Compare 'Final Tax (Old Regime)' vs 'Final Tax (New Regime)'.\n"
-    "    b. State which regime is recommended and the total tax saving.\n"
-    "6.  **Calculate Taxes Paid:** Sum `tds` and `advance_tax`.\n"
-    "7.  **Return TWO things:**\n"
-    "    * Your entire Chain-of-Thought calculation (Steps 1-6) as clear text, using markdown headers.\n"
-    "    * A final, single JSON object summarizing the result. You MUST wrap this JSON object in unique tags: `<JSON_OUTPUT>` and `</JSON_OUTPUT>`.\n\n"
-    "**Example Response Structure (Illustrative):**\n"
-    "# Step-by-Step Calculation\n"
-    "...\n"
-    "Final Tax (New Regime): Rs.[Amount]\n"
-    "\n"
-    "<JSON_OUTPUT>\n"
-    "{\n"
-    "  \"gross_total_income\": ..., \n"
-    "  \"total_taxes_paid\": ..., \n"
-    "  \"old_regime_tax_liability\": ..., \n"
-    "  \"new_regime_tax_liability\": ..., \n"
-    "  \"recommended_regime\": \"Old\" or \"New\",\n"
-    "  \"tax_saving_with_recommendation\": ..., \n"
-    "  \"final_amount_due_under_recommendation\": ..., \n"
-    "  \"status\": \"...\" \n"
-    "}\n"
-    "</JSON_OUTPUT>"
-)
-# --- END MODIFIED CALCULATOR PROMPT ---
-
-# --- NEW: AI INVESTMENT PLANNER PROMPT ---
-investment_prompt = (
-    "You are \"FinVest AI,\" an expert financial advisor.\n"
-    "Based on the user's provided tax calculation summary, analyze their financial position (Gross Income, Tax Liability, and Savings) and provide personalized, actionable investment suggestions.\n"
-    "The user's goal is to **both save tax and grow wealth**.\n\n"
-    "**User's Data:**\n"
-    "{user_data_json}\n\n"
-    "**Instructions:**\n"
-    "1.  Acknowledge their key financial figures (Income, Recommended Tax).\n"
-    "2.  Suggest **Tax-Saving Investments** (e.g., ELSS, PPF, NPS) that they could use to maximize their 80C limit (if they chose the Old Regime or might in the future).\n"
-    "3.  Suggest **Wealth-Growth Investments** based on their apparent income bracket (e.g., Mutual Funds (Index, Flexi-cap), Stocks, Bonds).\n"
-    "4.  Provide a **sample diversified portfolio** (e.g., 60% Equity, 30% Debt, 10% Gold).\n"
-    "5.  Conclude with a clear disclaimer that you are an AI and this is not financial advice, and they should consult a human expert."
-)
-# --- END INVESTMENT PROMPT ---
-
-# --- PROFESSIONAL TAX DATA ---
-professional_tax_by_state = {
-    "Andhra Pradesh": 2400, "Assam": 2500, "Bihar": 2500, "Goa": 2500,
-    "Gujarat": 2400, "Jharkhand": 2500, "Karnataka": 2400, "Kerala": 2500,
-    "Madhya Pradesh": 2500, "Maharashtra": 2500, "Manipur": 2400, "Meghalaya": 2500,
-    "Mizoram": 2500, "Nagaland": 2500, "Odisha": 2500, "Puducherry": 2500,
-    "Punjab": 2400, "Sikkim": 2500, "Tamil Nadu": 2500, "Telangana": 2400,
-    "Tripura": 2500, "West Bengal": 2400,
-    "Other (Not Listed)": 0
-}
-# --- END P-TAX DATA ---
-
-
-# --- GEMINI API FUNCTIONS ---
-def get_gemini_response(uploaded_file, prompt):
-    try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        file_data = {'mime_type': uploaded_file.type, 'data': uploaded_file.getvalue()}
-        generation_config = genai.GenerationConfig(response_mime_type="application/json")
-        response = model.generate_content([prompt, file_data], generation_config=generation_config)
-        return json.loads(response.text)
-    except Exception as e:
-        st.error(f"AI Extractor failed: {e}")
-        return None
+# --- SESSION STORE (large values under a memory budget; session_state keeps a small handle) ---
+HOT_CHAT_MESSAGES = 12 # Latest chat messages kept in session_state; older ones move to the store
+STASHED_KEYS = ('calculation_response', 'investment_advice', 'chat_archive', 'tradebook_result') # Handles in session_state
 
-def calculate_tax(data, prompt):
-    try:
-        model = genai.GenerativeModel(st.session_state.api_model)
-        input_prompt = prompt + "\n\n**Input Data:**\n```json\n" + json.dumps(data, indent=2) + "\n```"
-        response = model.generate_content(input_prompt)
-        if response.parts:
-            return response.text
-        else:
-            st.error("AI Calculator returned an empty response.")
-            return None
-    except Exception as e:
-        if "429" in str(e) and "quota" in str(e).lower():
-            st.error(f"AI Calculator failed: Quota Exceeded (429).")
-        else:
-            st.error(f"AI Calculator failed: {e}")
+@st.cache_resource
+def get_session_store():
+    import session_store
+    return session_store.SessionStore()
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx().session_id
+
+
+def stash(key, value):
+    """Puts a large value in the session store and its handle in st.session_state[key] (None clears both)."""
+    if value is None:
+        get_session_store().discard(_session_id(), key)
+        st.session_state[key] = None
+    else:
+        st.session_state[key] = get_session_store().put(_session_id(), key, value)
+
+
+def unstash(key):
+    """The value behind st.session_state[key], read back from disk if it was spilled.
+
+    A handle whose value the store no longer has (an expired idle session) is cleared.
+    """
+    if not st.session_state.get(key):
         return None
+    value = get_session_store().get(_session_id(), key)
+    if value is None:
+        st.session_state[key] = None
+    return value
 
-# --- NEW: GEMINI FUNCTION FOR INVESTMENT ADVICE ---
-def get_investment_advice(user_data, prompt_template):
+
+def clear_expired_stashes():
+    """Keeps this session alive in the store and resets state whose stored value has expired.
+
+    Runs before any page renders, so an expired calculation shows the upload step again
+    instead of a Step 2 without its response.
+    """
+    store, session = get_session_store(), _session_id()
+    store.touch(session)
+    for key in STASHED_KEYS:
+        if st.session_state.get(key) and not store.has(session, key):
+            st.session_state[key] = None
+            if key == 'calculation_response':
+                st.session_state.final_calc_json = None
+
+
+def archive_old_messages():
+    """Moves all but the latest HOT_CHAT_MESSAGES chat messages into the store."""
+    overflow = len(st.session_state.messages) - HOT_CHAT_MESSAGES
+    if overflow > 0:
+        stash('chat_archive', (unstash('chat_archive') or []) + st.session_state.messages[:overflow])
+        st.session_state.messages = st.session_state.messages[overflow:]
+
+
+def release_upload(uploaded_file):
+    """Frees the uploader's copy of a file once it is queued; the jobs table keeps the bytes."""
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        input_prompt = prompt_template.format(user_data_json=json.dumps(user_data, indent=2))
-        response = model.generate_content(input_prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"AI Advisor failed: {e}")
-        return "Could not generate advice at this time."
-# --- END GEMINI FUNCTIONS ---
+        from streamlit.runtime import Runtime
+        Runtime.instance().uploaded_file_mgr.remove_file(_session_id(), uploaded_file.file_id)
+    except Exception:
+        pass # Streamlit frees it with the session instead
+    st.session_state.uploader_generation += 1 # Fresh, empty uploader widget
+
+clear_expired_stashes()
+# --- END SESSION STORE ---
+
+
+# --- BACKGROUND JOBS (LLM work runs in job_queue workers, not the script thread) ---
+@st.cache_resource
+def start_embedded_workers():
+    """Starts the job workers once per server process (TAXBUDDY_WORKERS=0 to run them separately)."""
+    return job_queue.start_workers(job_queue.DEFAULT_WORKERS)
+
+
+def submit_job(kind, job_id):
+    """Remembers a queued job so the poller can pick up its result."""
+    st.session_state.pending_jobs[kind] = job_id
+
+
+def apply_job_result(job):
+    """Copies a finished job's result into session state."""
+    kind = job['kind']
+    if job['status'] == 'failed':
+        label = {"extract": "AI Extractor", "reextract": "AI Extractor (re-check)", "calculate": "AI Calculator",
+                 "invest": "AI Advisor"}[kind]
+        st.error(f"{label} failed: {job['error']}")
+        if kind == "extract":
+            st.session_state.queued_filename = None # Allow re-submitting the same file
+        return
+    result = job_queue.job_result(job)
+    if kind == "extract":
+        st.session_state.extracted_data = result
+        st.session_state.uploaded_filename = job['job_key']
+        st.session_state.extract_job_id = job['id'] # The re-check reads the document stored with this job
+        st.session_state.reextracted_fields = []
+        stash('calculation_response', None)
+        st.session_state.final_calc_json = None
+        st.session_state.messages = [] # Reset chat on new upload
+        stash('chat_archive', None)
+    elif kind == "reextract":
+        if json.loads(job['payload'])['source_job'] != st.session_state.get('extract_job_id'):
+            return # A newer document was uploaded since
+        import extraction_checks
+        st.session_state.extracted_data = extraction_checks.merge_fields(st.session_state.extracted_data,
+                                                                         result['values'], result['fields'])
+        st.session_state.reextracted_fields = st.session_state.get('reextracted_fields', []) + result['fields']
+        stash('calculation_response', None)
+        st.session_state.final_calc_json = None
+    elif kind == "calculate":
+        stash('calculation_response', result)
+        st.session_state.final_calc_json = None
+        data_for_calc = json.loads(job['payload'])['data']
+        st.session_state.deductions_for_pdf = data_for_calc.get('deductions_claimed', [])
+        st.session_state.professional_tax_for_calc = data_for_calc.get('professional_tax', 0)
+    elif kind == "invest":
+        stash('investment_advice', result)
+
+
+def restore_from_jobs(username):
+    """After a browser refresh, resumes the user's latest jobs instead of losing their work."""
+    for kind in ("extract", "reextract", "calculate", "invest"):
+        job = db_utils.latest_job(username, kind)
+        if job is None:
+            continue
+        if job['status'] in ('queued', 'running'):
+            submit_job(kind, job['id'])
+        elif job['status'] == 'done':
+            apply_job_result(job)
+
+
+@st.fragment(run_every=2)
+def poll_pending_jobs():
+    """Checks pending jobs every few seconds and reruns the app when one finishes."""
+    finished = False
+    for kind, job_id in list(st.session_state.pending_jobs.items()):
+        job = db_utils.get_job(job_id)
+        if job is None:
+            del st.session_state.pending_jobs[kind]
+            continue
+        if job['status'] in ('queued', 'running'):
+            label = {"extract": "Analyzing document", "reextract": "Re-reading the fields that failed checks",
+                     "calculate": f"Calculating", "invest": "AI Advisor is analyzing your profile"}[kind]
+            st.info(f"⏳ {label}... ({job['status']})")
+            continue
+        del st.session_state.pending_jobs[kind]
+        apply_job_result(job)
+        finished = True
+    if finished:
+        st.rerun(scope="app")
+# --- END BACKGROUND JOBS ---
 
 
 # --- PDF HELPER FUNCTIONS ---
@@ -225,6 +248,7 @@ def format_currency(val, default='Rs. 0.00'):
         return default
 
 def create_pdf_report(extracted_data, calc_summary):
+    from fpdf import FPDF
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Arial", size=11)
@@ -307,8 +331,41 @@ def create_pdf_report(extracted_data, calc_summary):
 
 
 # --- CHATBOT FUNCTION ---
+@st.cache_resource
+def get_gemini():
+    """Imports and configures the Gemini SDK on first use (the chat is the only in-process LLM caller)."""
+    import google.generativeai as genai
+    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    return genai
+
+@st.cache_resource
+def get_answer_cache():
+    """One answer cache per process, shared by every session (it only holds non-personal answers)."""
+    import answer_cache
+    return answer_cache.AnswerCache()
+
+IRRELEVANT_ANSWER = "I am an AI Tax Advisor and can only answer questions related to your income, deductions, and tax planning. Please ask a tax-related question."
+GENERIC_CONTEXT = "General questions about Indian income tax for individuals. The user's own figures are not available."
+
+def get_advisor_model(profile):
+    """This session's advisor model for `profile`; rebuilt only when the calculation changes."""
+    import advisor_context
+    current = st.session_state.get('advisor_model')
+    if current is None or current[0] != profile:
+        model, cached = advisor_context.advisor_model(get_gemini(), profile)
+        st.session_state.advisor_model = (profile, model, cached)
+    return st.session_state.advisor_model[1]
+
 def check_relevance_and_get_answer(user_prompt, conversation_history, system_context):
+    import answer_cache
+    cache = get_answer_cache()
+    cached = cache.get(user_prompt)
+    if cached is not None:
+        return cached
+    # Generic questions are answered without the user's data, so the answer can be shared
+    personal = answer_cache.needs_personal_context(user_prompt)
     try:
+        genai = get_gemini()
         relevance_model = genai.GenerativeModel("gemini-2.5-flash")
         check_prompt = (
             "Analyze the following user question. Determine if it is related to personal finance, taxation, deductions, income, or tax filing. "
@@ -319,21 +376,38 @@ def check_relevance_and_get_answer(user_prompt, conversation_history, system_con
         relevance_check = relevance_response.text.strip().upper()
 
         if "TAX" not in relevance_check:
-            return "I am an AI Tax Advisor and can only answer questions related to your income, deductions, and tax planning. Please ask a tax-related question.", "irrelevant"
-
-        chat_model = genai.GenerativeModel("gemini-2.5-flash")
-        history_string = "--- CONVERSATION HISTORY ---\n"
-        for msg in conversation_history:
-            if msg["role"] != "system":
-                history_string += f"[{msg['role'].upper()}]: {msg['content']}\n"
-        full_prompt = (
-            f"SYSTEM CONTEXT: {system_context}\n\n"
-            f"{history_string}\n"
-            f"--- NEW USER QUESTION ---\n"
-            f"[USER]: {user_prompt}\n\n"
-            f"Please provide a helpful, personalized response based ONLY on the context and history provided above."
-        )
+            if not personal:
+                cache.put(user_prompt, IRRELEVANT_ANSWER, "irrelevant", llm_calls=1)
+            return IRRELEVANT_ANSWER, "irrelevant"
+
+        if personal:
+            # The compiled profile lives in the model (system instruction or cached prefix), not in every prompt
+            chat_model = get_advisor_model(system_context)
+            history_string = "--- CONVERSATION HISTORY ---\n"
+            for msg in conversation_history:
+                if msg["role"] != "system":
+                    history_string += f"[{msg['role'].upper()}]: {msg['content']}\n"
+            full_prompt = (
+                f"{history_string}\n"
+                f"--- NEW USER QUESTION ---\n"
+                f"[USER]: {user_prompt}\n\n"
+                f"Please provide a helpful, personalized response based ONLY on the context and history provided above."
+            )
+        else:
+            chat_model = genai.GenerativeModel("gemini-2.5-flash")
+            full_prompt = (
+                f"SYSTEM CONTEXT: {GENERIC_CONTEXT}\n\n"
+                f"--- USER QUESTION ---\n"
+                f"[USER]: {user_prompt}\n\n"
+                f"Please provide a helpful, general answer. Do not assume or mention any personal details."
+            )
         response = chat_model.generate_content(full_prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            st.session_state.advisor_usage = {"prompt": usage.prompt_token_count,
+                                              "cached": getattr(usage, "cached_content_token_count", 0) or 0}
+        if not personal:
+            cache.put(user_prompt, response.text, "relevant", llm_calls=2)
         return response.text, "relevant"
 
     except Exception as e:
@@ -342,55 +416,82 @@ def check_relevance_and_get_answer(user_prompt, conversation_history, system_con
 # --- END CHATBOT FUNCTION ---
 
 
-# --- NEW: HRA HELPER FUNCTION ---
-def calculate_hra_exemption(basic_salary, da, hra_received, rent_paid, city_type):
-    """Calculates HRA exemption."""
-    salary_for_hra = basic_salary + da
-    rent_paid_over_salary = rent_paid - (0.10 * salary_for_hra)
-
-    if city_type == "Metro":
-        city_allowance = 0.50 * salary_for_hra
-    else:
-        city_allowance = 0.40 * salary_for_hra
-
-    exemption = max(0, min(hra_received, rent_paid_over_salary, city_allowance))
-    return exemption
-# --- END HRA FUNCTION ---
-
-
 # --- NEW: PLOTLY HELPER FUNCTION ---
-def create_plotly_charts(calc_json, income_sources):
+def create_plotly_charts(calc_json, income_sources, key_prefix="dashboard"):
     """Generates Plotly charts for regime comparison and income breakdown."""
+    import charts # Figures are cached by their input data, across reruns and sessions
 
     # 1. Regime Comparison Chart
-    regime_data = {
-        'Regime': ['Old Regime', 'New Regime'],
-        'Tax Liability': [
-            calc_json.get('old_regime_tax_liability', 0),
-            calc_json.get('new_regime_tax_liability', 0)
-        ]
-    }
-    df_regime = pd.DataFrame(regime_data)
-
-    fig_regime = px.bar(df_regime, x='Regime', y='Tax Liability',
-                        title="Tax Liability Comparison",
-                        color='Regime', text='Tax Liability',
-                        color_discrete_map={'Old Regime': '#0068C9', 'New Regime': '#83C9FF'})
-    fig_regime.update_traces(texttemplate='Rs. %{text:,.0f}', textposition='outside')
-    st.plotly_chart(fig_regime, use_container_width=True)
+    fig_regime = charts.regime_comparison_figure(calc_json)
+    st.plotly_chart(fig_regime, use_container_width=True, key=f"{key_prefix}_regime_chart")
 
     # 2. Income Breakdown Chart
     if income_sources:
-        df_income = pd.DataFrame(income_sources)
-        fig_income = px.pie(df_income, values='amount', names='type',
-                            title="Income Sources Breakdown",
-                            hole=0.3)
-        fig_income.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_income, use_container_width=True)
+        fig_income = charts.income_breakdown_figure(income_sources)
+        st.plotly_chart(fig_income, use_container_width=True, key=f"{key_prefix}_income_chart")
 
 # --- END PLOTLY FUNCTION ---
 
 
+# --- NEW: WHAT-IF PANEL (reruns only this fragment on slider changes) ---
+WHATIF_SECTIONS = {"80C": 150000, "80D": 100000, "80E": 500000, "80G": 200000, "80TTA": 10000, "80CCD(1B)": 50000}
+
+@st.fragment
+def render_whatif_panel(extracted_data, prof_tax_amount, username):
+    """Local what-if sliders; the LLM is only called when the user commits."""
+    import tax_engine
+    calc_key = (st.session_state.get('uploaded_filename'), prof_tax_amount,
+                (extracted_data.get('personal_info') or {}).get('assessment_year')) # Picks the rule pack
+    if st.session_state.get('whatif_key') != calc_key:
+        st.session_state.whatif_calc = tax_engine.WhatIfCalculator(extracted_data, professional_tax=prof_tax_amount,
+                                                                   sec_80d_cap=WHATIF_SECTIONS["80D"])
+        st.session_state.whatif_key = calc_key
+    calc = st.session_state.whatif_calc
+    claimed = tax_engine.deductions_by_section(extracted_data)
+
+    s_col, r_col = st.columns([1, 2])
+    with s_col:
+        deductions = {}
+        for section, max_value in WHATIF_SECTIONS.items():
+            start = min(float(claimed.get(section, 0.0)), float(max_value))
+            deductions[section] = st.slider(f"Sec {section}", 0.0, float(max_value), start, step=1000.0,
+                                            key=f"whatif_{section}")
+        extra_income = st.slider("Extra Income", 0.0, 2000000.0, 0.0, step=5000.0, key="whatif_extra_income")
+        rent_paid = st.slider("Rent Paid (Annual)", 0.0, 1200000.0, 0.0, step=5000.0, key="whatif_rent")
+        if rent_paid > 0:
+            basic_salary = st.number_input("Basic + DA (Annual)", min_value=0.0, step=1000.0, key="whatif_basic")
+            hra_received = st.number_input("HRA Received (Annual)", min_value=0.0, step=1000.0, key="whatif_hra")
+            city_type = st.selectbox("City Type", ["Metro", "Non-Metro"], key="whatif_city")
+        else:
+            basic_salary, hra_received, city_type = 0.0, 0.0, "Metro"
+
+    start_time = time.perf_counter()
+    whatif_json = calc.update(deductions, extra_income=extra_income, rent_paid=rent_paid,
+                              basic_salary=basic_salary, hra_received=hra_received, city_type=city_type)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    with r_col:
+        create_plotly_charts(whatif_json, None, key_prefix="whatif")
+        w1, w2 = st.columns(2)
+        w1.metric("Best Regime", whatif_json["recommended_regime"])
+        w2.metric("Saving vs Other Regime", format_currency(whatif_json["tax_saving_with_recommendation"]))
+        st.caption(f"Recomputed locally in {elapsed_ms:.1f} ms (updated: {', '.join(calc.recomputed) or 'nothing'}).")
+
+        if st.button("✅ Commit & Explain with AI", key="whatif_commit"):
+            data_for_calc = json.loads(json.dumps(extracted_data))
+            if extra_income > 0:
+                data_for_calc.setdefault("income_sources", []).append({"type": "Other (What-If)", "amount": extra_income})
+            data_for_calc["deductions_claimed"] = [{"section": sec, "amount": amt} for sec, amt in deductions.items() if amt > 0]
+            if whatif_json["hra_exemption"] > 0:
+                data_for_calc["deductions_claimed"].append({"section": "10(13A) HRA", "amount": whatif_json["hra_exemption"]})
+            data_for_calc["professional_tax"] = prof_tax_amount
+
+            submit_job("calculate", job_queue.submit_calculation(username, data_for_calc, st.session_state.api_model,
+                                                                 job_key=st.session_state.get('uploaded_filename')))
+            st.rerun(scope="app")
+# --- END WHAT-IF PANEL ---
+
+
 # --- APPLICATION LOGIC (GATED BY LOGIN) ---
 name = st.session_state.get('name')
 authentication_status = st.session_state.get('authentication_status')
@@ -398,16 +499,24 @@ username = st.session_state.get('username')
 
 if authentication_status:
 
-    # --- CONFIGURE THE GEMINI API ---
+    # --- CHECK THE GEMINI API KEY (the SDK itself is configured lazily, see get_gemini) ---
     try:
         if "GOOGLE_API_KEY" not in st.secrets:
             raise Exception("API key not found.")
-        genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+        os.environ.setdefault("GOOGLE_API_KEY", st.secrets["GOOGLE_API_KEY"]) # Inherited by job workers
     except Exception as e:
         st.error("FATAL ERROR: Your 'secrets.toml' file is missing or the API key is wrong.")
         st.stop()
     # --- END API CONFIG ---
 
+    # --- BACKGROUND JOBS: START WORKERS & RESUME AFTER RECONNECT ---
+    if job_queue.DEFAULT_WORKERS > 0:
+        start_embedded_workers()
+    if not st.session_state.get('jobs_restored'):
+        restore_from_jobs(username)
+        st.session_state.jobs_restored = True
+    # --- END BACKGROUND JOBS ---
+
     # --- AUTHENTICATED APP UI ---
 
     # --- SIDEBAR ---
@@ -418,11 +527,13 @@ if authentication_status:
         st.sidebar.markdown("---")
         st.sidebar.header("⚙️ Global Settings")
 
+        import rule_packs
+        tax_rules = rule_packs.pack_for(st.session_state.extracted_data) # The document's assessment year
         selected_state = st.sidebar.selectbox(
             "Select Your State (for Professional Tax):",
-            options=list(professional_tax_by_state.keys())
+            options=list(tax_rules.professional_tax_by_state.keys())
         )
-        prof_tax_amount = professional_tax_by_state.get(selected_state, 0)
+        prof_tax_amount = tax_rules.professional_tax_by_state.get(selected_state, 0)
         st.sidebar.info(f"Professional Tax set to: **Rs. {prof_tax_amount:,.0f}**")
 
         st.sidebar.markdown("---")
@@ -431,43 +542,62 @@ if authentication_status:
             options=["gemini-2.5-flash", "gemini-2.5-pro"],
             index=0, key="model_selector"
         )
+
+        with st.sidebar.expander("🧵 Job Queue"):
+            metrics = job_queue.queue_metrics()
+            st.write(f"Queued: **{metrics['queued']}** | Running: **{metrics['running']}**")
+            if metrics['p50_latency_s'] is not None:
+                st.write(f"Latency p50/p95: **{metrics['p50_latency_s']:.1f}s / {metrics['p95_latency_s']:.1f}s**")
+                st.write(f"Queue wait p50: **{metrics['p50_wait_s']:.1f}s** (last {metrics['sample_size']} jobs)")
     # --- END SIDEBAR ---
 
     st.image("codex.png", width=200)
     st.title("AI TaxBuddy Pro 🤖")
     st.caption("Your complete tax planning and calculation dashboard.")
 
-    # --- NEW: TABBED INTERFACE ---
-    tab_dashboard, tab_deductions, tab_hra, tab_cap_gains, tab_invest, tab_calendar, tab_profile, tab_saved = st.tabs([
+    # --- NEW: PAGE NAVIGATION (only the selected page runs, so its imports load on demand) ---
+    PAGES = [
         "📊 Dashboard", "💸 Deduction Tracker", "🏠 HRA Calculator", "📈 Capital Gains",
         "💡 Investment Planner", "🗓️ Tax Calendar", "👤 My Profile", "🗂️ Saved Reports"
-    ])
+    ]
+    tab_dashboard, tab_deductions, tab_hra, tab_cap_gains, tab_invest, tab_calendar, tab_profile, tab_saved = PAGES
+    active_page = st.radio("Navigation", PAGES, horizontal=True, label_visibility="collapsed", key="active_page")
+    poll_pending_jobs() # Picks up background job results whichever page is open
 
     # --- TAB 1: DASHBOARD (Main Calculator) ---
-    with tab_dashboard:
+    if active_page == tab_dashboard:
         st.header("Tax Regime Comparison Dashboard")
 
         uploaded_file = st.file_uploader(
             "Upload your Form 16, etc. (PDF or JPG) to start",
             type=["pdf", "jpg", "png"],
-            key="main_uploader"
+            key=f"main_uploader_{st.session_state.uploader_generation}"
         )
 
+        if not uploaded_file and st.session_state.get('uploaded_filename'):
+            st.caption(f"📄 Working on **{st.session_state.uploaded_filename}**. Upload another file to replace it.")
+
         if uploaded_file:
-            if st.session_state.extracted_data is None or \
-               st.session_state.get('uploaded_filename') != uploaded_file.name:
-                with st.spinner('Analyzing document...'):
-                    st.session_state.extracted_data = get_gemini_response(uploaded_file, extractor_prompt)
-                    st.session_state.uploaded_filename = uploaded_file.name
-                    st.session_state.calculation_response = None
-                    st.session_state.final_calc_json = None
-                    st.session_state.messages = [] # Reset chat on new upload
+            if (st.session_state.extracted_data is None or \
+               st.session_state.get('uploaded_filename') != uploaded_file.name) and \
+               st.session_state.get('queued_filename') != uploaded_file.name:
+                submit_job("extract", job_queue.submit_extraction(username, uploaded_file.name, uploaded_file.type, uploaded_file.getvalue()))
+                st.session_state.queued_filename = uploaded_file.name
+                release_upload(uploaded_file)
+                st.rerun()
 
         if st.session_state.extracted_data:
+            import tax_engine
             st.subheader("Step 1: Verify Extracted Data")
             col1, col2 = st.columns([1, 2])
             with col1:
                 st.info("Verification")
+                document_year = rule_packs.normalize_assessment_year(
+                    (st.session_state.extracted_data.get('personal_info') or {}).get('assessment_year'))
+                if document_year == tax_rules.assessment_year:
+                    st.caption(f"Tax rules: AY {tax_rules.assessment_year}")
+                else:
+                    st.warning(f"No tax rules for AY {document_year or 'unknown'}; using AY {tax_rules.assessment_year}.")
                 deduction_summary = db_utils.get_deductions_summary(username)
                 st.session_state.user_80d = 0.0 # Use float
                 for item in deduction_summary:
@@ -484,51 +614,112 @@ if authentication_status:
                 st.caption(f"Tip: Add detailed deductions in the 'Deduction Tracker' tab.")
 
                 if st.button("Calculate Tax Liability", type="primary", key="calc_button"):
-                    with st.spinner(f"Calculating... using {st.session_state.api_model}."):
-                        data_for_calc = st.session_state.extracted_data.copy()
-
-                        all_deductions_list = data_for_calc.get("deductions_claimed", [])[:]
-
-                        # Add/Update 80D
-                        found_80d = False
-                        for d in all_deductions_list:
-                            if d.get("section") == "80D":
-                                d["amount"] = st.session_state.user_80d; found_80d = True; break
-                        if not found_80d and st.session_state.user_80d > 0:
-                            all_deductions_list.append({"section": "80D", "amount": st.session_state.user_80d})
-
-                        # Add Professional Tax
-                        data_for_calc["professional_tax"] = prof_tax_amount
-
-                        # Get other deductions from DB
-                        for item in deduction_summary:
-                            if item['section'] != '80D':
-                                found_sec = False
-                                for d_item in all_deductions_list:
-                                    if d_item.get("section") == item['section']:
-                                        # Aggregate amounts if section already exists
-                                        d_item["amount"] = d_item.get("amount", 0) + item['total_amount']
-                                        found_sec = True
-                                        break
-                                if not found_sec:
-                                    all_deductions_list.append({"section": item['section'], "amount": item['total_amount']})
-
-                        data_for_calc["deductions_claimed"] = all_deductions_list
-                        st.session_state.deductions_for_pdf = all_deductions_list
-
-                        response_text = calculate_tax(data_for_calc, calculator_prompt)
-                        st.session_state.calculation_response = response_text
-                        st.session_state.final_calc_json = None
+                    data_for_calc = st.session_state.extracted_data.copy()
+
+                    all_deductions_list = data_for_calc.get("deductions_claimed", [])[:]
+
+                    # Add/Update 80D
+                    found_80d = False
+                    for d in all_deductions_list:
+                        if d.get("section") == "80D":
+                            d["amount"] = st.session_state.user_80d; found_80d = True; break
+                    if not found_80d and st.session_state.user_80d > 0:
+                        all_deductions_list.append({"section": "80D", "amount": st.session_state.user_80d})
+
+                    # Add Professional Tax
+                    data_for_calc["professional_tax"] = prof_tax_amount
+
+                    # Get other deductions from DB
+                    for item in deduction_summary:
+                        if item['section'] != '80D':
+                            found_sec = False
+                            for d_item in all_deductions_list:
+                                if d_item.get("section") == item['section']:
+                                    # Aggregate amounts if section already exists
+                                    d_item["amount"] = d_item.get("amount", 0) + item['total_amount']
+                                    found_sec = True
+                                    break
+                            if not found_sec:
+                                all_deductions_list.append({"section": item['section'], "amount": item['total_amount']})
+
+                    data_for_calc["deductions_claimed"] = all_deductions_list
+                    st.session_state.deductions_for_pdf = all_deductions_list
+
+                    submit_job("calculate", job_queue.submit_calculation(username, data_for_calc, st.session_state.api_model,
+                                                                         job_key=st.session_state.get('uploaded_filename')))
+                    st.rerun()
 
             with col2:
+                import extraction_checks
+                issues = extraction_checks.validate_extraction(st.session_state.extracted_data)
+                if issues:
+                    st.warning("⚠️ Some extracted fields failed validation:\n"
+                               + "\n".join(f"- **{i['field']}**: {i['problem']}" for i in issues))
+                    retried = set(st.session_state.get('reextracted_fields', []))
+                    failing = {i['field'] for i in issues}
+                    if failing <= retried:
+                        st.caption("These fields were already re-read from the document; please correct them by hand.")
+                    elif st.button("🔁 Re-extract only these fields", key="reextract_button",
+                                   disabled="reextract" in st.session_state.pending_jobs
+                                   or not st.session_state.get('extract_job_id')):
+                        submit_job("reextract", job_queue.submit_reextraction(
+                            username, st.session_state.extract_job_id, [i for i in issues if i['field'] not in retried],
+                            job_key=st.session_state.get('uploaded_filename')))
+                        st.rerun()
                 st.json(st.session_state.extracted_data)
+
+            # --- NEW: DEDUCTION OPTIMIZER (local, no LLM call) ---
+            with st.expander("🔍 Deduction Optimizer: find the cheapest plan"):
+                st.caption("Searches extra 80C, 80D and NPS (80CCD(1B)) investments across both regimes using your extracted income.")
+                opt_c1, opt_c2, opt_c3 = st.columns(3)
+                with opt_c1:
+                    opt_80d_cap = st.selectbox("80D Limit", [25000, 50000, 75000, 100000], key="opt_80d_cap",
+                                               help="25k (self), 50k (self + senior parents), etc.")
+                with opt_c2:
+                    opt_basic = st.number_input("Basic + DA (Annual, for HRA)", min_value=0.0, step=1000.0, key="opt_basic")
+                    opt_hra = st.number_input("HRA Received (Annual)", min_value=0.0, step=1000.0, key="opt_hra")
+                with opt_c3:
+                    opt_rent = st.number_input("Rent Paid (Annual)", min_value=0.0, step=1000.0, key="opt_rent")
+                    opt_city = st.selectbox("City Type", ["Metro", "Non-Metro"], key="opt_city")
+
+                hra_inputs = None
+                if opt_rent > 0 and opt_hra > 0:
+                    hra_inputs = {"basic_salary": opt_basic, "da": 0.0, "hra_received": opt_hra,
+                                  "rent_paid": opt_rent, "city_type": opt_city}
+
+                plan = tax_engine.optimize_deductions(
+                    st.session_state.extracted_data, professional_tax=prof_tax_amount,
+                    hra=hra_inputs, sec_80d_cap=opt_80d_cap
+                )
+
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Best Regime", plan["recommended_regime"])
+                m2.metric("Lowest Tax", format_currency(plan["tax_liability"]))
+                m3.metric("Extra Investment Needed", format_currency(plan["additional_investment"]))
+
+                if plan["recommended_regime"] == "Old":
+                    for section, amount in plan["allocation"].items():
+                        if amount > 0:
+                            st.markdown(f"* Invest **{format_currency(amount)}** more under **Sec {section}**")
+                    if plan["hra_exemption"] > 0:
+                        st.markdown(f"* HRA exemption applied: **{format_currency(plan['hra_exemption'])}**")
+
+                break_even = plan["break_even_old_regime_deductions"]
+                if break_even is None:
+                    st.info("The Old Regime cannot beat the New Regime at this income, whatever the deductions.")
+                else:
+                    st.info(f"Break-even: the Old Regime wins once your total deductions (beyond Standard Deduction and Professional Tax) reach **{format_currency(break_even)}**.")
+            # --- END OPTIMIZER ---
+
+            with st.expander("🎚️ What-If Analysis (instant, local)"):
+                render_whatif_panel(st.session_state.extracted_data, prof_tax_amount, username)
             st.markdown("---")
 
         if st.session_state.calculation_response:
             st.subheader("Step 2: Tax Calculation & Comparison")
 
             try:
-                response_text = st.session_state.calculation_response
+                response_text = unstash('calculation_response') or ""
                 json_block_start = response_text.find('<JSON_OUTPUT>')
                 json_block_end = response_text.find('</JSON_OUTPUT>')
 
@@ -538,15 +729,18 @@ if authentication_status:
                     final_json_obj = json.loads(final_json_str)
                     final_json_obj["assessment_year"] = st.session_state.extracted_data.get('personal_info', {}).get('assessment_year', 'N/A')
                     final_json_obj["deductions_used_for_old_regime"] = st.session_state.get('deductions_for_pdf', [])
+                    # Kept so saved reports can be recomputed under their own year's rules (rule_packs.py --recompute)
+                    final_json_obj["professional_tax"] = st.session_state.get('professional_tax_for_calc', 0)
+                    final_json_obj["rules_assessment_year"] = tax_rules.assessment_year
                     st.session_state.final_calc_json = final_json_obj
                 else:
                      st.error("Could not find the JSON block in the AI's calculation response.")
                      with st.expander("AI Response (Debug View)"):
-                         st.text(st.session_state.calculation_response[:1000] + "...")
+                         st.text(response_text[:1000] + "...")
             except Exception as e:
                 st.error(f"Could not parse final JSON summary: {e}")
                 with st.expander("AI Response (Debug View)"):
-                     st.text(st.session_state.calculation_response[:1000] + "...")
+                     st.text((unstash('calculation_response') or "")[:1000] + "...")
 
             if st.session_state.final_calc_json:
                 st.success("Calculation complete! See the recommendation below.")
@@ -567,7 +761,7 @@ if authentication_status:
 
                 st.markdown("---")
                 st.subheader("Step 3: Save & Download")
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4 = st.columns(4)
                 with col1:
                     if st.button("💾 Save Calculation to Profile", key="save_calc"):
                         try:
@@ -587,12 +781,34 @@ if authentication_status:
                         label="Download Calculation JSON", data=json_string,
                         file_name="TaxBuddy_Calculation.json", mime="application/json"
                     )
+                with col4:
+                    # FormGen: local field mapping + schema check, no model call
+                    import formgen
+                    itr_json, itr_errors = formgen.generate_itr1(
+                        st.session_state.extracted_data, st.session_state.final_calc_json, professional_tax=prof_tax_amount
+                    )
+                    st.download_button(
+                        label="Download ITR-1 Draft JSON", data=json.dumps(itr_json, indent=2),
+                        file_name="TaxBuddy_ITR1_draft.json", mime="application/json", disabled=bool(itr_errors),
+                        help="A draft, not a return ready to file: add your address, date of birth and verification in the e-filing utility."
+                    )
+                if itr_errors:
+                    st.warning("ITR-1 draft has invalid fields. Fix these (e.g. PAN, Assessment Year) in the extracted data:")
+                    st.markdown("\n".join(f"- `{err}`" for err in itr_errors))
+                for note in formgen.compare_with_summary(itr_json, st.session_state.final_calc_json):
+                    st.info(f"ITR-1 vs calculation: {note}")
 
                 st.markdown("---")
 
                 # --- CHATBOT FIX (Layout) ---
                 st.subheader("Step 4: Ask Your AI Tax Advisor 🤖")
-                system_prompt_content = (f"Context:\n{json.dumps(st.session_state.extracted_data)}\n{json.dumps(st.session_state.final_calc_json)}")
+                # Compact profile, compiled once per calculation and reused on every turn
+                profile_key = (st.session_state.get('uploaded_filename'), st.session_state.calculation_response) # Handle, not the text
+                if st.session_state.get('advisor_profile', (None, None))[0] != profile_key:
+                    import advisor_context
+                    st.session_state.advisor_profile = (profile_key, advisor_context.compile_profile(
+                        st.session_state.extracted_data, st.session_state.final_calc_json))
+                system_prompt_content = st.session_state.advisor_profile[1]
 
                 if "messages" not in st.session_state or not st.session_state.messages:
                     st.session_state.messages = [{"role": "assistant", "content": "Hello! I've analyzed your tax profile. How can I help?"}]
@@ -602,6 +818,10 @@ if authentication_status:
 
                 # Display all chat messages from history inside the container
                 with chat_container:
+                    if st.session_state.get('chat_archive') and st.toggle("Show earlier messages", key="show_chat_archive"):
+                        for message in unstash('chat_archive'):
+                            with st.chat_message(message["role"]):
+                                st.markdown(message["content"])
                     for message in st.session_state.messages:
                         with st.chat_message(message["role"]):
                             st.markdown(message["content"])
@@ -615,15 +835,26 @@ if authentication_status:
                             st.markdown(prompt)
 
                     with st.spinner("Thinking..."):
-                        response_text, _ = check_relevance_and_get_answer(prompt, st.session_state.messages, system_prompt_content)
+                        history = (unstash('chat_archive') or []) + st.session_state.messages
+                        response_text, _ = check_relevance_and_get_answer(prompt, history, system_prompt_content)
 
                     st.session_state.messages.append({"role": "assistant", "content": response_text})
+                    archive_old_messages()
                     st.rerun()
+
+                cache_stats = get_answer_cache().stats
+                st.caption(f"Answer cache: {cache_stats['hits'] + cache_stats['near_hits']} reused answers, "
+                           f"{cache_stats['llm_calls_saved']} LLM calls saved")
+                if st.session_state.get('advisor_usage'):
+                    st.caption(f"Last advisor turn: {st.session_state.advisor_usage['prompt']:,} prompt tokens "
+                               f"({st.session_state.advisor_usage['cached']:,} from the context cache)")
                 # --- END CHATBOT FIX ---
 
 
     # --- TAB 2: DEDUCTION TRACKER ---
-    with tab_deductions:
+    if active_page == tab_deductions:
+        import charts
+        import deduction_import
         st.header("💸 Deduction Tracker")
         st.info("Track all your tax-saving expenses here. This data will be automatically used by the **Dashboard** calculator.")
 
@@ -651,20 +882,33 @@ if authentication_status:
                             st.error(f"Failed to add deduction: {e}")
                     # --- END VALIDATION FIX ---
 
+            # --- NEW: BULK IMPORT FROM STATEMENTS ---
+            st.subheader("📥 Import from Statement")
+            if 'import_message' in st.session_state:
+                st.success(st.session_state.pop('import_message'))
+            with st.form("deduction_import_form", clear_on_submit=True):
+                statement_file = st.file_uploader("Bank / insurer statement (CSV or XLSX)", type=["csv", "xlsx"])
+                import_submitted = st.form_submit_button("Import Deductions")
+                if import_submitted and statement_file:
+                    try:
+                        ready_rows, skipped_rows = deduction_import.prepare_import(statement_file, statement_file.name)
+                        inserted, duplicates = deduction_import.import_deductions(username, ready_rows)
+                        st.session_state.import_message = (
+                            f"Imported {inserted} deduction(s). Skipped {duplicates} duplicate(s) "
+                            f"and {len(skipped_rows)} row(s) that matched no section."
+                        )
+                        st.rerun() # One rerun for the whole file
+                    except ValueError as e:
+                        st.error(f"Could not import statement: {e}")
+            # --- END BULK IMPORT ---
+
         with c2:
             st.subheader("Your Deduction Summary")
             summary_data = db_utils.get_deductions_summary(username)
             if not summary_data:
                 st.warning("No deductions added yet.")
             else:
-                df_summary = pd.DataFrame(summary_data, columns=['section', 'total_amount'])
-
-                fig = px.bar(df_summary, x='section', y='total_amount',
-                             title="Your Total Claimed Deductions by Section",
-                             labels={'section': 'Deduction Section', 'total_amount': 'Total Amount (Rs.)'},
-                             text='total_amount')
-                fig.update_traces(texttemplate='Rs. %{text:,.0f}', textposition='outside')
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(charts.deduction_summary_figure(summary_data), use_container_width=True)
 
             # --- DELETION FIX ---
             with st.expander("View & Delete All Deduction Entries"):
@@ -705,7 +949,9 @@ if authentication_status:
             # --- END DELETION FIX ---
 
     # --- TAB 3: HRA CALCULATOR ---
-    with tab_hra:
+    if active_page == tab_hra:
+        import hra_engine
+        from tax_engine import calculate_hra_exemption
         st.header("🏠 House Rent Allowance (HRA) Exemption Calculator")
         with st.form("hra_form"):
             st.info("Fill in your salary components to calculate your HRA exemption (for Old Regime).")
@@ -727,8 +973,69 @@ if authentication_status:
                 st.markdown(f"2. Rent Paid minus 10% of Salary: **{format_currency(max(0, hra_rent - 0.10 * (hra_basic + hra_da)))}**")
                 st.markdown(f"3. 50% (Metro) or 40% (Non-Metro) of Salary: **{format_currency(0.5 * (hra_basic + hra_da) if city == 'Metro' else 0.4 * (hra_basic + hra_da))}**")
 
+        # --- NEW: MONTH-BY-MONTH & BULK HRA ---
+        st.divider()
+        st.subheader("Month-by-Month HRA")
+        st.caption("Edit each month separately if your rent, salary or city changed during the year. Leave rent at 0 for months you did not rent.")
+        if 'hra_schedule' not in st.session_state:
+            st.session_state.hra_schedule = hra_engine.schedule_from_annual(0.0, 0.0, 0.0, 0.0, "Metro").drop(columns=["employee_id"])
+        edited_schedule = st.data_editor(
+            st.session_state.hra_schedule, hide_index=True, key="hra_schedule_editor",
+            column_config={
+                "month": st.column_config.TextColumn("Month", disabled=True),
+                "city_type": st.column_config.SelectboxColumn("City Type", options=["Metro", "Non-Metro"]),
+            }
+        )
+        monthly_hra, annual_hra = hra_engine.compute_hra_schedule(edited_schedule.assign(employee_id=username))
+        st.success(f"Annual HRA exemption (month-wise): **{format_currency(annual_hra['exemption'].iloc[0])}**")
+        with st.expander("Monthly Breakdown"):
+            st.dataframe(monthly_hra.drop(columns=["employee_id", "month_index"]), hide_index=True)
+
+        st.subheader("Bulk HRA (Employers)")
+        bulk_hra_file = st.file_uploader(
+            f"Upload a CSV with columns: {', '.join(hra_engine.REQUIRED_COLUMNS)} (optional: da)",
+            type=["csv"], key="hra_bulk_uploader"
+        )
+        if bulk_hra_file:
+            try:
+                bulk_monthly, bulk_annual = hra_engine.load_hra_schedule_csv(bulk_hra_file)
+                st.dataframe(bulk_annual, hide_index=True)
+                st.download_button("Download Monthly Breakdown (CSV)", data=bulk_monthly.to_csv(index=False),
+                                   file_name="hra_monthly_breakdown.csv", mime="text/csv")
+            except ValueError as e:
+                st.error(f"Could not process HRA file: {e}")
+        # --- END MONTH-BY-MONTH HRA ---
+
+        # --- PAYROLL TDS (Employers) ---
+        st.subheader("Monthly TDS (Employers)")
+        import payroll
+        payroll_fy_col, payroll_month_col = st.columns(2)
+        current_fy = tax_calendar.financial_year_of(datetime.date.today())
+        payroll_fy = payroll_fy_col.selectbox("Financial Year", options=list(range(current_fy - 2, current_fy + 2)), index=2,
+                                              format_func=tax_calendar.fy_label, key="payroll_fy")
+        payroll_month = payroll_month_col.selectbox("Payroll month", hra_engine.FY_MONTHS, key="payroll_month")
+        payroll_file = st.file_uploader(
+            f"Upload a CSV with columns: {', '.join(payroll.REQUIRED_COLUMNS)} "
+            f"(optional: {', '.join(payroll.OPTIONAL_COLUMNS)}). Year-to-date figures are up to the previous month.",
+            type=["csv"], key="payroll_uploader"
+        )
+        if payroll_file:
+            try:
+                tds_run = payroll.load_payroll_csv(payroll_file, payroll_month, payroll_fy)
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Employees", f"{len(tds_run):,}")
+                c2.metric(f"TDS for {payroll_month}", format_currency(tds_run['monthly_tds'].sum()))
+                c3.metric("Over-deducted", f"{int((tds_run['excess_tds'] > 0).sum()):,}")
+                st.dataframe(tds_run, hide_index=True)
+                st.download_button("Download TDS Run (CSV)", data=tds_run.to_csv(index=False),
+                                   file_name=f"tds_{payroll_month.lower()}.csv", mime="text/csv")
+            except ValueError as e:
+                st.error(f"Could not process payroll file: {e}")
+        # --- END PAYROLL TDS ---
+
     # --- TAB 4: CAPITAL GAINS (Simple) ---
-    with tab_cap_gains:
+    if active_page == tab_cap_gains:
+        import capital_gains
         st.header("📈 Capital Gains Calculator (Simple)")
         st.warning("Note: This is a simplified calculator. For detailed indexation, please consult a professional.")
         with st.form("cap_gains_form"):
@@ -746,30 +1053,66 @@ if authentication_status:
                 else:
                     st.error(f"Your calculated **{gain_type} Capital Loss** is: **{format_currency(gains)}**")
 
+        # --- NEW: BROKER TRADEBOOK (FIFO, streamed) ---
+        st.divider()
+        st.subheader("Broker Tradebook (FIFO Lot Matching)")
+        st.caption(f"Upload a tradebook CSV in trade-date order with columns: {', '.join(capital_gains.TRADEBOOK_COLUMNS)} "
+                   f"(optional: asset_type, one of {', '.join(capital_gains.ASSET_RULES)}).")
+        tradebook_file = st.file_uploader("Upload Tradebook CSV", type=["csv"], key="tradebook_uploader")
+        if tradebook_file:
+            try:
+                cached = unstash('tradebook_result') # (file_id, result): matched once per upload, not per rerun
+                if cached and cached[0] == tradebook_file.file_id:
+                    cg_lots, cg_summary, cg_matcher = cached[1]
+                else:
+                    with st.spinner("Matching lots..."):
+                        cg_lots, cg_summary, cg_matcher = capital_gains.process_tradebook(tradebook_file)
+                    stash('tradebook_result', (tradebook_file.file_id, (cg_lots, cg_summary, cg_matcher)))
+                st.dataframe(cg_summary, hide_index=True)
+                if cg_matcher.unmatched_sells:
+                    st.warning(f"{len(cg_matcher.unmatched_sells)} sell(s) had no matching buy lots (missing history?).")
+                if cg_lots is not None:
+                    st.download_button("Download Per-Lot Gains (CSV)", data=cg_lots.to_csv(index=False),
+                                       file_name="capital_gains_lots.csv", mime="text/csv")
+            except ValueError as e:
+                st.error(f"Could not process tradebook: {e}")
+        # --- END TRADEBOOK ---
+
     # --- TAB 5: AI INVESTMENT PLANNER ---
-    with tab_invest:
+    if active_page == tab_invest:
         st.header("💡 AI-Powered Investment Planner")
         st.info("Get personalized investment suggestions based on your latest tax calculation.")
 
         if st.button("Generate My Investment Plan", type="primary"):
             if st.session_state.final_calc_json:
-                with st.spinner("AI Advisor is analyzing your profile and market data..."):
-                    data_summary = {
-                        "Gross Total Income": st.session_state.final_calc_json.get("gross_total_income"),
-                        "Recommended Regime": st.session_state.final_calc_json.get("recommended_regime"),
-                        "Final Tax Liability": st.session_state.final_calc_json.get(f"{st.session_state.final_calc_json.get('recommended_regime', 'new').lower()}_regime_tax_liability"),
-                        "Total Tax Savings": st.session_state.final_calc_json.get("tax_saving_with_recommendation"),
-                        "Deductions Claimed": [dict(row) for row in db_utils.get_deductions_summary(username)]
-                    }
-                    advice = get_investment_advice(data_summary, investment_prompt)
-                    st.markdown(advice)
+                data_summary = {
+                    "Gross Total Income": st.session_state.final_calc_json.get("gross_total_income"),
+                    "Recommended Regime": st.session_state.final_calc_json.get("recommended_regime"),
+                    "Final Tax Liability": st.session_state.final_calc_json.get(f"{st.session_state.final_calc_json.get('recommended_regime', 'new').lower()}_regime_tax_liability"),
+                    "Total Tax Savings": st.session_state.final_calc_json.get("tax_saving_with_recommendation"),
+                    "Deductions Claimed": [dict(row) for row in db_utils.get_deductions_summary(username)]
+                }
+                submit_job("invest", job_queue.submit_investment_advice(username, data_summary))
+                st.rerun()
             else:
                 st.warning("Please run a calculation on the 'Dashboard' tab first to generate a plan.")
 
-    # --- TAB 6: TAX CALENDAR (UPDATED) ---
-    with tab_calendar:
+        if "invest" in st.session_state.pending_jobs:
+            st.info("⏳ AI Advisor is analyzing your profile and market data...")
+        elif st.session_state.investment_advice:
+            st.markdown(unstash('investment_advice'))
+
+    # --- TAB 6: TAX CALENDAR (RULE-DRIVEN, WINDOWED) ---
+    if active_page == tab_calendar:
+        from streamlit_calendar import calendar
         st.header("🗓️ Tax Calendar & Deadlines")
 
+        # Visible date range of the calendar widget (updated from its datesSet callback)
+        if 'calendar_window' not in st.session_state:
+            st.session_state.calendar_window = tax_calendar.default_window(datetime.date.today())
+        window_start, window_end = st.session_state.calendar_window
+        one_off_events, recurring_events = db_utils.load_user_events_in_window(username, window_start, window_end)
+
         col1, col2 = st.columns(2)
 
         with col1:
@@ -777,28 +1120,32 @@ if authentication_status:
             with st.form("add_event_form", clear_on_submit=True):
                 event_title = st.text_input("Event Description")
                 event_date = st.date_input("Event Date", datetime.date.today())
+                event_repeat = st.selectbox("Repeats", ["Does not repeat", "Monthly (e.g. SIP)", "Quarterly (e.g. Advance Tax)", "Yearly"])
+                event_until = st.date_input("Repeat Until (optional)", value=None)
                 submit_event = st.form_submit_button("Add Event")
 
                 if submit_event:
                     if not event_title: # Validate title
                         st.error("Event Description cannot be empty.")
                     else:
+                        recurrence = None if event_repeat == "Does not repeat" else event_repeat.split()[0].lower()
                         try:
-                            db_utils.add_user_event(username, event_title, event_date)
+                            db_utils.add_user_event(username, event_title, event_date, recurrence,
+                                                    event_until if recurrence else None)
                             st.success(f"Added event '{event_title}' on {event_date}")
                             st.rerun() # Refresh to update lists
                         except Exception as e:
                             st.error(f"Failed to add event: {e}")
 
             st.divider()
-            st.subheader("Your Custom Events")
-            user_events = db_utils.load_user_events(username)
-            if not user_events:
-                st.info("You haven't added any custom events yet.")
+            st.subheader("Your Custom Events (Visible Range)")
+            if not one_off_events and not recurring_events:
+                st.info("No custom events in the visible range.")
             else:
-                for event in user_events:
+                for event in list(recurring_events) + list(one_off_events):
                     ev_col1, ev_col2 = st.columns([4, 1])
-                    ev_col1.markdown(f"* **{event['start_date']}:** {event['title']}")
+                    repeat_note = f" (🔁 {event['recurrence']})" if event['recurrence'] else ""
+                    ev_col1.markdown(f"* **{event['start_date']}:** {event['title']}{repeat_note}")
                     # Delete button for each user event
                     if ev_col2.button("Delete", key=f"del_event_{event['id']}"):
                         try:
@@ -810,42 +1157,90 @@ if authentication_status:
 
 
         with col2:
-            st.subheader("Important Tax Deadlines (FY 2024-25 / AY 2025-26)")
-            # Using a dictionary for easier management
-            static_deadlines = {
-                "2025-07-31": "ITR filing deadline for individuals (non-audit).",
-                "2025-06-15": "First installment of Advance Tax.",
-                "2025-09-15": "Second installment of Advance Tax.",
-                "2025-12-15": "Third installment of Advance Tax.",
-                "2026-03-15": "Fourth (and final) installment of Advance Tax.",
-                "2026-03-31": "Deadline for tax-saving investments (ELSS, PPF, etc.) for the financial year."
-            }
-            # Display sorted by date
-            for date, desc in sorted(static_deadlines.items()):
-                st.markdown(f"* **{date}:** {desc}")
+            current_fy = tax_calendar.financial_year_of(datetime.date.today())
+            deadline_fy = st.selectbox(
+                "Financial Year", options=list(range(current_fy - 2, current_fy + 3)), index=2,
+                format_func=tax_calendar.fy_label, key="deadline_fy"
+            )
+            st.subheader(f"Important Tax Deadlines ({tax_calendar.fy_label(deadline_fy)})")
+            for deadline in tax_calendar.statutory_deadlines(deadline_fy):
+                st.markdown(f"* **{deadline['start']}:** {deadline['description']}")
 
         st.divider()
 
-        # --- COMBINE STATIC AND USER EVENTS FOR THE CALENDAR WIDGET ---
+        # --- ADVANCE TAX: INSTALLMENTS, SHORTFALLS, 234B / 234C ---
+        import advance_tax
+        import rule_packs
+        from tax_engine import gross_total_income, taxes_paid
+        with st.expander(f"💰 Advance Tax Planner ({tax_calendar.fy_label(deadline_fy)})"):
+            extracted = st.session_state.extracted_data or {}
+            default_regime = (st.session_state.final_calc_json or {}).get('recommended_regime', 'New')
+            at_col1, at_col2, at_col3, at_col4 = st.columns(4)
+            at_regime = at_col1.selectbox("Regime", ["New", "Old"], index=0 if default_regime != "Old" else 1, key="at_regime")
+            at_income = at_col2.number_input("Expected Annual Income", min_value=0.0, step=10000.0,
+                                             value=float(gross_total_income(extracted)), key="at_income")
+            at_rules = rule_packs.pack_for_financial_year(deadline_fy)
+            at_deductions = at_col3.number_input("Deductions", min_value=0.0, step=5000.0,
+                                                 value=at_rules.standard_deduction[at_regime],
+                                                 key=f"at_deductions_{deadline_fy}_{at_regime}") # Year's standard deduction
+            at_tds = at_col4.number_input("TDS", min_value=0.0, step=1000.0, value=float(taxes_paid(extracted)), key="at_tds")
+
+            # Keep one ledger per profile; payments and extra income are added to it incrementally
+            ledger_key = (username, deadline_fy, at_regime, at_income, at_deductions, at_tds)
+            previous = st.session_state.get('advance_tax_ledger')
+            if previous is None or previous[0] != ledger_key:
+                ledger = advance_tax.AdvanceTaxLedger(deadline_fy, regime=at_regime, deductions=at_deductions, tds=at_tds)
+                ledger.add_income(datetime.date(deadline_fy, 4, 1), at_income)
+                if previous is not None and previous[0][:2] == ledger_key[:2]:
+                    for income in previous[1].incomes[1:]:
+                        ledger.add_income(*income)
+                    for payment in previous[1].payments:
+                        ledger.add_payment(*payment)
+                st.session_state.advance_tax_ledger = (ledger_key, ledger)
+            ledger = st.session_state.advance_tax_ledger[1]
+
+            form_col1, form_col2 = st.columns(2)
+            with form_col1.form("at_payment_form", clear_on_submit=True):
+                pay_date = st.date_input("Payment Date", datetime.date.today(), key="at_pay_date")
+                pay_amount = st.number_input("Amount Paid", min_value=0.0, step=1000.0, key="at_pay_amount")
+                if st.form_submit_button("Record Payment") and pay_amount > 0:
+                    try:
+                        ledger.add_payment(pay_date, pay_amount)
+                    except ValueError as e:
+                        st.error(str(e))
+            with form_col2.form("at_income_form", clear_on_submit=True):
+                extra_date = st.date_input("Income Date", datetime.date.today(), key="at_income_date")
+                extra_amount = st.number_input("Amount", min_value=0.0, step=1000.0, key="at_extra_amount")
+                extra_kind = st.selectbox("Kind", ["capital_gains", "dividend", "winnings", "regular"], key="at_income_kind")
+                if st.form_submit_button("Add One-Off Income") and extra_amount > 0:
+                    try:
+                        ledger.add_income(extra_date, extra_amount, extra_kind)
+                    except ValueError as e:
+                        st.error(str(e))
+
+            at_result = ledger.result()
+            if not at_result['liable']:
+                st.info(f"Net tax of {format_currency(at_result['assessed_tax'])} is below Rs. "
+                        f"{advance_tax.ADVANCE_TAX_THRESHOLD:,}, so no advance tax is due.")
+            else:
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Net Tax (after TDS)", format_currency(at_result['assessed_tax']))
+                m2.metric("Interest u/s 234C", format_currency(at_result['interest_234c']))
+                m3.metric(f"Interest u/s 234B (to {at_result['as_of']})", format_currency(at_result['interest_234b']))
+                st.dataframe([
+                    {"Installment": i['title'], "Due": i['due_date'], "Cumulative Due": i['required'],
+                     "Paid by Due Date": i['paid'], "Shortfall": i['shortfall'], "234C Interest": i['interest_234c']}
+                    for i in at_result['installments']
+                ], hide_index=True)
+            if ledger.payments:
+                st.caption("Payments: " + ", ".join(f"{d} (Rs. {a:,.0f})" for d, a in ledger.payments))
+        # --- END ADVANCE TAX ---
+
+        # --- CALENDAR WIDGET: ONLY THE VISIBLE WINDOW IS MATERIALIZED ---
         st.subheader("Full Calendar View")
 
-        # Static events for the calendar widget
-        calendar_events = [
-            {"title": "ITR Filing Deadline", "start": "2025-07-31", "color": "#FF0000"}, # Red
-            {"title": "Advance Tax (1st)", "start": "2025-06-15", "color": "#0000FF"}, # Blue
-            {"title": "Advance Tax (2nd)", "start": "2025-09-15", "color": "#0000FF"},
-            {"title": "Advance Tax (3rd)", "start": "2025-12-15", "color": "#0000FF"},
-            {"title": "Advance Tax (4th)", "start": "2026-03-15", "color": "#0000FF"},
-            {"title": "Tax Saving Deadline", "start": "2026-03-31", "color": "#FFA500"}, # Orange
-        ]
-
-        # Add user events to the calendar widget list
-        for event in user_events:
-            calendar_events.append({
-                "title": event['title'],
-                "start": str(event['start_date']), # Ensure it's a string
-                "color": "#008000" # Green for user events
-            })
+        calendar_events = tax_calendar.window_events(one_off_events, recurring_events, window_start, window_end,
+                                                     personal_deadlines=advance_tax.installment_events(at_result))
 
         calendar_options = {
             "headerToolbar": {
@@ -854,15 +1249,26 @@ if authentication_status:
                 "right": "dayGridMonth,timeGridWeek,timeGridDay,listWeek",
             },
             "initialView": "dayGridMonth",
+            "initialDate": (window_start + (window_end - window_start) / 2).isoformat(),
             "selectable": True, # Allows clicking on dates
         }
 
         # Render the calendar
-        calendar(events=calendar_events, options=calendar_options, key="tax_calendar_widget")
+        calendar_state = calendar(events=calendar_events, options=calendar_options,
+                                  callbacks=["datesSet"], key="tax_calendar_widget")
+
+        # Navigating to another range: load that window and redraw
+        dates_set = (calendar_state or {}).get("datesSet")
+        if dates_set:
+            new_window = (datetime.date.fromisoformat(dates_set["start"][:10]),
+                          datetime.date.fromisoformat(dates_set["end"][:10]))
+            if new_window != st.session_state.calendar_window:
+                st.session_state.calendar_window = new_window
+                st.rerun()
         # --- END CALENDAR UPDATES ---
 
     # --- TAB 7: MY PROFILE (Save/Load) ---
-    with tab_profile:
+    if active_page == tab_profile:
         st.header("👤 My Profile & Data")
         st.info("Export or import your user profile data.")
 
@@ -894,9 +1300,32 @@ if authentication_status:
 
 
     # --- TAB 8: SAVED REPORTS ---
-    with tab_saved:
+    if active_page == tab_saved:
+        import pandas as pd
+        import plotly.express as px
         st.header("🗂️ Your Saved Calculation Reports")
 
+        # --- NEW: YEAR-OVER-YEAR TRENDS (served from rollups, no JSON decoding) ---
+        yearly_trends = db_utils.load_yearly_trends(username)
+        if yearly_trends:
+            st.subheader("📉 Year-over-Year Trends")
+            df_trends = pd.DataFrame([dict(row) for row in yearly_trends])
+            fig_trends = px.line(
+                df_trends, x='assessment_year',
+                y=['gross_income', 'old_regime_tax', 'new_regime_tax', 'tax_saving', 'final_amount_due'],
+                markers=True, title="Income, Tax & Savings by Assessment Year",
+                labels={'assessment_year': 'Assessment Year', 'value': 'Amount (Rs.)', 'variable': 'Metric'}
+            )
+            st.plotly_chart(fig_trends, use_container_width=True, key="yoy_trends_chart")
+            st.dataframe(
+                df_trends[['assessment_year', 'report_count', 'gross_income', 'old_regime_tax', 'new_regime_tax',
+                           'recommended_regime', 'tax_saving', 'final_amount_due']],
+                hide_index=True
+            )
+            st.caption("Each year shows your most recently saved report. Negative 'final_amount_due' is a refund.")
+            st.divider()
+        # --- END TRENDS ---
+
         saved_calculations = db_utils.load_calculations(username)
 
         if not saved_calculations:
@@ -0,0 +1,196 @@
+import collections
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- ASSET-TYPE RULES (keys match cg_type in the Capital Gains tab) ---
+# long_term_after_days: holding period above which a lot is long term
+# ltcg_exemption: annual LTCG exemption (Sec 112A for listed equity)
+ASSET_RULES = {
+    "Equity (Stocks/Mutual Funds)": {"long_term_after_days": 365, "stcg_rate": 0.20, "ltcg_rate": 0.125, "ltcg_exemption": 125000},
+    "Real Estate": {"long_term_after_days": 730, "stcg_rate": None, "ltcg_rate": 0.125, "ltcg_exemption": 0},
+    "Other": {"long_term_after_days": 730, "stcg_rate": None, "ltcg_rate": 0.125, "ltcg_exemption": 0},
+}
+DEFAULT_ASSET_TYPE = "Equity (Stocks/Mutual Funds)"
+
+TRADEBOOK_COLUMNS = ["isin", "trade_date", "side", "quantity", "price"]
+TRADE_SIDES = {"B": "BUY", "BUY": "BUY", "BOUGHT": "BUY", "S": "SELL", "SELL": "SELL", "SOLD": "SELL"}
+_EPOCH = datetime.date(1970, 1, 1)
+# --- END ASSET RULES ---
+
+
+# --- STREAMING FIFO LOT MATCHER ---
+class FifoLotMatcher:
+    """Matches sells against open buy lots per ISIN in FIFO order.
+
+    Only open lots are held in memory, so memory is bounded by open positions, not file size.
+    """
+
+    def __init__(self):
+        self.open_lots = collections.defaultdict(collections.deque) # isin -> deque([day, qty, unit_cost])
+        self.asset_types = {}
+        self.unmatched_sells = []
+
+    def _sell(self, isin, asset_type, day, qty, unit_price, realised):
+        long_term_after = ASSET_RULES.get(asset_type, ASSET_RULES["Other"])["long_term_after_days"]
+        lots = self.open_lots[isin]
+        while qty > 1e-9 and lots:
+            lot = lots[0]
+            matched = min(qty, lot[1])
+            holding_days = day - lot[0]
+            realised.append((
+                isin, asset_type, lot[0], day, holding_days, matched, lot[2] * matched, unit_price * matched,
+                "LTCG" if holding_days > long_term_after else "STCG",
+            ))
+            lot[1] -= matched
+            qty -= matched
+            if lot[1] <= 1e-9:
+                lots.popleft()
+        if qty > 1e-9:
+            self.unmatched_sells.append((isin, _EPOCH + datetime.timedelta(days=day), qty))
+
+    def process_chunk(self, chunk):
+        """Consumes one chronologically sorted chunk and returns the lots it realised as a DataFrame."""
+        realised = []
+        if "asset_type" in chunk.columns:
+            self.asset_types.update(zip(chunk["isin"].tolist(), chunk["asset_type"].tolist()))
+        # Dates as integer day numbers keep the per-trade loop free of datetime objects
+        days = chunk["trade_date"].to_numpy().astype("datetime64[D]").astype(np.int64).tolist()
+        for isin, day, is_buy, qty, price in zip(
+                chunk["isin"].tolist(), days, (chunk["side"] == "BUY").tolist(),
+                chunk["quantity"].astype(float).tolist(), chunk["price"].astype(float).tolist()):
+            if is_buy:
+                self.open_lots[isin].append([day, qty, price])
+            else:
+                self._sell(isin, self.asset_types.get(isin, DEFAULT_ASSET_TYPE), day, qty, price, realised)
+        lots = pd.DataFrame(realised, columns=[
+            "isin", "asset_type", "buy_date", "sell_date", "holding_days", "quantity",
+            "cost_of_acquisition", "sale_consideration", "gain_type",
+        ])
+        for col in ("buy_date", "sell_date"):
+            lots[col] = lots[col].to_numpy(dtype=np.int64).astype("datetime64[D]")
+        return lots
+# --- END LOT MATCHER ---
+
+
+def _normalise_chunk(chunk):
+    missing = [c for c in TRADEBOOK_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Tradebook is missing columns: {', '.join(missing)}")
+    chunk = chunk.copy()
+    side = chunk["side"].fillna("").astype(str).str.strip()
+    chunk["side"] = side.str.upper().map(TRADE_SIDES)
+    bad = chunk["side"].isna()
+    if bad.any():
+        # Corporate actions (bonus, split) and unknown codes would otherwise be matched as sells
+        rows = ", ".join(f"{i + 2} ({side[i]!r})" for i in chunk.index[bad][:5]) # +2: header line, 1-based
+        more = f" and {bad.sum() - 5} more" if bad.sum() > 5 else ""
+        raise ValueError(f"Unrecognised side in row(s) {rows}{more}; expected BUY or SELL")
+    chunk["trade_date"] = pd.to_datetime(chunk["trade_date"])
+    # Same-day buys before sells, so intraday round trips match
+    return chunk.sort_values(["trade_date", "side"], kind="stable")
+
+
+def process_tradebook(path_or_buffer, chunksize=200_000, lot_sink=None):
+    """Streams a broker tradebook CSV through FIFO matching and aggregates STCG/LTCG.
+
+    The file must be in trade-date order (as brokers export it). The last day of each chunk is
+    held back and matched with the next chunk, so a day's buys always come before its sells.
+    Realised lots are passed chunk by chunk to `lot_sink` (e.g. a CSV writer) when given,
+    otherwise collected and returned. Returns (lots DataFrame or None, summary DataFrame, matcher).
+    Raises ValueError for missing columns or unrecognised sides.
+    """
+    matcher = FifoLotMatcher()
+    collected = []
+    totals = collections.defaultdict(lambda: [0.0, 0.0, 0.0]) # (asset_type, gain_type) -> cost, sale, gain
+
+    def trading_days():
+        carry = None
+        for chunk in pd.read_csv(path_or_buffer, chunksize=chunksize, dtype={"isin": str}):
+            chunk = _normalise_chunk(chunk)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk]).sort_values(["trade_date", "side"], kind="stable")
+            last_day = chunk["trade_date"].eq(chunk["trade_date"].iloc[-1])
+            carry = chunk[last_day]
+            yield chunk[~last_day]
+        if carry is not None:
+            yield carry
+
+    for chunk in trading_days():
+        lots = matcher.process_chunk(chunk)
+        if lots.empty:
+            continue
+        lots["gain"] = lots["sale_consideration"] - lots["cost_of_acquisition"]
+        grouped = lots.groupby(["asset_type", "gain_type"])[["cost_of_acquisition", "sale_consideration", "gain"]].sum()
+        for key, row in grouped.iterrows():
+            acc = totals[key]
+            acc[0] += row["cost_of_acquisition"]; acc[1] += row["sale_consideration"]; acc[2] += row["gain"]
+        if lot_sink is not None:
+            lot_sink(lots)
+        else:
+            collected.append(lots)
+
+    summary = summarise_gains(totals)
+    lots_df = pd.concat(collected, ignore_index=True) if collected else None
+    return lots_df, summary, matcher
+
+
+def summarise_gains(totals):
+    """Builds the STCG/LTCG summary, applying the LTCG exemption per asset type."""
+    rows = []
+    for (asset_type, gain_type), (cost, sale, gain) in sorted(totals.items()):
+        rule = ASSET_RULES.get(asset_type, ASSET_RULES["Other"])
+        exemption = min(max(gain, 0), rule["ltcg_exemption"]) if gain_type == "LTCG" else 0.0
+        rate = rule["ltcg_rate"] if gain_type == "LTCG" else rule["stcg_rate"]
+        rows.append({
+            "asset_type": asset_type, "gain_type": gain_type,
+            "cost_of_acquisition": cost, "sale_consideration": sale, "gain": gain,
+            "exemption": exemption, "taxable_gain": gain - exemption,
+            # None -> taxed at slab rates along with other income
+            "tax_rate": rate,
+        })
+    return pd.DataFrame(rows, columns=[
+        "asset_type", "gain_type", "cost_of_acquisition", "sale_consideration",
+        "gain", "exemption", "taxable_gain", "tax_rate",
+    ])
+
+
+# --- BENCHMARK (synthetic 1M-trade tradebook) ---
+def write_synthetic_tradebook(path, n_trades=1_000_000, n_isins=2_000, seed=11):
+    """Writes a chronologically ordered tradebook where every sell is covered by earlier buys."""
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2021, 4, 1)
+    days = np.sort(rng.integers(0, 365 * 4, n_trades))
+    isins = np.array([f"INE{i:06d}01" for i in range(n_isins)])[rng.integers(0, n_isins, n_trades)]
+    qty = rng.integers(1, 100, n_trades)
+    price = rng.uniform(50, 5000, n_trades).round(2)
+    # Roughly 60% buys; sells are clipped to the running position per ISIN
+    side = np.where(rng.random(n_trades) < 0.6, "BUY", "SELL")
+    df = pd.DataFrame({"isin": isins, "trade_date": pd.to_datetime(start) + pd.to_timedelta(days, unit="D"),
+                       "side": side, "quantity": qty, "price": price})
+    signed = np.where(df["side"] == "BUY", df["quantity"], -df["quantity"])
+    position = pd.Series(signed).groupby(df["isin"]).cumsum()
+    df.loc[position < 0, "side"] = "BUY" # Never short
+    df.to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    import resource
+
+    with tempfile.TemporaryDirectory() as tmp:
+        book = os.path.join(tmp, "tradebook.csv")
+        print("--- Writing synthetic 1M-trade tradebook ---")
+        write_synthetic_tradebook(book)
+        lot_count = [0]
+        start_time = time.perf_counter()
+        _, summary_df, lot_matcher = process_tradebook(book, lot_sink=lambda lots: lot_count.__setitem__(0, lot_count[0] + len(lots)))
+        elapsed = time.perf_counter() - start_time
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on Linux
+        print(f"Processed 1,000,000 trades in {elapsed:.2f}s ({1_000_000 / elapsed:,.0f} trades/s)")
+        print(f"Realised lots: {lot_count[0]:,} | Peak RSS: {peak_rss_mb:.1f} MB")
+        print(summary_df.to_string(index=False))
+# --- END BENCHMARK ---
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+from tax_engine import _amount
+
+# --- SETTINGS ---
+MAX_CACHED_FIGURES = 256 # Process-wide; What-If sliders produce a new figure per position
+REGIME_COLORS = {'Old Regime': '#0068C9', 'New Regime': '#83C9FF'}
+DEFAULT_BAR_COLOR = '#636efa' # First colour of Plotly's default colorway
+# --- END SETTINGS ---
+
+_figures = OrderedDict() # digest -> go.Figure, least recently used first
+_lock = threading.Lock() # Streamlit sessions run on separate threads
+stats = {"hits": 0, "misses": 0}
+
+
+def _digest(kind, data):
+    return hashlib.sha1(json.dumps([kind, data], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _lean(spec):
+    """go.Figure for a plain spec, keeping only the template entries for the trace types it draws.
+
+    Plotly's default template carries defaults for every trace type (~4 KB of the ~7 KB a bar chart
+    sends); plotly.js only applies those of the traces present, so the chart looks the same.
+    """
+    fig = go.Figure(spec)
+    used = {trace.type for trace in fig.data}
+    template = fig.layout.template.to_plotly_json()
+    template['data'] = {kind: traces for kind, traces in template.get('data', {}).items() if kind in used}
+    fig.layout.template = template
+    return fig
+
+
+def cached_figure(kind, data, build):
+    """Figure for `data`, built by build(data) once per distinct input and shared across reruns and sessions.
+
+    Callers must not modify the returned figure.
+    """
+    key = _digest(kind, data)
+    with _lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            stats["hits"] += 1
+            return fig
+    fig = _lean(build(data))
+    with _lock:
+        stats["misses"] += 1
+        _figures[key] = fig
+        while len(_figures) > MAX_CACHED_FIGURES:
+            _figures.popitem(last=False)
+    return fig
+
+
+# --- CHART SPECS (plain dicts: no DataFrame for a handful of rows) ---
+# Numbers go in as float arrays, as px sends them: a plain list in `text` would become strings
+# and lose the 'Rs. %{text:,.0f}' formatting.
+def _numbers(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+def _bar_axes(x_title, y_title):
+    return {"xaxis": {"anchor": "y", "domain": [0.0, 1.0], "title": {"text": x_title}},
+            "yaxis": {"anchor": "x", "domain": [0.0, 1.0], "title": {"text": y_title}}}
+
+
+def _regime_spec(data):
+    traces = [{"type": "bar", "name": regime, "legendgroup": regime, "x": [regime], "y": _numbers([tax]), "text": _numbers([tax]),
+               "marker": {"color": REGIME_COLORS[regime], "pattern": {"shape": ""}}, "orientation": "v",
+               "xaxis": "x", "yaxis": "y", "showlegend": True, "textposition": "outside", "texttemplate": "Rs. %{text:,.0f}",
+               "hovertemplate": "Regime=%{x}<br>Tax Liability=%{text}<extra></extra>"}
+              for regime, tax in data]
+    layout = _bar_axes("Regime", "Tax Liability")
+    layout["xaxis"].update(categoryorder="array", categoryarray=[regime for regime, _ in data])
+    layout.update(legend={"title": {"text": "Regime"}, "tracegroupgap": 0},
+                  title={"text": "Tax Liability Comparison"}, barmode="relative")
+    return {"data": traces, "layout": layout}
+
+
+def _income_spec(data):
+    return {"data": [{"type": "pie", "labels": [t for t, _ in data], "values": _numbers(a for _, a in data), "hole": 0.3,
+                      "domain": {"x": [0.0, 1.0], "y": [0.0, 1.0]}, "name": "", "legendgroup": "", "showlegend": True,
+                      "textposition": "inside", "textinfo": "percent+label",
+                      "hovertemplate": "type=%{label}<br>amount=%{value}<extra></extra>"}],
+            "layout": {"legend": {"tracegroupgap": 0}, "title": {"text": "Income Sources Breakdown"}}}
+
+
+def _deduction_spec(data):
+    amounts = _numbers(a for _, a in data)
+    layout = _bar_axes("Deduction Section", "Total Amount (Rs.)")
+    layout.update(legend={"tracegroupgap": 0}, title={"text": "Your Total Claimed Deductions by Section"},
+                  barmode="relative")
+    return {"data": [{"type": "bar", "x": [s for s, _ in data], "y": amounts, "text": amounts,
+                      "marker": {"color": DEFAULT_BAR_COLOR, "pattern": {"shape": ""}}, "name": "", "legendgroup": "",
+                      "orientation": "v", "xaxis": "x", "yaxis": "y", "showlegend": False, "textposition": "outside",
+                      "texttemplate": "Rs. %{text:,.0f}",
+                      "hovertemplate": "Deduction Section=%{x}<br>Total Amount (Rs.)=%{text}<extra></extra>"}],
+            "layout": layout}
+# --- END CHART SPECS ---
+
+
+def regime_comparison_figure(calc_json):
+    """Old vs New regime tax bar chart."""
+    data = [("Old Regime", calc_json.get('old_regime_tax_liability', 0)),
+            ("New Regime", calc_json.get('new_regime_tax_liability', 0))]
+    return cached_figure("regime", data, _regime_spec)
+
+
+def income_breakdown_figure(income_sources):
+    """Donut of income by source type."""
+    data = [(s.get('type'), s.get('amount')) for s in income_sources]
+    return cached_figure("income", data, _income_spec)
+
+
+def deduction_summary_figure(summary_rows):
+    """Bar chart of (section, total_amount) rows from db_utils.get_deductions_summary."""
+    data = [(row['section'], _amount(row['total_amount'])) for row in summary_rows]
+    return cached_figure("deductions", data, _deduction_spec)
+
+
+# --- MEASUREMENT: PAYLOAD AND RENDER TIME PER RERUN ---
+if __name__ == "__main__":
+    import time
+
+    import pandas as pd
+    import plotly.express as px
+    import plotly.io as pio
+
+    calc = {'old_regime_tax_liability': 214760, 'new_regime_tax_liability': 172640}
+    sources = [{'type': 'Salary', 'amount': 1450000}, {'type': 'Interest', 'amount': 18000}]
+    summary = [{'section': '80C', 'total_amount': 150000.0}, {'section': '80D', 'total_amount': 25000.0},
+               {'section': '80E', 'total_amount': 40000.0}]
+
+    def before():
+        df = pd.DataFrame({'Regime': ['Old Regime', 'New Regime'],
+                           'Tax Liability': [calc['old_regime_tax_liability'], calc['new_regime_tax_liability']]})
+        regime = px.bar(df, x='Regime', y='Tax Liability', title="Tax Liability Comparison", color='Regime',
+                        text='Tax Liability', color_discrete_map=REGIME_COLORS)
+        regime.update_traces(texttemplate='Rs. %{text:,.0f}', textposition='outside')
+        income = px.pie(pd.DataFrame(sources), values='amount', names='type', title="Income Sources Breakdown", hole=0.3)
+        income.update_traces(textposition='inside', textinfo='percent+label')
+        deductions = px.bar(pd.DataFrame(summary, columns=['section', 'total_amount']), x='section', y='total_amount',
+                            title="Your Total Claimed Deductions by Section", text='total_amount',
+                            labels={'section': 'Deduction Section', 'total_amount': 'Total Amount (Rs.)'})
+        deductions.update_traces(texttemplate='Rs. %{text:,.0f}', textposition='outside')
+        return [regime, income, deductions]
+
+    def after():
+        return [regime_comparison_figure(calc), income_breakdown_figure(sources), deduction_summary_figure(summary)]
+
+    reruns = 50
+    print(f"--- Charts per rerun (3 figures; st.plotly_chart serializes each with plotly.io.to_json) ---")
+    print(f"{'':<22} {'build ms':>9} {'to_json ms':>11} {'payload B':>10}")
+    for label, make in (("Before (DataFrame+px)", before), ("After (cached spec)", after)):
+        make() # Warm imports and, for 'after', the cache
+        build = serialize = 0.0
+        for _ in range(reruns):
+            start = time.perf_counter()
+            figures = make()
+            build += time.perf_counter() - start
+            start = time.perf_counter()
+            payloads = [pio.to_json(f, validate=False) for f in figures]
+            serialize += time.perf_counter() - start
+        print(f"{label:<22} {build / reruns * 1e3:>9.2f} {serialize / reruns * 1e3:>11.2f} "
+              f"{sum(len(p) for p in payloads):>10,}")
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {len(_figures)} figures kept (max {MAX_CACHED_FIGURES})")
+# --- END MEASUREMENT ---
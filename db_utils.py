@@ -0,0 +1,487 @@
+import sqlite3
+import json
+import datetime
+import hashlib
+import time
+
+import rule_packs
+import storage
+
+# Use check_same_thread=False for Streamlit's threading
+DB_NAME = "tax_calculations.db"
+
+def get_storage():
+    """Returns this process's storage backend for DB_NAME (all writes go through its single writer)."""
+    return storage.get_backend(DB_NAME)
+
+def get_db_connection():
+    """Creates a read connection (reads run concurrently with the writer under WAL)."""
+    get_storage() # Makes sure WAL mode is set up before the first read
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=storage.BUSY_TIMEOUT_SECONDS)
+    conn.row_factory = sqlite3.Row # Allows accessing columns by name
+    return conn
+
+def create_tables():
+    """Creates all necessary tables if they don't exist."""
+    def _create(conn):
+        # Table 1: Stores full calculation results
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS calculations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                assessment_year TEXT,
+                gross_income REAL,
+                recommended_regime TEXT,
+                tax_saving REAL,
+                final_amount_due REAL,
+                calculation_data TEXT NOT NULL, -- Full JSON blob
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Table 2: Tracks individual user deductions
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS deductions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                section TEXT NOT NULL, -- e.g., '80C', '80D'
+                description TEXT, -- e.g., 'LIC Premium', 'Health Insurance'
+                amount REAL NOT NULL,
+                date_added DATE
+            )
+        """)
+        # Content hash for de-duplicating statement imports (added later, so migrate in place)
+        deduction_columns = {row['name'] for row in conn.execute("PRAGMA table_info(deductions)")}
+        if 'content_hash' not in deduction_columns:
+            conn.execute("ALTER TABLE deductions ADD COLUMN content_hash TEXT")
+            _backfill_deduction_hashes(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_deductions_user_hash ON deductions (username, content_hash)")
+
+        # --- NEW: Table 3: User Calendar Events ---
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                title TEXT NOT NULL, -- Description of the event
+                start_date DATE NOT NULL
+            )
+        """)
+        # Recurrence columns (added after the table first shipped, so migrate in place)
+        event_columns = {row['name'] for row in conn.execute("PRAGMA table_info(user_events)")}
+        if 'recurrence' not in event_columns:
+            conn.execute("ALTER TABLE user_events ADD COLUMN recurrence TEXT") # NULL, 'monthly', 'quarterly', 'yearly'
+        if 'until_date' not in event_columns:
+            conn.execute("ALTER TABLE user_events ADD COLUMN until_date DATE")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_user_events_user_start ON user_events (username, start_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_user_events_recurring ON user_events (username) WHERE recurrence IS NOT NULL")
+        # --- END NEW ---
+
+        # Table 4: Per-user, per-AY rollup of saved calculations (kept in sync by save_calculation)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS calculation_rollups (
+                username TEXT NOT NULL,
+                assessment_year TEXT NOT NULL,
+                report_count INTEGER NOT NULL DEFAULT 0,
+                latest_calculation_id INTEGER,
+                gross_income REAL,
+                old_regime_tax REAL,
+                new_regime_tax REAL,
+                recommended_regime TEXT,
+                tax_saving REAL,
+                final_amount_due REAL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (username, assessment_year)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_calculations_user_ts ON calculations (username, timestamp)")
+
+        # Table 5: Background LLM jobs (see job_queue.py); times are epoch seconds for latency maths
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                kind TEXT NOT NULL, -- 'extract', 'calculate', 'invest'
+                job_key TEXT, -- e.g. uploaded file name, to find the job again after a reconnect
+                status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+                payload TEXT NOT NULL, -- JSON
+                result TEXT,
+                error TEXT,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        # Claim counter (added after the table first shipped, so migrate in place)
+        job_columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if 'attempts' not in job_columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_kind ON jobs (username, kind, id)")
+
+        # One-time backfill for databases created before the rollup table existed, or whose rollups
+        # were keyed by the year as written ('AY 2025-2026' apart from '2025-26')
+        rollup_years = [row[0] for row in conn.execute("SELECT DISTINCT assessment_year FROM calculation_rollups")]
+        has_calcs = conn.execute("SELECT 1 FROM calculations LIMIT 1").fetchone()
+        if has_calcs and (not rollup_years or any(year != _rollup_year(year) for year in rollup_years)):
+            _rebuild_rollups(conn)
+    get_storage().write(_create)
+
+# --- Functions for 'calculation_rollups' table ---
+
+_UPSERT_ROLLUP_SQL = """
+    INSERT INTO calculation_rollups
+    (username, assessment_year, report_count, latest_calculation_id, gross_income, old_regime_tax,
+     new_regime_tax, recommended_regime, tax_saving, final_amount_due, updated_at)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(username, assessment_year) DO UPDATE SET
+        report_count = report_count + 1,
+        latest_calculation_id = excluded.latest_calculation_id,
+        gross_income = excluded.gross_income,
+        old_regime_tax = excluded.old_regime_tax,
+        new_regime_tax = excluded.new_regime_tax,
+        recommended_regime = excluded.recommended_regime,
+        tax_saving = excluded.tax_saving,
+        final_amount_due = excluded.final_amount_due,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+def _rollup_year(assessment_year):
+    """Rollup key: the normalized assessment year, so every spelling of a year shares one row."""
+    return rule_packs.normalize_assessment_year(assessment_year) or 'N/A'
+
+def _rollup_params(username, calc_id, calc_json):
+    return (
+        username,
+        _rollup_year(calc_json.get('assessment_year')),
+        calc_id,
+        calc_json.get("gross_total_income"),
+        calc_json.get("old_regime_tax_liability"),
+        calc_json.get("new_regime_tax_liability"),
+        calc_json.get("recommended_regime"),
+        calc_json.get("tax_saving_with_recommendation"),
+        calc_json.get("final_amount_due_under_recommendation"),
+    )
+
+def _rebuild_rollups(conn):
+    """Recomputes all rollups from the JSON blobs (for old databases, and after bulk recomputes)."""
+    conn.execute("DELETE FROM calculation_rollups")
+    rows = conn.execute("SELECT id, username, calculation_data FROM calculations ORDER BY timestamp, id")
+    for row in rows.fetchall():
+        conn.execute(_UPSERT_ROLLUP_SQL, _rollup_params(row['username'], row['id'], json.loads(row['calculation_data'])))
+
+def load_yearly_trends(username):
+    """Loads the per-assessment-year rollups for a user, oldest year first."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT * FROM calculation_rollups WHERE username = ? ORDER BY assessment_year",
+        (username,)
+    )
+    trends = cursor.fetchall()
+    conn.close()
+    return trends
+
+# --- Functions for 'calculations' table ---
+
+def save_calculation(username, calc_json):
+    """Saves a calculation JSON blob for a specific user."""
+    ay = calc_json.get('assessment_year', 'N/A')
+
+    def _write(conn):
+        cursor = conn.execute(
+            """
+            INSERT INTO calculations
+            (username, assessment_year, gross_income, recommended_regime, tax_saving, final_amount_due, calculation_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                username,
+                ay,
+                calc_json.get("gross_total_income"),
+                calc_json.get("recommended_regime"),
+                calc_json.get("tax_saving_with_recommendation"),
+                calc_json.get("final_amount_due_under_recommendation"),
+                json.dumps(calc_json) # Store the full JSON
+            )
+        )
+        # Same transaction, so the rollup never disagrees with the saved reports
+        conn.execute(_UPSERT_ROLLUP_SQL, _rollup_params(username, cursor.lastrowid, calc_json))
+    get_storage().write(_write)
+
+def load_calculations(username):
+    """Loads all past calculations for a specific user."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT * FROM calculations WHERE username = ? ORDER BY timestamp DESC",
+        (username,)
+    )
+    calculations = cursor.fetchall()
+    conn.close()
+    return calculations
+
+def load_all_calculations(username=None):
+    """Loads saved calculations of every user (or one), oldest first, for bulk recomputes."""
+    conn = get_db_connection()
+    if username is None:
+        cursor = conn.execute("SELECT * FROM calculations ORDER BY timestamp, id")
+    else:
+        cursor = conn.execute("SELECT * FROM calculations WHERE username = ? ORDER BY timestamp, id", (username,))
+    calculations = cursor.fetchall()
+    conn.close()
+    return calculations
+
+def update_calculations(updates):
+    """Replaces the JSON of saved calculations from (id, calc_json) pairs, then rebuilds the rollups."""
+    def _write(conn):
+        conn.executemany(
+            """
+            UPDATE calculations
+            SET gross_income = ?, recommended_regime = ?, tax_saving = ?, final_amount_due = ?, calculation_data = ?
+            WHERE id = ?
+            """,
+            [(
+                calc_json.get("gross_total_income"),
+                calc_json.get("recommended_regime"),
+                calc_json.get("tax_saving_with_recommendation"),
+                calc_json.get("final_amount_due_under_recommendation"),
+                json.dumps(calc_json),
+                calc_id,
+            ) for calc_id, calc_json in updates]
+        )
+        _rebuild_rollups(conn) # Same transaction, so trends match the updated reports
+    get_storage().write(_write)
+
+# --- Functions for 'deductions' table ---
+
+def deduction_hash(username, section, description, amount, date_added):
+    """Stable fingerprint of a deduction's content, used to skip re-imported rows."""
+    key = f"{username}|{section}|{(description or '').strip().lower()}|{float(amount):.2f}|{str(date_added)[:10]}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _backfill_deduction_hashes(conn):
+    rows = conn.execute("SELECT id, username, section, description, amount, date_added FROM deductions").fetchall()
+    conn.executemany(
+        "UPDATE deductions SET content_hash = ? WHERE id = ?",
+        [(deduction_hash(r['username'], r['section'], r['description'], r['amount'], r['date_added']), r['id']) for r in rows]
+    )
+
+def add_deduction(username, section, description, amount, date_added):
+    """Adds a new individual deduction item for a user."""
+    def _write(conn):
+        conn.execute(
+            "INSERT INTO deductions (username, section, description, amount, date_added, content_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, section, description, amount, date_added,
+             deduction_hash(username, section, description, amount, date_added))
+        )
+    get_storage().write(_write)
+
+def add_deductions_bulk(username, rows):
+    """Inserts many (section, description, amount, date_added) rows in one transaction.
+
+    Rows whose content hash already exists for the user (or repeats within `rows`) are skipped.
+    Returns (inserted, skipped).
+    """
+    def _write(conn):
+        existing = {r[0] for r in conn.execute(
+            "SELECT content_hash FROM deductions WHERE username = ? AND content_hash IS NOT NULL", (username,)
+        )}
+        to_insert = []
+        for section, description, amount, date_added in rows:
+            content_hash = deduction_hash(username, section, description, amount, date_added)
+            if content_hash not in existing:
+                existing.add(content_hash)
+                to_insert.append((username, section, description, amount, date_added, content_hash))
+        conn.executemany(
+            "INSERT INTO deductions (username, section, description, amount, date_added, content_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            to_insert
+        )
+        return len(to_insert), len(rows) - len(to_insert)
+    return get_storage().write(_write)
+
+def load_deductions(username):
+    """Loads all individual deductions for a user."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT * FROM deductions WHERE username = ? ORDER BY section, date_added DESC",
+        (username,)
+    )
+    deductions = cursor.fetchall()
+    conn.close()
+    return deductions
+
+def get_deductions_summary(username):
+    """Gets the sum of deductions grouped by section."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT section, SUM(amount) as total_amount FROM deductions WHERE username = ? GROUP BY section",
+        (username,)
+    )
+    summary = cursor.fetchall()
+    conn.close()
+    return summary
+
+def delete_deduction(deduction_id):
+    """Deletes a specific deduction entry by its ID."""
+    def _write(conn):
+        conn.execute(
+            "DELETE FROM deductions WHERE id = ?",
+            (deduction_id,)
+        )
+    get_storage().write(_write)
+
+# --- NEW Functions for 'user_events' table ---
+
+def add_user_event(username, title, start_date, recurrence=None, until_date=None):
+    """Adds a custom calendar event for a user (optionally repeating until `until_date`)."""
+    def _write(conn):
+        conn.execute(
+            "INSERT INTO user_events (username, title, start_date, recurrence, until_date) VALUES (?, ?, ?, ?, ?)",
+            (username, title, start_date, recurrence, until_date)
+        )
+    get_storage().write(_write)
+
+def load_user_events(username):
+    """Loads all custom calendar events for a user."""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "SELECT * FROM user_events WHERE username = ? ORDER BY start_date",
+        (username,)
+    )
+    events = cursor.fetchall()
+    conn.close()
+    return events
+
+def load_user_events_in_window(username, window_start, window_end):
+    """Loads one-off events inside [window_start, window_end] plus recurring events active in it.
+
+    Both queries are index range scans, so cost depends on the window, not on event history.
+    """
+    conn = get_db_connection()
+    one_off = conn.execute(
+        """
+        SELECT * FROM user_events
+        WHERE username = ? AND start_date BETWEEN ? AND ? AND recurrence IS NULL
+        ORDER BY start_date
+        """,
+        (username, str(window_start), str(window_end))
+    ).fetchall()
+    recurring = conn.execute(
+        """
+        SELECT * FROM user_events
+        WHERE username = ? AND recurrence IS NOT NULL
+          AND start_date <= ? AND (until_date IS NULL OR until_date >= ?)
+        ORDER BY start_date
+        """,
+        (username, str(window_end), str(window_start))
+    ).fetchall()
+    conn.close()
+    return one_off, recurring
+
+def delete_user_event(event_id):
+    """Deletes a specific user event by its ID."""
+    def _write(conn):
+        conn.execute(
+            "DELETE FROM user_events WHERE id = ?",
+            (event_id,)
+        )
+    get_storage().write(_write)
+# --- END NEW ---
+
+# --- Functions for 'jobs' table ---
+
+def enqueue_job(username, kind, payload, job_key=None):
+    """Queues a background job and returns its ID."""
+    def _write(conn):
+        cursor = conn.execute(
+            "INSERT INTO jobs (username, kind, job_key, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (username, kind, job_key, json.dumps(payload), time.time())
+        )
+        return cursor.lastrowid
+    return get_storage().write(_write)
+
+def claim_next_job(worker_name):
+    """Atomically moves the oldest queued job to 'running' and returns it (or None)."""
+    def _claim(conn):
+        # Runs inside the writer's transaction, so two workers never claim the same row
+        job = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if job:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, worker = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), worker_name, job['id'])
+            )
+        return job
+    return get_storage().write(_claim)
+
+def finish_job(job_id, result=None, error=None):
+    """Stores a job's result (JSON-encoded) or error message."""
+    def _write(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            ('failed' if error else 'done', None if error else json.dumps(result), error, time.time(), job_id)
+        )
+    get_storage().write(_write)
+
+def get_job(job_id):
+    """Loads one job by ID."""
+    conn = get_db_connection()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return job
+
+def latest_job(username, kind):
+    """Loads a user's most recent job of a kind (used to resume after a reconnect)."""
+    conn = get_db_connection()
+    job = conn.execute(
+        "SELECT * FROM jobs WHERE username = ? AND kind = ? ORDER BY id DESC LIMIT 1",
+        (username, kind)
+    ).fetchone()
+    conn.close()
+    return job
+
+def requeue_stale_jobs(timeout_seconds, max_attempts):
+    """Puts 'running' jobs whose worker died back in the queue, or fails them after `max_attempts` claims.
+
+    A job that keeps killing its worker (e.g. a document that crashes the process) would otherwise
+    be retried forever. Returns (requeued, failed).
+    """
+    def _write(conn):
+        now = time.time()
+        failed = conn.execute(
+            """
+            UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+            WHERE status = 'running' AND started_at < ? AND attempts >= ?
+            """,
+            (f"Gave up after {max_attempts} attempts: the worker stopped responding each time.", now,
+             now - timeout_seconds, max_attempts)
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL WHERE status = 'running' AND started_at < ?",
+            (now - timeout_seconds,)
+        ).rowcount
+        return requeued, failed
+    return get_storage().write(_write)
+
+def purge_finished_jobs(older_than_days):
+    """Deletes finished jobs (and their payloads) older than the retention period."""
+    def _write(conn):
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - older_than_days * 86400,)
+        )
+    get_storage().write(_write)
+
+def load_job_stats(recent_limit):
+    """Queue depth per status, plus (kind, wait, total latency) for the most recent finished jobs."""
+    conn = get_db_connection()
+    depth = conn.execute(
+        "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+    ).fetchall()
+    recent = conn.execute(
+        """
+        SELECT kind, started_at - created_at AS wait_s, finished_at - created_at AS latency_s
+        FROM jobs WHERE status IN ('done', 'failed') ORDER BY id DESC LIMIT ?
+        """,
+        (recent_limit,)
+    ).fetchall()
+    conn.close()
+    return depth, recent
@@ -0,0 +1,148 @@
+import os
+import re
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import db_utils
+
+# --- SECTION RULE TABLE (first matching rule wins; matched against the row description) ---
+SECTION_RULES = [
+    ("80E", r"education loan|student loan"),
+    ("80D", r"health insurance|mediclaim|medical insurance|preventive health|star health|care health|niva bupa"),
+    ("80C", r"\blic\b|life insurance|\bppf\b|\belss\b|\bepf\b|\bvpf\b|\bnsc\b|sukanya|\bssy\b|tuition fee|"
+            r"home loan principal|tax saver fd|\bulip\b"),
+    ("80G", r"donation|\bpm cares\b|relief fund|charit|\bngo\b"),
+    ("80TTA", r"savings? (?:a/?c |account )?interest|\bsb int"),
+]
+_COMPILED_RULES = [(section, re.compile(pattern, re.IGNORECASE)) for section, pattern in SECTION_RULES]
+
+# Column names seen in bank / insurer exports, mapped to ours
+COLUMN_ALIASES = {
+    "description": ["description", "narration", "particulars", "remarks", "details", "transaction details"],
+    "amount": ["amount", "debit", "withdrawal amt.", "withdrawal", "premium", "debit amount", "amount (inr)"],
+    "date": ["date", "txn date", "transaction date", "value date", "payment date", "premium date"],
+}
+# Optional credit column: savings interest (80TTA) shows up as a deposit, not a debit. Only
+# 80TTA rows read it; any other credit (salary, refunds) is income, not a deduction.
+CREDIT_ALIASES = ["deposit amt.", "deposit", "credit", "credit amount"]
+# --- END RULES ---
+
+
+def _pick_column(columns, aliases):
+    lowered = {str(c).strip().lower(): c for c in columns}
+    for alias in aliases:
+        if alias in lowered:
+            return lowered[alias]
+    return None
+
+
+def _parse_dates(col):
+    """ISO dates first; anything else is read day-first (dd/mm/yyyy, as Indian statements use)."""
+    dates = pd.to_datetime(col, errors="coerce", format="ISO8601")
+    retry = dates.isna() & col.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(col[retry].astype(str), errors="coerce", dayfirst=True, format="mixed")
+    return dates.dt.date
+
+
+def _to_amount(col):
+    """'Rs. 1,234.50' / '1234.5' / '' -> float or NaN."""
+    return pd.to_numeric(col.astype(str).str.replace(r"[^\d.\-]", "", regex=True), errors="coerce")
+
+
+def _sections(descriptions):
+    """Section for each description from SECTION_RULES (first match wins); None where no rule matches."""
+    section = pd.Series(None, index=descriptions.index, dtype=object)
+    unassigned = np.ones(len(descriptions), dtype=bool)
+    for name, pattern in _COMPILED_RULES:
+        hit = descriptions.str.contains(pattern, na=False).to_numpy() & unassigned
+        section[hit] = name
+        unassigned &= ~hit
+    return section
+
+
+def read_statement(file, file_name):
+    """Reads a CSV or XLSX statement into a DataFrame of description / amount / date.
+
+    Raises ValueError for files that can't be read as a statement, corrupt workbooks included.
+    """
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        from openpyxl.utils.exceptions import InvalidFileException
+        try:
+            raw = pd.read_excel(file)
+        except (zipfile.BadZipFile, InvalidFileException) as e:
+            raise ValueError(f"{file_name} is not a readable Excel workbook ({e})") from e
+    else:
+        raw = pd.read_csv(file)
+
+    picked = {key: _pick_column(raw.columns, aliases) for key, aliases in COLUMN_ALIASES.items()}
+    missing = [key for key, col in picked.items() if col is None]
+    if missing:
+        raise ValueError(f"Could not find column(s) for: {', '.join(missing)}. Found: {', '.join(map(str, raw.columns))}")
+
+    description = raw[picked["description"]].fillna("").astype(str).str.strip()
+    amounts = _to_amount(raw[picked["amount"]])
+    credit_col = _pick_column(raw.columns, CREDIT_ALIASES)
+    if credit_col is not None and credit_col != picked["amount"]:
+        interest = _sections(description).eq("80TTA")
+        amounts = amounts.where(amounts.notna() | ~interest, _to_amount(raw[credit_col]))
+    return pd.DataFrame({
+        "description": description,
+        "amount": amounts.abs(),
+        "date": _parse_dates(raw[picked["date"]]),
+    })
+
+
+def map_sections(statement):
+    """Adds a `section` column from SECTION_RULES; rows matching no rule get None."""
+    return statement.assign(section=_sections(statement["description"]))
+
+
+def prepare_import(file, file_name):
+    """Parses and maps a statement. Returns (rows ready for import, rows skipped as unmapped/invalid)."""
+    mapped = map_sections(read_statement(file, file_name))
+    valid = mapped["section"].notna() & mapped["amount"].gt(0) & mapped["date"].notna()
+    return mapped[valid].reset_index(drop=True), mapped[~valid].reset_index(drop=True)
+
+
+def import_deductions(username, prepared):
+    """Writes prepared rows in one batched transaction. Returns (inserted, duplicates skipped)."""
+    rows = list(zip(
+        prepared["section"].tolist(), prepared["description"].tolist(),
+        prepared["amount"].astype(float).tolist(), [str(d) for d in prepared["date"].tolist()],
+    ))
+    return db_utils.add_deductions_bulk(username, rows)
+
+
+# --- BENCHMARK: 10k-row statement ---
+if __name__ == "__main__":
+    import io
+    import tempfile
+
+    samples = ["LIC Premium Policy 123", "Star Health Mediclaim renewal", "PPF deposit", "Donation to PM CARES",
+               "SB Int credited", "Education loan EMI interest", "Grocery store", "ELSS SIP Axis Tax Saver"]
+    rng = np.random.default_rng(3)
+    n = 10_000
+    csv_text = pd.DataFrame({
+        "Txn Date": pd.Timestamp("2024-04-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        "Narration": [f"{samples[i % len(samples)]} #{i}" for i in range(n)],
+        "Withdrawal Amt.": rng.uniform(100, 20000, n).round(2),
+    }).to_csv(index=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_utils.DB_NAME = os.path.join(tmp, "import_bench.db")
+        db_utils.create_tables()
+        start = time.perf_counter()
+        ready, skipped = prepare_import(io.StringIO(csv_text), "statement.csv")
+        parsed = time.perf_counter()
+        inserted, duplicates = import_deductions("bench_user", ready)
+        done = time.perf_counter()
+        print(f"--- Imported {n:,}-row statement ---")
+        print(f"Parse + map: {(parsed - start) * 1000:.0f} ms | Insert: {(done - parsed) * 1000:.0f} ms | Total: {(done - start) * 1000:.0f} ms")
+        print(f"Inserted: {inserted:,} | Duplicates: {duplicates:,} | Unmapped/invalid: {len(skipped):,}")
+        again = import_deductions("bench_user", ready)
+        print(f"Re-import of the same file -> inserted {again[0]:,}, skipped {again[1]:,}")
+# --- END BENCHMARK ---
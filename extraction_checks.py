@@ -0,0 +1,211 @@
+import copy
+import json
+import re
+
+import rule_packs
+from tax_engine import _amount, gross_total_income, regime_tax
+
+# --- SETTINGS ---
+MAX_PLAUSIBLE_INCOME = 50_00_00_000 # Rs. 50 crore: anything above is almost surely a misread (extra digits)
+TOTAL_TOLERANCE = 0.005 # Printed total vs sum of income_sources may differ by rounding only
+# --- END SETTINGS ---
+
+# Fields TaxScan can be asked to re-read on their own: dotted path -> what to look for
+FIELD_SPECS = {
+    "personal_info.name": "taxpayer's full name",
+    "personal_info.pan_number": "10-character PAN, e.g. ABCPE1234F",
+    "personal_info.assessment_year": "assessment year, e.g. 2025-26",
+    "income_sources": "all income lines: [ { `type`, `amount` } ]",
+    "gross_total_income": "gross total income as printed",
+    "deductions_claimed": "all deductions: [ { `section`, `amount` } ]",
+    "taxes_paid.tds": "total TDS",
+    "taxes_paid.advance_tax": "advance tax paid",
+}
+
+_PAN = re.compile(r"^[A-Z]{3}[ABCFGHJLPT][A-Z][0-9]{4}[A-Z]$") # 4th letter is the holder type (P = individual)
+_ASSESSMENT_YEAR = re.compile(r"^(20\d\d)-(\d\d)$")
+
+
+def _get(data, path):
+    for key in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _number(value):
+    """float for a usable amount, None when missing or unreadable (e.g. 'Rs. 1,20,000' left as text)."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _list_problem(items, label):
+    if not isinstance(items, list):
+        return f"{label} is not a list"
+    for item in items:
+        amount = _number(item.get('amount')) if isinstance(item, dict) else None
+        if amount is None:
+            return f"{label} has a missing or unreadable amount"
+        if amount < 0:
+            return f"{label} has a negative amount ({amount:,.0f})"
+    return None
+
+
+# --- VALIDATION ---
+def validate_extraction(extracted_data):
+    """Checks TaxScan output locally; returns [{'field', 'problem'}], empty when everything looks right.
+
+    Covers PAN and assessment-year formats, missing or negative amounts, totals that don't match
+    the printed gross total, and amounts that can't be true (deductions above income, TDS above
+    the tax on the whole income). Each `field` is a key of FIELD_SPECS, so it can be re-extracted.
+    """
+    data = extracted_data if isinstance(extracted_data, dict) else {}
+    issues = []
+
+    def flag(field, problem):
+        issues.append({"field": field, "problem": problem})
+
+    if not str(_get(data, "personal_info.name") or "").strip():
+        flag("personal_info.name", "name is missing")
+
+    pan = str(_get(data, "personal_info.pan_number") or "").replace(" ", "").upper()
+    if not pan:
+        flag("personal_info.pan_number", "PAN is missing")
+    elif not _PAN.match(pan):
+        flag("personal_info.pan_number", f"PAN {pan!r} is not in the AAAPA9999A format")
+
+    year = str(_get(data, "personal_info.assessment_year") or "").strip()
+    match = _ASSESSMENT_YEAR.match(year)
+    if not match or (int(match.group(1)) + 1) % 100 != int(match.group(2)):
+        flag("personal_info.assessment_year", f"assessment year {year!r} is not like 2025-26" if year
+             else "assessment year is missing")
+
+    sources = data.get('income_sources')
+    gross = gross_total_income(data)
+    if not sources:
+        flag("income_sources", "no income sources were extracted")
+    elif _list_problem(sources, "an income source"):
+        flag("income_sources", _list_problem(sources, "an income source"))
+    elif gross > MAX_PLAUSIBLE_INCOME:
+        flag("income_sources", f"income of Rs. {gross:,.0f} is implausibly high")
+    else:
+        printed = _number(data.get('gross_total_income'))
+        if printed is not None and abs(printed - gross) > max(1.0, TOTAL_TOLERANCE * printed):
+            flag("income_sources", f"income sources add up to Rs. {gross:,.0f} but the document shows Rs. {printed:,.0f}")
+
+    deductions = data.get('deductions_claimed')
+    if deductions:
+        problem = _list_problem(deductions, "a deduction")
+        if problem:
+            flag("deductions_claimed", problem)
+        elif gross and sum(_amount(d.get('amount')) for d in deductions) > gross:
+            flag("deductions_claimed", "deductions add up to more than the total income")
+
+    tds = _get(data, "taxes_paid.tds")
+    if _number(tds) is None:
+        flag("taxes_paid.tds", "TDS is missing" if tds is None else f"TDS {tds!r} is not a number")
+    elif _number(tds) < 0:
+        flag("taxes_paid.tds", "TDS is negative")
+    elif gross and _number(tds) > max(regime_tax(gross, regime, rule_packs.pack_for(data)) for regime in ("Old", "New")) + 1:
+        flag("taxes_paid.tds", f"TDS of Rs. {_number(tds):,.0f} is more than the tax on the entire income")
+
+    advance = _get(data, "taxes_paid.advance_tax")
+    if advance is not None and (_number(advance) is None or _number(advance) < 0):
+        flag("taxes_paid.advance_tax", f"advance tax {advance!r} is not a valid amount")
+    return issues
+# --- END VALIDATION ---
+
+
+# --- TARGETED RE-EXTRACTION ---
+def fields_to_reextract(issues):
+    """Distinct failing fields, in FIELD_SPECS order. A totals mismatch also re-reads the printed total."""
+    fields = {issue['field'] for issue in issues}
+    if "income_sources" in fields:
+        fields.add("gross_total_income")
+    return [f for f in FIELD_SPECS if f in fields]
+
+
+def reextraction_prompt(issues):
+    """A TaxScan prompt that asks for the failing fields only, with what was wrong with each."""
+    problems = {}
+    for issue in issues:
+        problems.setdefault(issue['field'], []).append(issue['problem'])
+    lines = []
+    for field in fields_to_reextract(issues):
+        note = f" (was: {'; '.join(problems[field])})" if field in problems else ""
+        lines.append(f"* `{field}`: {FIELD_SPECS[field]}{note}")
+    return (
+        "You are \"TaxScan.\" Re-read this document and extract ONLY these fields, which failed validation:\n"
+        + "\n".join(lines) + "\n\n"
+        "Return only JSON nested by the dotted paths (`taxes_paid.tds` -> {\"taxes_paid\": {\"tds\": ...}}), "
+        "amounts as plain numbers. Extract only what is written; use `null` if a value is not on the document."
+    )
+
+
+def merge_fields(extracted_data, partial, fields):
+    """Copy of `extracted_data` with just `fields` taken from the re-extraction result `partial`."""
+    merged = copy.deepcopy(extracted_data or {})
+    for field in fields:
+        *parents, leaf = field.split(".")
+        source, target = partial, merged
+        for key in parents:
+            source = source.get(key) if isinstance(source, dict) else None
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        if isinstance(source, dict) and leaf in source:
+            target[leaf] = source[leaf]
+    return merged
+# --- END TARGETED RE-EXTRACTION ---
+
+
+# --- MEASUREMENT: FULL RE-RUN vs TARGETED RE-EXTRACTION ---
+if __name__ == "__main__":
+    from advisor_context import estimate_tokens
+    from prompts import extractor_prompt
+
+    DOCUMENT_TOKENS_PER_PAGE = 258 # Gemini's fixed cost per image / PDF page
+    OUTPUT_TOKENS_PER_SECOND = 150 # Typical 2.5 Flash decode rate; output length drives latency
+    pages = 2 # Form 16 Part B
+
+    extracted = {
+        "personal_info": {"name": "Asha Rao", "pan_number": "ABCPE1234", "assessment_year": "2025-26"},
+        "income_sources": [{"type": "Salary", "amount": 1450000}, {"type": "Perquisites", "amount": 35000},
+                           {"type": "Interest", "amount": 18000}],
+        "gross_total_income": 1530000,
+        "deductions_claimed": [{"section": "80C", "amount": 150000}, {"section": "80D", "amount": 25000},
+                               {"section": "80CCD(1B)", "amount": 50000}, {"section": "80TTA", "amount": 10000}],
+        "taxes_paid": {"tds": None, "advance_tax": None},
+    }
+    issues = validate_extraction(extracted)
+    fields = fields_to_reextract(issues)
+    corrected = {"personal_info": {"pan_number": "ABCPE1234F"}, "taxes_paid": {"tds": 165000},
+                 "income_sources": [{"type": "Salary", "amount": 1450000}, {"type": "Perquisites", "amount": 35000},
+                                    {"type": "Interest", "amount": 18000}, {"type": "Other", "amount": 27000}],
+                 "gross_total_income": 1530000}
+    full_output = merge_fields(extracted, corrected, fields)
+
+    print("--- Validation issues ---")
+    for issue in issues:
+        print(f"{issue['field']:<28} {issue['problem']}")
+    print(f"After merge: {len(validate_extraction(full_output))} issue(s)")
+
+    document = DOCUMENT_TOKENS_PER_PAGE * pages
+    runs = {
+        "Full re-run": (estimate_tokens(extractor_prompt), estimate_tokens(json.dumps(full_output))),
+        "Targeted": (estimate_tokens(reextraction_prompt(issues)), estimate_tokens(json.dumps(corrected))),
+    }
+    print(f"\n--- Correction cost (estimated; {pages}-page document = {document} tokens) ---")
+    print(f"{'':<12} {'prompt':>7} {'output':>7} {'total':>7} {'decode s':>9}")
+    for label, (prompt_tokens, output_tokens) in runs.items():
+        print(f"{label:<12} {prompt_tokens + document:>7} {output_tokens:>7} {prompt_tokens + document + output_tokens:>7} "
+              f"{output_tokens / OUTPUT_TOKENS_PER_SECOND:>9.2f}")
+    (full_in, full_out), (narrow_in, narrow_out) = runs.values()
+    print(f"Output tokens: {1 - narrow_out / full_out:.0%} fewer; total tokens: "
+          f"{1 - (narrow_in + narrow_out + document) / (full_in + full_out + document):.0%} fewer")
+# --- END MEASUREMENT ---
@@ -0,0 +1,468 @@
+import argparse
+import datetime
+import json
+import re
+import time
+
+import rule_packs
+from tax_engine import _amount, gross_total_income, deductions_by_section, regime_tax_breakdown
+
+# --- SETTINGS ---
+SOFTWARE_ID = "TAXBUDDY"
+SOFTWARE_VERSION = "1.0"
+SCHEMA_VERSION = "Ver1.0"
+SUMMARY_TOLERANCE = 1.0 # Rupees; differences from the TaxLogic summary above this are reported
+# --- END SETTINGS ---
+
+
+# --- ITR-1 SCHEMA (the subset of the Sahaj form this app fills) ---
+_AMOUNT = {"type": "integer", "minimum": 0, "maximum": 99999999999999}
+
+
+def _largest(rule):
+    """Largest value of a rule across the rule packs, so the schema accepts every supported year."""
+    return max(rule(rule_packs.load_pack(year)) for year in rule_packs.available_years())
+
+
+def _amounts(*names, required=True):
+    return {
+        "type": "object",
+        "properties": {name: _AMOUNT for name in names},
+        "required": list(names) if required else [],
+        "additionalProperties": False,
+    }
+
+
+ITR1_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "required": ["ITR"],
+    "properties": {"ITR": {
+        "type": "object",
+        "required": ["ITR1"],
+        "properties": {"ITR1": {
+            "type": "object",
+            "required": ["CreationInfo", "Form_ITR1", "PersonalInfo", "FilingStatus", "ITR1_IncomeDeductions",
+                         "ITR1_TaxComputation", "TaxPaid", "Refund"],
+            "additionalProperties": False,
+            "properties": {
+                "CreationInfo": {
+                    "type": "object",
+                    "required": ["SWVersionNo", "SWCreatedBy", "JSONCreatedBy", "JSONCreationDate"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "SWVersionNo": {"type": "string", "maxLength": 10},
+                        "SWCreatedBy": {"type": "string", "maxLength": 10},
+                        "JSONCreatedBy": {"type": "string", "maxLength": 10},
+                        "JSONCreationDate": {"type": "string", "pattern": r"^\d{4}-\d{2}-\d{2}$"},
+                    },
+                },
+                "Form_ITR1": {
+                    "type": "object",
+                    "required": ["FormName", "AssessmentYear", "SchemaVer"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "FormName": {"const": "ITR-1"},
+                        "AssessmentYear": {"type": "string", "pattern": r"^\d{4}$"},
+                        "SchemaVer": {"type": "string"},
+                    },
+                },
+                "PersonalInfo": {
+                    "type": "object",
+                    "required": ["AssesseeName", "PAN"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "AssesseeName": {
+                            "type": "object",
+                            "required": ["SurNameOrOrgName"],
+                            "additionalProperties": False,
+                            "properties": {
+                                "FirstName": {"type": "string", "maxLength": 25},
+                                "SurNameOrOrgName": {"type": "string", "minLength": 1, "maxLength": 75},
+                            },
+                        },
+                        "PAN": {"type": "string", "pattern": r"^[A-Z]{5}[0-9]{4}[A-Z]$"},
+                    },
+                },
+                "FilingStatus": {
+                    "type": "object",
+                    "required": ["ReturnFileSec", "OptOutNewTaxRegime"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "ReturnFileSec": {"enum": [11]}, # 139(1), original return before the due date
+                        "OptOutNewTaxRegime": {"enum": ["Y", "N"]},
+                    },
+                },
+                "ITR1_IncomeDeductions": {
+                    "type": "object",
+                    "required": ["GrossSalary", "DeductionUs16ia", "ProfessionalTaxUs16iii", "IncomeFromSal",
+                                 "IncomeOthSrc", "GrossTotIncome", "DeductUndChapVIA", "TotalIncome"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "GrossSalary": _AMOUNT,
+                        "AllwncExemptUs10": _amounts("TotalAllwncExemptUs10"), # HRA u/s 10(13A), Old regime only
+                        "DeductionUs16ia": dict(_AMOUNT, maximum=_largest(lambda r: max(r.standard_deduction.values()))),
+                        "ProfessionalTaxUs16iii": dict(_AMOUNT, maximum=_largest(lambda r: r.professional_tax_cap)),
+                        "IncomeFromSal": _AMOUNT,
+                        "IncomeOthSrc": _AMOUNT,
+                        "GrossTotIncome": _AMOUNT,
+                        "DeductUndChapVIA": {
+                            "type": "object",
+                            "required": ["TotalChapVIADeductions"],
+                            "additionalProperties": False,
+                            "properties": {
+                                "Section80C": dict(_AMOUNT, maximum=_largest(lambda r: r.section_caps["80C"])),
+                                "Section80CCD1B": dict(_AMOUNT, maximum=_largest(lambda r: r.section_caps["80CCD(1B)"])),
+                                "Section80D": _AMOUNT,
+                                "Section80E": _AMOUNT,
+                                "Section80G": _AMOUNT,
+                                "Section80TTA": dict(_AMOUNT, maximum=_largest(lambda r: r.section_caps["80TTA"])),
+                                "TotalChapVIADeductions": _AMOUNT,
+                            },
+                        },
+                        "TotalIncome": _AMOUNT,
+                    },
+                },
+                "ITR1_TaxComputation": _amounts("TotalTaxPayable", "Rebate87A", "TaxPayableOnRebate",
+                                                "EducationCess", "GrossTaxLiability", "NetTaxLiability"),
+                "TaxPaid": {
+                    "type": "object",
+                    "required": ["TaxesPaid", "BalTaxPayable"],
+                    "additionalProperties": False,
+                    "properties": {
+                        "TaxesPaid": _amounts("AdvanceTax", "TDS", "TotalTaxesPaid"),
+                        "BalTaxPayable": _AMOUNT,
+                    },
+                },
+                "Refund": _amounts("RefundDue"),
+            },
+        }},
+    }},
+}
+
+
+# --- SCHEMA COMPILER ---
+# Turns the JSON-schema subset above into nested closures once, so validating a return is a
+# handful of direct checks instead of walking the schema dict on every call.
+_JSON_TYPES = {"object": dict, "string": str, "integer": int}
+_SUPPORTED = {"$schema", "type", "properties", "required", "additionalProperties", "minimum", "maximum",
+              "minLength", "maxLength", "pattern", "enum", "const"}
+
+
+def compile_schema(schema):
+    """Returns check(instance, path, errors) for `schema`; raises ValueError on keywords it can't compile."""
+    unsupported = set(schema) - _SUPPORTED
+    if unsupported:
+        raise ValueError(f"Unsupported schema keyword(s): {', '.join(sorted(unsupported))}")
+    checks = []
+
+    if "type" in schema:
+        py_type, name = _JSON_TYPES[schema["type"]], schema["type"]
+        def check_type(value, path, errors):
+            if not isinstance(value, py_type) or isinstance(value, bool):
+                errors.append(f"{path}: {value!r} is not of type '{name}'")
+                return False
+            return True
+        checks.append(check_type)
+    if "const" in schema or "enum" in schema:
+        allowed = [schema["const"]] if "const" in schema else schema["enum"]
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: {value!r} is not one of {allowed}")
+            return True
+        checks.append(check_enum)
+    if "minimum" in schema or "maximum" in schema:
+        low, high = schema.get("minimum", float("-inf")), schema.get("maximum", float("inf"))
+        def check_range(value, path, errors):
+            if not low <= value <= high:
+                errors.append(f"{path}: {value!r} is outside {low}..{high}")
+            return True
+        checks.append(check_range)
+    if "minLength" in schema or "maxLength" in schema:
+        shortest, longest = schema.get("minLength", 0), schema.get("maxLength", float("inf"))
+        def check_length(value, path, errors):
+            if not shortest <= len(value) <= longest:
+                errors.append(f"{path}: {value!r} must be {shortest} to {longest} characters")
+            return True
+        checks.append(check_length)
+    if "pattern" in schema:
+        regex = re.compile(schema["pattern"])
+        def check_pattern(value, path, errors):
+            if not regex.search(value):
+                errors.append(f"{path}: {value!r} does not match '{regex.pattern}'")
+            return True
+        checks.append(check_pattern)
+    if "properties" in schema or "required" in schema:
+        children = {key: compile_schema(sub) for key, sub in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+        closed = schema.get("additionalProperties", True) is False
+        def check_object(value, path, errors):
+            for key in required:
+                if key not in value:
+                    errors.append(f"{path or '(root)'}: '{key}' is a required property")
+            for key, item in value.items():
+                child = children.get(key)
+                if child is not None:
+                    child(item, f"{path}.{key}" if path else key, errors)
+                elif closed:
+                    errors.append(f"{path}: unexpected property '{key}'")
+            return True
+        checks.append(check_object)
+
+    def check(value, path, errors):
+        for step in checks:
+            if not step(value, path, errors): # A wrong type makes the remaining checks meaningless
+                return
+    return check
+
+
+_ITR1_CHECK = compile_schema(ITR1_SCHEMA) # Compiled once at import; reused by every generate_itr1() call
+# --- END SCHEMA ---
+
+
+# --- FIELD MAP (ITR-1 path -> fact from itr1_facts(); facts that are None are left out) ---
+ITR1_FIELD_MAP = [
+    ("ITR.ITR1.CreationInfo.SWVersionNo", "software_version"),
+    ("ITR.ITR1.CreationInfo.SWCreatedBy", "software_id"),
+    ("ITR.ITR1.CreationInfo.JSONCreatedBy", "software_id"),
+    ("ITR.ITR1.CreationInfo.JSONCreationDate", "creation_date"),
+    ("ITR.ITR1.Form_ITR1.FormName", "form_name"),
+    ("ITR.ITR1.Form_ITR1.AssessmentYear", "assessment_year"),
+    ("ITR.ITR1.Form_ITR1.SchemaVer", "schema_version"),
+    ("ITR.ITR1.PersonalInfo.AssesseeName.FirstName", "first_name"),
+    ("ITR.ITR1.PersonalInfo.AssesseeName.SurNameOrOrgName", "surname"),
+    ("ITR.ITR1.PersonalInfo.PAN", "pan"),
+    ("ITR.ITR1.FilingStatus.ReturnFileSec", "return_section"),
+    ("ITR.ITR1.FilingStatus.OptOutNewTaxRegime", "opt_out_new_regime"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.GrossSalary", "gross_salary"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.AllwncExemptUs10.TotalAllwncExemptUs10", "hra_exemption"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductionUs16ia", "standard_deduction"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.ProfessionalTaxUs16iii", "professional_tax"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.IncomeFromSal", "income_from_salary"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.IncomeOthSrc", "income_other_sources"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.GrossTotIncome", "gross_total_income"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80C", "sec_80c"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80CCD1B", "sec_80ccd_1b"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80D", "sec_80d"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80E", "sec_80e"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80G", "sec_80g"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.Section80TTA", "sec_80tta"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.DeductUndChapVIA.TotalChapVIADeductions", "chapter_via_total"),
+    ("ITR.ITR1.ITR1_IncomeDeductions.TotalIncome", "total_income"),
+    ("ITR.ITR1.ITR1_TaxComputation.TotalTaxPayable", "tax_on_total_income"),
+    ("ITR.ITR1.ITR1_TaxComputation.Rebate87A", "rebate_87a"),
+    ("ITR.ITR1.ITR1_TaxComputation.TaxPayableOnRebate", "tax_after_rebate"),
+    ("ITR.ITR1.ITR1_TaxComputation.EducationCess", "cess"),
+    ("ITR.ITR1.ITR1_TaxComputation.GrossTaxLiability", "gross_tax_liability"),
+    ("ITR.ITR1.ITR1_TaxComputation.NetTaxLiability", "net_tax_liability"),
+    ("ITR.ITR1.TaxPaid.TaxesPaid.AdvanceTax", "advance_tax"),
+    ("ITR.ITR1.TaxPaid.TaxesPaid.TDS", "tds"),
+    ("ITR.ITR1.TaxPaid.TaxesPaid.TotalTaxesPaid", "total_taxes_paid"),
+    ("ITR.ITR1.TaxPaid.BalTaxPayable", "balance_payable"),
+    ("ITR.ITR1.Refund.RefundDue", "refund_due"),
+]
+_COMPILED_FIELD_MAP = [(tuple(path.split(".")), fact) for path, fact in ITR1_FIELD_MAP]
+
+# Chapter VI-A sections with their own ITR-1 field; any other section only counts towards the total
+_HRA_SECTION = re.compile(r"10\s*\(\s*13A\s*\)|\bHRA\b", re.IGNORECASE) # Salary exemption, not Chapter VI-A
+_SECTION_FACTS = {"80C": "sec_80c", "80CCD(1B)": "sec_80ccd_1b", "80D": "sec_80d", "80E": "sec_80e",
+                  "80G": "sec_80g", "80TTA": "sec_80tta"}
+# --- END FIELD MAP ---
+
+
+def _rupees(value):
+    return int(round(max(float(value), 0)))
+
+
+def _itr_assessment_year(value):
+    """'2025-26' / 'AY 2025-2026' / '2025' -> '2025'."""
+    digits = "".join(ch if ch.isdigit() else " " for ch in str(value or "")).split()
+    return digits[0] if digits and len(digits[0]) == 4 else None
+
+
+def itr1_facts(extracted_data, final_calc_json, professional_tax=0, sec_80d_cap=None):
+    """Every value the ITR-1 field map needs, computed locally from the extracted data and the summary.
+
+    The regime, assessment year and Chapter VI-A claims come from final_calc_json (the deductions
+    the calculation used; the document's own for summaries saved without them). The figures are
+    recomputed with tax_engine under that year's rule pack and caps, so the tax computation block
+    is internally consistent. Only the Chapter VI-A sections the form has fields for count towards
+    TotalChapVIADeductions; an HRA claim (10(13A)) is exempted from salary instead.
+    """
+    extracted_data = extracted_data or {}
+    calc = final_calc_json or {}
+    personal = extracted_data.get('personal_info') or {}
+    paid = extracted_data.get('taxes_paid') or {}
+
+    names = str(personal.get('name') or "").split()
+    regime = "Old" if str(calc.get('recommended_regime', "")).strip().lower() == "old" else "New"
+    rules = rule_packs.pack_for_year(personal.get('assessment_year') or calc.get('assessment_year'))
+
+    gross = gross_total_income(extracted_data)
+    salary = sum(_amount(s.get('amount')) for s in extracted_data.get('income_sources') or []
+                 if 'salary' in str(s.get('type', "")).lower())
+    claimed = calc.get('deductions_used_for_old_regime')
+    if claimed is None:
+        claimed = extracted_data.get('deductions_claimed')
+    claimed = deductions_by_section({'deductions_claimed': claimed}) if regime == "Old" else {}
+    hra_exemption = min(sum(v for k, v in claimed.items() if _HRA_SECTION.search(str(k))), salary)
+    standard_deduction = min(rules.standard_deduction[regime], salary - hra_exemption)
+    p_tax = min(professional_tax, rules.professional_tax_cap, max(salary - hra_exemption - standard_deduction, 0))
+    net_salary = salary - hra_exemption - standard_deduction - p_tax
+
+    facts = {fact: None for fact in _SECTION_FACTS.values()}
+    chapter_via = 0.0
+    if regime == "Old":
+        caps = dict(rules.section_caps)
+        if sec_80d_cap is not None:
+            caps["80D"] = sec_80d_cap
+        for section, amount in claimed.items():
+            section = str(section).strip().upper()
+            if section not in _SECTION_FACTS: # Not a Chapter VI-A field on the form (HRA, 'Other', ...)
+                continue
+            allowed = _rupees(min(amount, caps.get(section, amount)))
+            facts[_SECTION_FACTS[section]] = (facts[_SECTION_FACTS[section]] or 0) + allowed
+            chapter_via += allowed
+    after_salary_deductions = gross - (salary - net_salary)
+    chapter_via = min(chapter_via, max(after_salary_deductions, 0))
+
+    total_income = _rupees(after_salary_deductions - chapter_via)
+    tax, rebate, cess, liability = (float(v) for v in regime_tax_breakdown(total_income, regime, rules))
+    tds, advance_tax = _rupees(_amount(paid.get('tds'))), _rupees(_amount(paid.get('advance_tax')))
+    balance = _rupees(liability) - tds - advance_tax
+
+    facts.update({
+        "software_id": SOFTWARE_ID,
+        "software_version": SOFTWARE_VERSION,
+        "creation_date": datetime.date.today().isoformat(),
+        "form_name": "ITR-1",
+        "assessment_year": _itr_assessment_year(personal.get('assessment_year') or calc.get('assessment_year')),
+        "schema_version": SCHEMA_VERSION,
+        "first_name": " ".join(names[:-1]) or None,
+        "surname": names[-1] if names else None,
+        "pan": str(personal.get('pan_number') or "").strip().upper() or None,
+        "return_section": 11,
+        "opt_out_new_regime": "Y" if regime == "Old" else "N",
+        "gross_salary": _rupees(salary),
+        "hra_exemption": _rupees(hra_exemption) if hra_exemption else None,
+        "standard_deduction": _rupees(standard_deduction),
+        "professional_tax": _rupees(p_tax),
+        "income_from_salary": _rupees(net_salary),
+        "income_other_sources": _rupees(gross - salary),
+        "gross_total_income": _rupees(gross),
+        "chapter_via_total": _rupees(chapter_via),
+        "total_income": total_income,
+        "tax_on_total_income": _rupees(tax),
+        "rebate_87a": _rupees(rebate),
+        "tax_after_rebate": _rupees(tax - rebate),
+        "cess": _rupees(cess),
+        "gross_tax_liability": _rupees(liability),
+        "net_tax_liability": _rupees(liability),
+        "advance_tax": advance_tax,
+        "tds": tds,
+        "total_taxes_paid": tds + advance_tax,
+        "balance_payable": max(balance, 0),
+        "refund_due": max(-balance, 0),
+    })
+    return facts
+
+
+def validation_errors(itr):
+    """Schema violations as 'path: message' strings, in document order."""
+    errors = []
+    _ITR1_CHECK(itr, "", errors)
+    return errors
+
+
+def generate_itr1(extracted_data, final_calc_json, professional_tax=0, sec_80d_cap=None):
+    """Builds and validates a draft ITR-1 JSON. Returns (itr, errors); errors is empty when the draft passes the schema.
+
+    The draft has no address, date of birth or verification blocks; the filer completes those
+    in the e-filing utility before submitting.
+    """
+    facts = itr1_facts(extracted_data, final_calc_json, professional_tax, sec_80d_cap)
+    itr = {}
+    for keys, fact in _COMPILED_FIELD_MAP:
+        value = facts[fact]
+        if value is None:
+            continue
+        node = itr
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = value
+    return itr, validation_errors(itr)
+
+
+def compare_with_summary(itr, final_calc_json):
+    """Differences between the generated return and the TaxLogic summary, as readable strings."""
+    calc = final_calc_json or {}
+    form = itr.get("ITR", {}).get("ITR1", {})
+    regime = "Old" if form.get("FilingStatus", {}).get("OptOutNewTaxRegime") == "Y" else "New"
+    checks = [
+        ("Gross total income", form.get("ITR1_IncomeDeductions", {}).get("GrossTotIncome"), calc.get("gross_total_income")),
+        (f"{regime} regime tax", form.get("ITR1_TaxComputation", {}).get("NetTaxLiability"),
+         calc.get(f"{regime.lower()}_regime_tax_liability")),
+        ("Taxes paid", form.get("TaxPaid", {}).get("TaxesPaid", {}).get("TotalTaxesPaid"), calc.get("total_taxes_paid")),
+    ]
+    notes = []
+    for label, ours, theirs in checks:
+        if ours is not None and theirs is not None and abs(ours - _amount(theirs)) > SUMMARY_TOLERANCE:
+            notes.append(f"{label}: ITR-1 has Rs. {ours:,.0f}, calculation summary has Rs. {_amount(theirs):,.2f}")
+    return notes
+
+
+def generate_batch(records, professional_tax=0, sec_80d_cap=None):
+    """Yields (key, itr, errors) for an iterable of {'key', 'extracted_data', 'final_calc_json'} records.
+
+    A record may carry its own 'professional_tax'.
+    """
+    for record in records:
+        itr, errors = generate_itr1(record.get('extracted_data'), record.get('final_calc_json'),
+                                    record.get('professional_tax', professional_tax), sec_80d_cap)
+        yield record.get('key'), itr, errors
+
+
+# --- BATCH CLI / BENCHMARK ---
+def _synthetic_records(n, seed=11):
+    import random
+    rng = random.Random(seed)
+    for i in range(n):
+        salary = rng.randrange(300000, 4000000, 1000)
+        yield {
+            "key": f"user{i}",
+            "professional_tax": 2500,
+            "extracted_data": {
+                "personal_info": {"name": f"Test User{i}", "pan_number": f"ABCDE{i % 10000:04d}F", "assessment_year": "2025-26"},
+                "income_sources": [{"type": "Salary", "amount": salary}, {"type": "Interest", "amount": rng.randrange(0, 50000)}],
+                "deductions_claimed": [{"section": "80C", "amount": rng.randrange(0, 200000)},
+                                       {"section": "80D", "amount": rng.randrange(0, 40000)}],
+                "taxes_paid": {"tds": rng.randrange(0, 600000), "advance_tax": None},
+            },
+            "final_calc_json": {"recommended_regime": rng.choice(["Old", "New"]), "assessment_year": "2025-26"},
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate ITR-1 JSON for many users")
+    parser.add_argument("--batch", help="JSON Lines input: one {'key', 'extracted_data', 'final_calc_json'} per line")
+    parser.add_argument("--out", default="itr1_batch.jsonl", help="JSON Lines output (with --batch)")
+    parser.add_argument("--benchmark", type=int, default=10_000, help="synthetic users to time when --batch is not given")
+    args = parser.parse_args()
+
+    if args.batch:
+        ok = failed = 0
+        with open(args.batch) as src, open(args.out, "w") as dst:
+            records = (json.loads(line) for line in src if line.strip())
+            for key, itr, errors in generate_batch(records):
+                dst.write(json.dumps({"key": key, "itr": itr, "errors": errors}) + "\n")
+                ok, failed = (ok + 1, failed) if not errors else (ok, failed + 1)
+        print(f"Wrote {ok + failed:,} returns to {args.out} ({ok:,} valid, {failed:,} with errors)")
+    else:
+        records = list(_synthetic_records(args.benchmark))
+        start = time.perf_counter()
+        results = list(generate_batch(records))
+        elapsed = time.perf_counter() - start
+        invalid = sum(1 for _, _, errors in results if errors)
+        print(f"--- Generated {len(results):,} ITR-1 returns ---")
+        print(f"Total: {elapsed:.2f}s | Per return: {elapsed / len(results) * 1000:.3f} ms | With errors: {invalid:,}")
+# --- END BATCH CLI / BENCHMARK ---
@@ -1,37 +1,143 @@
-import bcrypt
+import argparse
+import csv
+import multiprocessing
+import os
 import sys
+import time
 
-print("--- Running Radical Hasher (using bcrypt directly) ---")
+try:
+    import bcrypt
+except ImportError:
+    print("**ACTION REQUIRED:** Please run 'pip install bcrypt' and try again.")
+    sys.exit(1)
+
+# --- SETTINGS ---
+DEFAULT_ROUNDS = 12 # bcrypt cost factor: each +1 doubles the hashing time (and an attacker's)
+DEFAULT_CONFIG = ".streamlit/config.yaml"
+CHECKPOINT_EVERY = 250 # Users hashed between writes of config.yaml, so an interrupted run keeps its progress
+REQUIRED_COLUMNS = ["username", "password"]
+OPTIONAL_COLUMNS = ["name", "email", "roles"] # roles: separated by ';'
+# --- END SETTINGS ---
 
-# 1. List your desired passwords
+# 1. List your desired passwords (used when no CSV is given)
 passwords_to_hash = ["user1_pass", "user2_pass"]
 
-try:
-    hashed_passwords_list = []
-    
-    for password in passwords_to_hash:
-        # 2. Encode the password to bytes
-        password_bytes = password.encode('utf-8')
-        
-        # 3. Generate the salt and hash the password
-        salt = bcrypt.gensalt()
-        hashed_bytes = bcrypt.hashpw(password_bytes, salt)
-        
-        # 4. Decode the hash back to a string for the YAML file
-        hashed_string = hashed_bytes.decode('utf-8')
-        hashed_passwords_list.append(hashed_string)
-
-    # 5. Print the final list
-    print("\n--- SUCCESS! ---")
-    print("Your bcrypt-hashed passwords are:")
-    print(hashed_passwords_list)
-    
-    print("\nCopy this list and paste it into your .streamlit/config.yaml")
-
-except Exception as e:
-    print(f"\n--- SCRIPT FAILED ---")
-    print(f"Error: {e}")
-    if "No module named 'bcrypt'" in str(e):
-        print("\n**ACTION REQUIRED:** Please run 'pip install bcrypt' and try again.")
+
+def hash_password(password, rounds=DEFAULT_ROUNDS):
+    """bcrypt hash of `password` as the string config.yaml expects."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _hash_user(args):
+    username, password, rounds = args
+    return username, hash_password(password, rounds)
+
+
+# --- BULK PROVISIONING ---
+def read_users(path):
+    """Rows of the user CSV keyed by username. Raises ValueError on missing columns, blanks or duplicates."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = [c.strip().lower() for c in reader.fieldnames or []]
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"User file is missing columns: {', '.join(missing)}")
+        users, problems = {}, []
+        for line, row in enumerate(reader, start=2):
+            row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+            username = row['username'].lower()
+            if not username or not row['password']:
+                problems.append(f"line {line}: username and password are required")
+            elif username in users:
+                problems.append(f"line {line}: duplicate username '{username}'")
+            else:
+                users[username] = row
+    if problems:
+        raise ValueError("Invalid user file:\n  " + "\n  ".join(problems[:20]))
+    return users
+
+
+def _credential(row, hashed):
+    entry = {"email": row.get('email') or "", "name": row.get('name') or row['username'], "password": hashed}
+    if row.get('roles'):
+        entry["roles"] = [r.strip() for r in row['roles'].split(';') if r.strip()]
+    return entry
+
+
+def _save_config(config, path):
+    import yaml
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False, allow_unicode=True)
+    os.replace(tmp, path) # The app never sees a half-written file
+
+
+def provision(users_csv, config_path=DEFAULT_CONFIG, rounds=DEFAULT_ROUNDS, workers=None, update=False,
+              checkpoint_every=CHECKPOINT_EVERY, progress=print):
+    """Hashes the CSV's passwords across a process pool and merges them into config.yaml's credentials.
+
+    Users already in config.yaml are skipped unless `update` is set, so re-running after an
+    interruption only hashes who is left. Returns a report dict with hashes per second.
+    """
+    import yaml
+    with open(config_path) as f:
+        config = yaml.safe_load(f) or {}
+    existing = config.setdefault('credentials', {}).get('usernames') or {}
+    config['credentials']['usernames'] = existing
+
+    users = read_users(users_csv)
+    todo = [u for u in users if update or u not in existing]
+    workers = workers or os.cpu_count() or 1
+    report = {"users": len(users), "skipped": len(users) - len(todo), "hashed": 0, "rounds": rounds,
+              "workers": workers, "seconds": 0.0, "hashes_per_second": 0.0}
+    if not todo:
+        return report
+
+    ctx = multiprocessing.get_context("spawn") # Same start method as the job workers
+    start = time.perf_counter()
+    with ctx.Pool(workers) as pool:
+        jobs = ((u, users[u]['password'], rounds) for u in todo)
+        for username, hashed in pool.imap_unordered(_hash_user, jobs, chunksize=max(1, min(16, len(todo) // (workers * 4)))):
+            existing[username] = _credential(users[username], hashed)
+            report["hashed"] += 1
+            if report["hashed"] % checkpoint_every == 0:
+                _save_config(config, config_path)
+                elapsed = time.perf_counter() - start
+                progress(f"  {report['hashed']:,}/{len(todo):,} hashed ({report['hashed'] / elapsed:.1f}/s)")
+    report["seconds"] = time.perf_counter() - start
+    report["hashes_per_second"] = report["hashed"] / report["seconds"]
+    _save_config(config, config_path)
+    return report
+# --- END BULK PROVISIONING ---
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash passwords for .streamlit/config.yaml")
+    parser.add_argument("users_csv", nargs="?",
+                        help="CSV with username,password[,name,email,roles]; omit to hash passwords_to_hash and print them")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="config.yaml to merge the users into")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="bcrypt cost factor (4-31)")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: one per CPU)")
+    parser.add_argument("--update", action="store_true", help="re-hash users that are already in config.yaml")
+    args = parser.parse_args()
+    if not 4 <= args.rounds <= 31:
+        parser.error("--rounds must be between 4 and 31")
+
+    if args.users_csv:
+        print(f"--- Provisioning users from {args.users_csv} into {args.config} ---")
+        try:
+            report = provision(args.users_csv, args.config, args.rounds, args.workers, args.update)
+        except (OSError, ValueError) as e:
+            print(f"--- PROVISIONING FAILED ---\n{e}")
+            sys.exit(1)
+        print(f"Hashed {report['hashed']:,} of {report['users']:,} users ({report['skipped']:,} already present) "
+              f"in {report['seconds']:.1f}s -> {report['hashes_per_second']:.1f} hashes/s "
+              f"(rounds={report['rounds']}, workers={report['workers']})")
+        print("Delete the CSV now: it holds plain-text passwords.")
     else:
-        print("\nAn unexpected error occurred. Please check your Python installation.")
+        print("--- Running Radical Hasher (using bcrypt directly) ---")
+        hashed_passwords_list = [hash_password(p, args.rounds) for p in passwords_to_hash]
+        print("\n--- SUCCESS! ---")
+        print("Your bcrypt-hashed passwords are:")
+        print(hashed_passwords_list)
+        print("\nCopy this list and paste it into your .streamlit/config.yaml")
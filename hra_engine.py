@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- MONTH-BY-MONTH HRA ENGINE ---
+# Financial-year order; calendar month numbers (1-12) are mapped onto this
+FY_MONTHS = ["Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec", "Jan", "Feb", "Mar"]
+CALENDAR_TO_FY = {4: 0, 5: 1, 6: 2, 7: 3, 8: 4, 9: 5, 10: 6, 11: 7, 12: 8, 1: 9, 2: 10, 3: 11}
+
+REQUIRED_COLUMNS = ["employee_id", "month", "basic", "hra_received", "rent_paid", "city_type"]
+
+
+def monthly_hra_exemption(basic, da, hra_received, rent_paid, is_metro):
+    """Vectorized Sec 10(13A) rule for one month; all arguments are arrays of the same shape.
+
+    Returns the three limits and the exemption (the least of them, zero in months without rent).
+    """
+    salary = np.asarray(basic, dtype=float) + np.asarray(da, dtype=float)
+    rent = np.asarray(rent_paid, dtype=float)
+    limit_actual = np.asarray(hra_received, dtype=float)
+    limit_rent = np.maximum(rent - 0.10 * salary, 0)
+    limit_city = np.where(is_metro, 0.50, 0.40) * salary
+    exemption = np.where(rent > 0, np.minimum(np.minimum(limit_actual, limit_rent), limit_city), 0.0)
+    return limit_actual, limit_rent, limit_city, exemption
+
+
+def map_unique(values, mapper):
+    """Applies mapper to each distinct value only, then broadcasts back (cheap for 12 months / 2 cities)."""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([mapper(u) for u in uniques], dtype=float)
+    return mapped[codes]
+
+
+def _month_index(month):
+    """Maps month names ('Apr') or calendar numbers (4) to 0-11 in financial-year order."""
+    fy_lookup = {m: i for i, m in enumerate(FY_MONTHS)}
+    if pd.api.types.is_numeric_dtype(month):
+        return map_unique(month, lambda m: CALENDAR_TO_FY.get(int(m), np.nan))
+    return map_unique(month, lambda m: fy_lookup.get(str(m)[:3].title(), np.nan))
+
+
+def compute_hra_schedule(schedule):
+    """Evaluates a long-format schedule (one row per employee-month) for any number of employees.
+
+    Expects REQUIRED_COLUMNS plus an optional `da` column. `city_type` is 'Metro' or 'Non-Metro'
+    per month, so moves between cities are handled. Months with no row count as not renting.
+    Returns (monthly_breakdown, annual_summary) DataFrames.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in schedule.columns]
+    if missing:
+        raise ValueError(f"HRA schedule is missing columns: {', '.join(missing)}")
+
+    da = schedule["da"].fillna(0) if "da" in schedule.columns else 0.0
+    is_metro = map_unique(schedule["city_type"], lambda c: str(c).strip().lower() == "metro").astype(bool)
+    month_idx = _month_index(schedule["month"])
+    if np.isnan(month_idx).any():
+        raise ValueError("HRA schedule has unrecognised month values.")
+
+    limit_actual, limit_rent, limit_city, exemption = monthly_hra_exemption(
+        schedule["basic"].fillna(0).to_numpy(), np.asarray(da),
+        schedule["hra_received"].fillna(0).to_numpy(), schedule["rent_paid"].fillna(0).to_numpy(), is_metro
+    )
+
+    monthly = pd.DataFrame({
+        "employee_id": schedule["employee_id"].to_numpy(),
+        "month": np.asarray(FY_MONTHS)[month_idx.astype(int)],
+        "month_index": month_idx.astype(int),
+        "city_type": np.where(is_metro, "Metro", "Non-Metro"),
+        "hra_received": limit_actual,
+        "rent_minus_10pct_salary": limit_rent,
+        "city_pct_of_salary": limit_city,
+        "exemption": exemption,
+        "taxable_hra": limit_actual - exemption,
+    }).sort_values(["employee_id", "month_index"], kind="stable", ignore_index=True)
+
+    rented = schedule["rent_paid"].fillna(0).to_numpy() > 0
+    annual = (
+        pd.DataFrame({
+            "employee_id": schedule["employee_id"].to_numpy(),
+            "hra_received": limit_actual,
+            "rent_paid": schedule["rent_paid"].fillna(0).to_numpy(),
+            "exemption": exemption,
+            "months_rented": rented.astype(int),
+        })
+        .groupby("employee_id", sort=True, as_index=False)
+        .sum()
+    )
+    annual["taxable_hra"] = annual["hra_received"] - annual["exemption"]
+    return monthly, annual
+
+
+def load_hra_schedule_csv(path_or_buffer):
+    """Reads a schedule CSV (see REQUIRED_COLUMNS) and evaluates it."""
+    return compute_hra_schedule(pd.read_csv(path_or_buffer))
+
+
+def schedule_from_annual(basic, da, hra_received, rent_paid, city_type, months_rented=12, employee_id="self"):
+    """Spreads annual figures evenly over the months rented (the single-person, single-city case)."""
+    rows = []
+    for i, month in enumerate(FY_MONTHS):
+        renting = i < months_rented
+        rows.append({
+            "employee_id": employee_id, "month": month,
+            "basic": basic / 12, "da": da / 12, "hra_received": hra_received / 12,
+            "rent_paid": rent_paid / months_rented if renting and months_rented else 0.0,
+            "city_type": city_type,
+        })
+    return pd.DataFrame(rows)
+# --- END HRA ENGINE ---
+
+
+# --- THROUGHPUT BENCHMARK ---
+def _synthetic_schedule(n_employees, seed=7):
+    """Builds n_employees x 12 months with random salaries, rent gaps and city moves."""
+    rng = np.random.default_rng(seed)
+    n_rows = n_employees * 12
+    basic = np.repeat(rng.uniform(20000, 200000, n_employees), 12)
+    return pd.DataFrame({
+        "employee_id": np.repeat(np.arange(n_employees), 12),
+        "month": np.tile(np.asarray(FY_MONTHS), n_employees),
+        "basic": basic,
+        "da": basic * 0.1,
+        "hra_received": basic * 0.4,
+        "rent_paid": np.where(rng.random(n_rows) < 0.85, rng.uniform(5000, 80000, n_rows), 0.0),
+        "city_type": np.where(rng.random(n_rows) < 0.5, "Metro", "Non-Metro"),
+    })
+
+
+if __name__ == "__main__":
+    n = 100_000
+    print(f"--- HRA engine benchmark: {n:,} employee-years ({n * 12:,} employee-months) ---")
+    data = _synthetic_schedule(n)
+    start = time.perf_counter()
+    monthly_df, annual_df = compute_hra_schedule(data)
+    elapsed = time.perf_counter() - start
+    print(f"Computed in {elapsed:.3f}s -> {n / elapsed:,.0f} employee-years/s")
+    print(f"Total exemption: Rs. {annual_df['exemption'].sum():,.0f}")
+# --- END BENCHMARK ---
@@ -0,0 +1,162 @@
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import time
+
+import db_utils
+from prompts import extractor_prompt, calculator_prompt_for, investment_prompt
+
+# --- SETTINGS ---
+DEFAULT_WORKERS = int(os.environ.get("TAXBUDDY_WORKERS", "2"))
+POLL_INTERVAL_SECONDS = 1.0
+STALE_JOB_SECONDS = 600 # A 'running' job older than this is assumed to have lost its worker
+MAX_JOB_ATTEMPTS = 3 # Claims before a job that keeps losing its worker is marked failed
+JOB_RETENTION_DAYS = 7
+HOUSEKEEPING_SECONDS = 60
+# --- END SETTINGS ---
+
+
+# --- JOB HANDLERS (kind -> function(payload) -> JSON-serializable result) ---
+# llm_tasks (and google.generativeai) is imported inside the handlers, so the app can
+# enqueue jobs and read metrics without loading the SDK.
+def _run_extract(payload):
+    import llm_tasks
+    return llm_tasks.get_gemini_response(payload['mime_type'], base64.b64decode(payload['data']), extractor_prompt)
+
+def _run_reextract(payload):
+    import extraction_checks, llm_tasks
+    source = db_utils.get_job(payload['source_job'])
+    if source is None:
+        raise RuntimeError("The original document is no longer stored. Please upload it again.")
+    document = json.loads(source['payload'])
+    prompt = extraction_checks.reextraction_prompt(payload['issues'])
+    values = llm_tasks.get_gemini_response(document['mime_type'], base64.b64decode(document['data']), prompt,
+                                           reuse_upload=True)
+    return {"fields": extraction_checks.fields_to_reextract(payload['issues']), "values": values}
+
+def _run_calculate(payload):
+    import llm_tasks, rule_packs
+    rules = rule_packs.pack_for(payload['data']) # The rules of the document's assessment year
+    return llm_tasks.calculate_tax(payload['data'], calculator_prompt_for(rules), payload['model'])
+
+def _run_invest(payload):
+    import llm_tasks
+    return llm_tasks.get_investment_advice(payload['user_data'], investment_prompt)
+
+HANDLERS = {"extract": _run_extract, "reextract": _run_reextract, "calculate": _run_calculate, "invest": _run_invest}
+# --- END HANDLERS ---
+
+
+def submit_extraction(username, file_name, mime_type, data):
+    """Queues a TaxScan extraction for an uploaded file."""
+    payload = {"mime_type": mime_type, "data": base64.b64encode(data).decode("ascii")}
+    return db_utils.enqueue_job(username, "extract", payload, job_key=file_name)
+
+def submit_reextraction(username, extract_job_id, issues, job_key=None):
+    """Queues a TaxScan re-read of just the fields in `issues`, reusing the document stored with the extraction job."""
+    return db_utils.enqueue_job(username, "reextract", {"source_job": extract_job_id, "issues": issues}, job_key=job_key)
+
+def submit_calculation(username, data_for_calc, model_name, job_key=None):
+    """Queues a TaxLogic calculation."""
+    return db_utils.enqueue_job(username, "calculate", {"data": data_for_calc, "model": model_name}, job_key=job_key)
+
+def submit_investment_advice(username, user_data):
+    """Queues a FinVest AI request."""
+    return db_utils.enqueue_job(username, "invest", {"user_data": user_data})
+
+def job_result(job):
+    """Decodes a finished job's result."""
+    return json.loads(job['result']) if job['result'] is not None else None
+
+
+# --- WORKERS ---
+def run_one_job(worker_name):
+    """Claims and runs a single job. Returns False when the queue was empty."""
+    job = db_utils.claim_next_job(worker_name)
+    if job is None:
+        return False
+    try:
+        result = HANDLERS[job['kind']](json.loads(job['payload']))
+    except Exception as e:
+        db_utils.finish_job(job['id'], error=str(e) or type(e).__name__)
+    else:
+        db_utils.finish_job(job['id'], result=result)
+    return True
+
+
+def worker_loop(worker_name):
+    """Polls the jobs table forever; safe to run any number of these against one database."""
+    import llm_tasks
+    try:
+        llm_tasks.configure_from_env()
+    except RuntimeError as e:
+        # Keep running: jobs will fail with a clear error instead of sitting in the queue
+        print(f"[{worker_name}] {e}")
+    db_utils.create_tables()
+    next_housekeeping = 0.0
+    while True:
+        if time.time() >= next_housekeeping:
+            db_utils.requeue_stale_jobs(STALE_JOB_SECONDS, MAX_JOB_ATTEMPTS)
+            db_utils.purge_finished_jobs(JOB_RETENTION_DAYS)
+            next_housekeeping = time.time() + HOUSEKEEPING_SECONDS
+        if not run_one_job(worker_name):
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def start_workers(count=DEFAULT_WORKERS):
+    """Starts `count` daemon worker processes and returns them."""
+    ctx = multiprocessing.get_context("spawn") # Don't fork a threaded Streamlit server
+    processes = []
+    for i in range(count):
+        p = ctx.Process(target=worker_loop, args=(f"worker-{os.getpid()}-{i}",), daemon=True)
+        p.start()
+        processes.append(p)
+    return processes
+# --- END WORKERS ---
+
+
+# --- METRICS ---
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def queue_metrics(recent_limit=200):
+    """Queue depth and wait/latency percentiles over the most recent finished jobs."""
+    depth, recent = db_utils.load_job_stats(recent_limit)
+    counts = {row['status']: row['n'] for row in depth}
+    waits = [row['wait_s'] for row in recent if row['wait_s'] is not None]
+    latencies = [row['latency_s'] for row in recent if row['latency_s'] is not None]
+    by_kind = {}
+    for row in recent:
+        if row['latency_s'] is not None:
+            by_kind.setdefault(row['kind'], []).append(row['latency_s'])
+    return {
+        "queued": counts.get('queued', 0),
+        "running": counts.get('running', 0),
+        "p50_wait_s": _percentile(waits, 50),
+        "p50_latency_s": _percentile(latencies, 50),
+        "p95_latency_s": _percentile(latencies, 95),
+        "p95_latency_by_kind_s": {kind: _percentile(v, 95) for kind, v in by_kind.items()},
+        "sample_size": len(latencies),
+    }
+# --- END METRICS ---
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI TaxBuddy background job workers")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="number of worker processes")
+    parser.add_argument("--metrics", action="store_true", help="print queue metrics and exit")
+    args = parser.parse_args()
+
+    if args.metrics:
+        print(json.dumps(queue_metrics(), indent=2))
+    else:
+        print(f"--- Starting {args.workers} worker(s) on {db_utils.DB_NAME} ---")
+        workers = start_workers(args.workers)
+        for w in workers:
+            w.join()
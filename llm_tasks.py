@@ -0,0 +1,113 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# --- GEMINI CALLS (no Streamlit here, so worker processes can run them) ---
+def configure_from_env():
+    """Configures Gemini from GOOGLE_API_KEY or .streamlit/secrets.toml (for worker processes)."""
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key and os.path.exists(".streamlit/secrets.toml"):
+        import tomllib
+        with open(".streamlit/secrets.toml", "rb") as f:
+            api_key = tomllib.load(f).get("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY not found in environment or .streamlit/secrets.toml")
+    genai.configure(api_key=api_key)
+
+
+UPLOAD_TTL_SECONDS = 6 * 3600 # Re-extractions of a document within this window reuse its upload (Gemini keeps files 48h)
+_uploads = {} # file name -> (file, uploaded at), per worker process
+
+
+def _uploaded_at(document, default):
+    """Upload time from the File API, so every worker agrees on when a shared upload expires."""
+    created = getattr(document, 'create_time', None)
+    return created.timestamp() if hasattr(created, 'timestamp') else default
+
+
+def _delete_document(document):
+    try:
+        genai.delete_file(document.name)
+    except Exception:
+        logger.warning("Could not delete uploaded Gemini file %s", document.name, exc_info=True)
+
+
+def _expire_uploads(now):
+    """Deletes this process's uploads that are past UPLOAD_TTL_SECONDS."""
+    for name, (document, uploaded) in list(_uploads.items()):
+        if now - uploaded >= UPLOAD_TTL_SECONDS:
+            del _uploads[name]
+            _delete_document(document)
+
+
+def _reusable_upload(mime_type, data):
+    """The document as a Gemini file named by its content hash, uploaded once and reused until it expires.
+
+    Another worker may have uploaded it already, in which case the upload fails on the name and the
+    file is looked up instead. None (after logging why) when the File API can't be used.
+    """
+    now = time.time()
+    _expire_uploads(now)
+    name = "taxbuddy-" + hashlib.sha256(data).hexdigest()[:30]
+    if name in _uploads:
+        return _uploads[name][0]
+    try:
+        document = genai.upload_file(io.BytesIO(data), mime_type=mime_type, name=name)
+    except Exception as upload_error:
+        try:
+            document = genai.get_file(name)
+        except Exception:
+            logger.warning("Gemini file upload failed (%s) and no earlier upload was found; sending the document inline",
+                           upload_error, exc_info=True)
+            return None
+    uploaded = _uploaded_at(document, now)
+    if now - uploaded >= UPLOAD_TTL_SECONDS: # Another worker's upload that is due for deletion
+        _delete_document(document)
+        return None
+    _uploads[name] = (document, uploaded)
+    return document
+
+
+def get_gemini_response(mime_type, data, prompt, reuse_upload=False):
+    """TaxScan: multimodal extraction with forced JSON output.
+
+    The document goes inline with the request. Targeted re-extractions (`reuse_upload=True`) go
+    through the File API instead, uploading each document once so later re-extractions of it
+    send only the prompt.
+    """
+    model = genai.GenerativeModel("gemini-2.5-flash")
+    generation_config = genai.GenerationConfig(response_mime_type="application/json")
+    file_data = (_reusable_upload(mime_type, data) if reuse_upload else None) or {'mime_type': mime_type, 'data': data}
+    response = model.generate_content([prompt, file_data], generation_config=generation_config)
+    return json.loads(response.text)
+
+
+def calculate_tax(data, prompt, model_name):
+    """TaxLogic: returns the CoT text with the <JSON_OUTPUT> block."""
+    try:
+        model = genai.GenerativeModel(model_name)
+        input_prompt = prompt + "\n\n**Input Data:**\n```json\n" + json.dumps(data, indent=2) + "\n```"
+        response = model.generate_content(input_prompt)
+    except Exception as e:
+        if "429" in str(e) and "quota" in str(e).lower():
+            raise RuntimeError("Quota Exceeded (429).") from e
+        raise
+    if not response.parts:
+        raise RuntimeError("AI Calculator returned an empty response.")
+    return response.text
+
+
+def get_investment_advice(user_data, prompt_template):
+    """FinVest AI: free-text investment suggestions."""
+    model = genai.GenerativeModel("gemini-2.5-flash")
+    input_prompt = prompt_template.format(user_data_json=json.dumps(user_data, indent=2))
+    response = model.generate_content(input_prompt)
+    return response.text
+# --- END GEMINI CALLS ---
@@ -0,0 +1,134 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+import rule_packs
+import tax_calendar
+from hra_engine import FY_MONTHS, CALENDAR_TO_FY, map_unique
+from tax_engine import regime_tax
+
+# --- MONTHLY TDS PROJECTION (employer side, Sec 192) ---
+# One row per employee. Year-to-date figures cover the months *before* the payroll month.
+REQUIRED_COLUMNS = ["employee_id", "regime", "monthly_salary", "ytd_salary", "ytd_tds"]
+# Optional annual declarations; missing columns count as zero. Chapter VI-A and HRA apply to the Old regime only.
+OPTIONAL_COLUMNS = ["declared_80c", "declared_80d", "declared_other", "hra_exemption", "professional_tax", "other_income"]
+
+
+def _fy_month_index(month):
+    """'Oct' / 'October' / 10 -> 0-11 in financial-year order."""
+    if isinstance(month, (int, np.integer)):
+        index = CALENDAR_TO_FY.get(int(month))
+    else:
+        index = {m: i for i, m in enumerate(FY_MONTHS)}.get(str(month)[:3].title())
+    if index is None:
+        raise ValueError(f"Unrecognised payroll month: {month!r}")
+    return index
+
+
+def _column(payroll, name):
+    if name in payroll.columns:
+        return pd.to_numeric(payroll[name], errors="coerce").fillna(0).to_numpy(dtype=float)
+    return np.zeros(len(payroll))
+
+
+def compute_monthly_tds(payroll, month, fy_start_year=None):
+    """Projects each employee's annual tax and spreads what is still owed over the remaining months.
+
+    Annual salary = ytd_salary + monthly_salary x months left (this month included). Both regimes
+    are evaluated for the whole workforce in one pass and each row picks its declared regime.
+    Tax follows the rule pack of the financial year starting in April of `fy_start_year`
+    (default: the current one). Returns a DataFrame with one row per employee and `monthly_tds`
+    to withhold this month.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in payroll.columns]
+    if missing:
+        raise ValueError(f"Payroll file is missing columns: {', '.join(missing)}")
+
+    if fy_start_year is None:
+        fy_start_year = tax_calendar.financial_year_of(datetime.date.today())
+    rules = rule_packs.pack_for_financial_year(fy_start_year)
+    caps = rules.section_caps
+    months_left = 12 - _fy_month_index(month)
+    is_old = map_unique(payroll["regime"], lambda r: str(r).strip().lower() == "old").astype(bool)
+
+    monthly_salary = _column(payroll, "monthly_salary")
+    salary = _column(payroll, "ytd_salary") + monthly_salary * months_left
+    gross = salary + _column(payroll, "other_income")
+    p_tax = np.minimum(_column(payroll, "professional_tax"), rules.professional_tax_cap)
+    base_old = np.minimum(salary, rules.standard_deduction["Old"]) + p_tax
+    base_new = np.minimum(salary, rules.standard_deduction["New"]) + p_tax
+    chapter_via = (np.minimum(_column(payroll, "declared_80c"), caps["80C"])
+                   + np.minimum(_column(payroll, "declared_80d"), caps["80D"])
+                   + _column(payroll, "declared_other"))
+
+    old_taxable = np.maximum(gross - base_old - _column(payroll, "hra_exemption") - chapter_via, 0)
+    new_taxable = np.maximum(gross - base_new, 0)
+    taxable = np.where(is_old, old_taxable, new_taxable)
+    annual_tax = np.where(is_old, regime_tax(old_taxable, "Old", rules), regime_tax(new_taxable, "New", rules))
+
+    ytd_tds = _column(payroll, "ytd_tds")
+    remaining = annual_tax - ytd_tds
+    return pd.DataFrame({
+        "employee_id": payroll["employee_id"].to_numpy(),
+        "regime": np.where(is_old, "Old", "New"),
+        "projected_gross": gross,
+        "taxable_income": taxable,
+        "annual_tax": annual_tax,
+        "ytd_tds": ytd_tds,
+        "remaining_tax": np.maximum(remaining, 0),
+        "months_left": months_left,
+        "monthly_tds": np.ceil(np.maximum(remaining, 0) / months_left), # Round up so the year never ends short
+        "excess_tds": np.maximum(-remaining, 0),
+    })
+
+
+def load_payroll_csv(path_or_buffer, month, fy_start_year=None):
+    """Reads a payroll CSV (see REQUIRED_COLUMNS / OPTIONAL_COLUMNS) and projects this month's TDS."""
+    return compute_monthly_tds(pd.read_csv(path_or_buffer), month, fy_start_year)
+# --- END MONTHLY TDS PROJECTION ---
+
+
+# --- CLI / THROUGHPUT BENCHMARK ---
+def _synthetic_payroll(n_employees, month_index, seed=5):
+    rng = np.random.default_rng(seed)
+    monthly = rng.uniform(25000, 400000, n_employees).round(0)
+    return pd.DataFrame({
+        "employee_id": np.arange(n_employees),
+        "regime": np.where(rng.random(n_employees) < 0.3, "Old", "New"),
+        "monthly_salary": monthly,
+        "ytd_salary": monthly * month_index,
+        "ytd_tds": (monthly * month_index * rng.uniform(0, 0.15, n_employees)).round(0),
+        "declared_80c": rng.uniform(0, 200000, n_employees).round(0),
+        "declared_80d": rng.uniform(0, 50000, n_employees).round(0),
+        "hra_exemption": rng.uniform(0, 300000, n_employees).round(0),
+        "professional_tax": 2500,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly TDS for every employee")
+    parser.add_argument("payroll_csv", nargs="?", help="payroll CSV; omit to run the 50k-employee benchmark")
+    parser.add_argument("--month", default="Apr", help="payroll month, e.g. Oct or 10")
+    parser.add_argument("--fy", type=int, default=None,
+                        help="financial year it falls in, by its starting year (2025 = FY 2025-26; default: current)")
+    parser.add_argument("--out", default="monthly_tds.csv", help="output CSV")
+    args = parser.parse_args()
+
+    if args.payroll_csv:
+        result = load_payroll_csv(args.payroll_csv, args.month, args.fy)
+        result.to_csv(args.out, index=False)
+        print(f"Wrote TDS for {len(result):,} employees to {args.out} | Total this month: Rs. {result['monthly_tds'].sum():,.0f}")
+    else:
+        n = 50_000
+        month = "Oct"
+        data = _synthetic_payroll(n, _fy_month_index(month))
+        start = time.perf_counter()
+        result = compute_monthly_tds(data, month, args.fy)
+        elapsed = time.perf_counter() - start
+        print(f"--- Payroll TDS benchmark: {n:,} employees, {month} run ---")
+        print(f"Computed in {elapsed:.3f}s -> {n / elapsed:,.0f} employees/s")
+        print(f"TDS this month: Rs. {result['monthly_tds'].sum():,.0f} | Employees over-deducted: {(result['excess_tds'] > 0).sum():,}")
+# --- END CLI / BENCHMARK ---
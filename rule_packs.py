@@ -0,0 +1,187 @@
+import argparse
+import bisect
+import functools
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+# --- SETTINGS ---
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules") # One <assessment year>.json per year
+DEFAULT_ASSESSMENT_YEAR = "2024-25" # The rules the app always applied; used when a document's year can't be read
+REGIMES = ("Old", "New")
+# --- END SETTINGS ---
+
+_YEAR = re.compile(r"20\d\d")
+_PACK_FILE = re.compile(r"^20\d\d-\d\d\.json$")
+
+
+def normalize_assessment_year(value):
+    """'2025-26' / 'AY 2025-2026' / '2025' -> '2025-26'; None when there is no year in it."""
+    match = _YEAR.search(str(value or ""))
+    if not match:
+        return None
+    start = int(match.group())
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def compile_slabs(slabs):
+    """Turns (start, rate) pairs into breakpoint, accrued-tax and rate arrays.
+
+    accrued[i] is the tax on an income of exactly starts[i], so the tax on any income is
+    accrued[i] + (income - starts[i]) * rates[i] for the slab i found by binary search.
+    """
+    starts = np.array([s for s, _ in slabs], dtype=float)
+    rates = np.array([r for _, r in slabs], dtype=float)
+    accrued = np.concatenate(([0.0], np.cumsum(np.diff(starts) * rates[:-1])))
+    return starts, accrued, rates
+
+
+class RulePack:
+    """One assessment year's tax rules, compiled for tax_engine. Get packs from load_pack() / pack_for().
+
+    Packs are shared by every session of the process: treat them as read-only.
+    """
+
+    def __init__(self, spec, source="<spec>"):
+        try:
+            self.assessment_year = spec['assessment_year']
+            self.financial_year = spec['financial_year']
+            self.slabs, self.compiled, self.standard_deduction, self.rebate = {}, {}, {}, {}
+            for regime in REGIMES:
+                rules = spec['regimes'][regime]
+                slabs = [(float(start), float(rate)) for start, rate in rules['slabs']]
+                starts = [start for start, _ in slabs]
+                if starts[0] != 0 or any(b <= a for a, b in zip(starts, starts[1:])):
+                    raise ValueError(f"{regime} regime slabs must start at 0 and be in increasing order")
+                if any(not 0 <= rate <= 1 for _, rate in slabs):
+                    raise ValueError(f"{regime} regime slab rates must be between 0 and 1")
+                self.slabs[regime] = slabs
+                self.compiled[regime] = compile_slabs(slabs)
+                self.standard_deduction[regime] = float(rules['standard_deduction'])
+                rebate = rules['rebate_87a']
+                self.rebate[regime] = (float(rebate['income_limit']), float(rebate['max_rebate']))
+            self.cess_rate = float(spec['cess_rate'])
+            self.professional_tax_cap = float(spec['professional_tax_cap'])
+            self.section_caps = {section: float(cap) for section, cap in spec['section_caps'].items()}
+            self.professional_tax_by_state = dict(spec['professional_tax_by_state'])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid rule pack {source}: {e}") from e
+
+    def __repr__(self):
+        return f"RulePack(AY {self.assessment_year})"
+
+
+# --- LOADING (each pack is read and compiled once per process) ---
+@functools.lru_cache(maxsize=None)
+def available_years():
+    """Assessment years that have a pack in RULES_DIR, oldest first."""
+    return tuple(sorted(name[:-len(".json")] for name in os.listdir(RULES_DIR) if _PACK_FILE.match(name)))
+
+
+@functools.lru_cache(maxsize=None)
+def load_pack(assessment_year):
+    """The compiled pack for an exact assessment year such as '2025-26'."""
+    path = os.path.join(RULES_DIR, f"{assessment_year}.json")
+    with open(path, encoding="utf-8") as f:
+        pack = RulePack(json.load(f), source=path)
+    if pack.assessment_year != assessment_year:
+        raise ValueError(f"Invalid rule pack {path}: it is for AY {pack.assessment_year}")
+    return pack
+
+
+def default_pack():
+    return load_pack(DEFAULT_ASSESSMENT_YEAR)
+
+
+def pack_for_year(assessment_year):
+    """Pack for an assessment year as written on a document or report.
+
+    A year without its own pack uses the latest earlier one (rules carry over until a new pack
+    ships), and a year before every pack uses the oldest. Compare the pack's assessment_year
+    with the document's to tell the user when that happened.
+    """
+    year = normalize_assessment_year(assessment_year)
+    if year is None:
+        return default_pack()
+    years = available_years()
+    return load_pack(years[max(bisect.bisect_right(years, year) - 1, 0)])
+
+
+def pack_for_financial_year(fy_start_year):
+    """Pack for the financial year starting in April of `fy_start_year` (FY 2025-26 -> AY 2026-27)."""
+    return pack_for_year(f"{fy_start_year + 1}-{(fy_start_year + 2) % 100:02d}")
+
+
+def pack_for(extracted_data):
+    """Pack for the assessment year in TaxScan's extracted_data."""
+    personal = (extracted_data or {}).get('personal_info') or {}
+    return pack_for_year(personal.get('assessment_year'))
+# --- END LOADING ---
+
+
+# --- CLI: RECOMPUTE SAVED REPORTS / BENCHMARK ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tax rule packs: recompute saved reports under their own year's rules")
+    parser.add_argument("--recompute", action="store_true", help="recompute saved reports (all users unless --user)")
+    parser.add_argument("--user", help="only this user's reports")
+    parser.add_argument("--save", action="store_true", help="write the recomputed figures back (default: report only)")
+    parser.add_argument("--benchmark", type=int, default=1_000_000, help="incomes to time slab evaluation on")
+    args = parser.parse_args()
+
+    import tax_engine
+
+    if args.recompute:
+        import db_utils
+        db_utils.create_tables()
+        rows = db_utils.load_all_calculations(args.user)
+        start = time.perf_counter()
+        reports = tax_engine.recompute_reports([json.loads(row['calculation_data']) for row in rows])
+        elapsed = time.perf_counter() - start
+        changed = []
+        for row, report in zip(rows, reports):
+            before = json.loads(row['calculation_data'])
+            if any(before.get(key) != report[key] for key in tax_engine.RECOMPUTED_FIELDS):
+                changed.append((row['id'], report))
+                print(f"#{row['id']} {row['username']} AY {before.get('assessment_year', 'N/A')} "
+                      f"(rules {report['rules_assessment_year']}): old {before.get('old_regime_tax_liability')} -> "
+                      f"{report['old_regime_tax_liability']:,.2f}, new {before.get('new_regime_tax_liability')} -> "
+                      f"{report['new_regime_tax_liability']:,.2f}")
+        print(f"--- Recomputed {len(reports):,} saved reports in {elapsed * 1000:.1f} ms; {len(changed):,} differ ---")
+        if args.save and changed:
+            db_utils.update_calculations(changed)
+            print(f"Saved {len(changed):,} reports and rebuilt the yearly rollups.")
+    else:
+        start = time.perf_counter()
+        packs = [load_pack(year) for year in available_years()]
+        load_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        pack_for_year("AY 2025-2026")
+        cached_us = (time.perf_counter() - start) * 1e6
+        print(f"--- {len(packs)} rule packs: {', '.join(p.assessment_year for p in packs)} "
+              f"(load + compile {load_ms:.1f} ms once; later lookups {cached_us:.1f} µs) ---")
+
+        incomes = np.random.default_rng(5).uniform(0, 5_000_000, args.benchmark)
+        compiled = default_pack().compiled["New"]
+        starts, _, rates = compiled
+        widths = np.append(np.diff(starts), np.inf)
+
+        def clip_matmul():
+            # The previous evaluation: every income against every slab
+            return np.clip(incomes[:, None] - starts, 0, widths) @ rates
+
+        def bisect_accrued():
+            return tax_engine.slab_tax(incomes, compiled)
+
+        print(f"{'Slab evaluation':<22} {'ms':>8}  ({args.benchmark:,} incomes)")
+        results = {}
+        for label, run in (("Clip + matmul", clip_matmul), ("Bisect + accrued tax", bisect_accrued)):
+            run()
+            start = time.perf_counter()
+            results[label] = run()
+            print(f"{label:<22} {(time.perf_counter() - start) * 1000:>8.1f}")
+        a, b = results.values()
+        print(f"Max difference: Rs. {np.abs(a - b).max():.6f}")
+# --- END CLI ---
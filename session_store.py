@@ -0,0 +1,261 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+# --- SETTINGS ---
+SESSION_BUDGET_BYTES = 64 * 1024 # In-memory values per session; the rest waits on disk
+GLOBAL_BUDGET_BYTES = 16 * 1024 * 1024 # In-memory values across all sessions of this server
+MIN_SPILL_BYTES = 2048 # Smaller values always stay in memory: not worth a file
+SESSION_IDLE_SECONDS = 2 * 3600 # Streamlit has no session-end hook, so idle sessions are dropped
+COMPRESSION_LEVEL = 6
+# --- END SETTINGS ---
+
+# What st.session_state holds instead of a stored value: small, truthy, and changes when the value does
+Stored = namedtuple("Stored", ["key", "size", "version"])
+
+
+class _Entry:
+    __slots__ = ("value", "size", "version", "path", "in_memory")
+
+    def __init__(self, value, size, version):
+        self.value, self.size, self.version = value, size, version
+        self.path = None # Compressed copy on disk, if one has been written for this version
+        self.in_memory = True
+
+
+class SessionStore:
+    """Large per-session values (model responses, old chat turns) under memory budgets.
+
+    Every session may keep `session_budget` bytes in memory and all sessions together
+    `global_budget`. Past either budget, the least recently used values of at least
+    `min_spill_bytes` are pickled, zlib-compressed and written to `spill_dir`; `get`
+    loads them back on demand. A spilled value that is read but not changed keeps its
+    file, so spilling it again costs nothing. Sizes are pickled sizes, which track the
+    memory held by strings, bytes and lists of dicts closely enough to budget with.
+    """
+
+    def __init__(self, spill_dir=None, session_budget=SESSION_BUDGET_BYTES, global_budget=GLOBAL_BUDGET_BYTES,
+                 min_spill_bytes=MIN_SPILL_BYTES, idle_seconds=SESSION_IDLE_SECONDS):
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="taxbuddy-sessions-")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.session_budget, self.global_budget = session_budget, global_budget
+        self.min_spill_bytes, self.idle_seconds = min_spill_bytes, idle_seconds
+        self._entries = {} # (session, key) -> _Entry
+        self._resident = OrderedDict() # Keys of in-memory values big enough to spill, least recently used first
+        self._session_bytes = {} # session -> bytes held in memory
+        self._last_seen = {} # session -> last put/get time
+        self._version = 0
+        self._next_expiry = 0.0
+        self._lock = threading.Lock() # Streamlit sessions run on separate threads
+        self.memory_bytes = 0
+        self.stats = {"puts": 0, "spills": 0, "spill_writes": 0, "disk_loads": 0, "expired_sessions": 0}
+
+    # --- accounting ---
+    def _account(self, session, delta):
+        self.memory_bytes += delta
+        self._session_bytes[session] = self._session_bytes.get(session, 0) + delta
+
+    def _spill(self, item_key, entry):
+        if entry.path is None:
+            session, key = item_key
+            folder = os.path.join(self.spill_dir, str(abs(hash(session))))
+            os.makedirs(folder, exist_ok=True)
+            entry.path = os.path.join(folder, f"{key}-{entry.version}.pkl.z")
+            with open(entry.path, "wb") as f:
+                f.write(zlib.compress(pickle.dumps(entry.value, pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL))
+            self.stats["spill_writes"] += 1
+        entry.value, entry.in_memory = None, False
+        del self._resident[item_key]
+        self._account(item_key[0], -entry.size)
+        self.stats["spills"] += 1
+
+    def _touch(self, item_key, entry):
+        if entry.size >= self.min_spill_bytes:
+            self._resident[item_key] = None
+            self._resident.move_to_end(item_key)
+
+    def _enforce(self, session):
+        """Spills least recently used values until the session and global budgets hold."""
+        if self._session_bytes.get(session, 0) > self.session_budget:
+            for item_key in [k for k in self._resident if k[0] == session]:
+                self._spill(item_key, self._entries[item_key])
+                if self._session_bytes[session] <= self.session_budget:
+                    break
+        while self.memory_bytes > self.global_budget and self._resident:
+            item_key = next(iter(self._resident))
+            self._spill(item_key, self._entries[item_key])
+
+    def _remove(self, item_key):
+        entry = self._entries.pop(item_key)
+        self._resident.pop(item_key, None)
+        if entry.in_memory:
+            self._account(item_key[0], -entry.size)
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _expire_idle(self, now):
+        if now < self._next_expiry:
+            return
+        self._next_expiry = now + 60
+        for session, seen in list(self._last_seen.items()):
+            if now - seen > self.idle_seconds:
+                self._drop_session(session)
+                self.stats["expired_sessions"] += 1
+
+    def _drop_session(self, session):
+        for item_key in [k for k in self._entries if k[0] == session]:
+            self._remove(item_key)
+        self._session_bytes.pop(session, None)
+        self._last_seen.pop(session, None)
+        shutil.rmtree(os.path.join(self.spill_dir, str(abs(hash(session)))), ignore_errors=True)
+    # --- end accounting ---
+
+    def put(self, session, key, value):
+        """Stores `value` for this session and returns its Stored handle."""
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        now = time.time()
+        with self._lock:
+            item_key = (session, key)
+            if item_key in self._entries:
+                self._remove(item_key)
+            self._version += 1
+            entry = self._entries[item_key] = _Entry(value, size, self._version)
+            self._touch(item_key, entry)
+            self._account(session, size)
+            self._last_seen[session] = now
+            self.stats["puts"] += 1
+            self._enforce(session)
+            self._expire_idle(now)
+            return Stored(key, size, entry.version)
+
+    def get(self, session, key, default=None):
+        """The stored value, read back from disk if it was spilled."""
+        with self._lock:
+            item_key = (session, key)
+            entry = self._entries.get(item_key)
+            if entry is None:
+                return default
+            self._last_seen[session] = time.time()
+            if entry.in_memory:
+                self._touch(item_key, entry)
+                return entry.value
+            with open(entry.path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+            entry.value, entry.in_memory = value, True
+            self._touch(item_key, entry)
+            self._account(session, entry.size)
+            self.stats["disk_loads"] += 1
+            self._enforce(session) # May spill something older of this session instead
+            return value
+
+    def has(self, session, key):
+        """True while a value is stored for (session, key); never reads it back from disk."""
+        with self._lock:
+            return (session, key) in self._entries
+
+    def touch(self, session):
+        """Marks a session as alive without reading anything, so only sessions nobody uses expire."""
+        with self._lock:
+            if session in self._last_seen:
+                self._last_seen[session] = time.time()
+
+    def discard(self, session, key):
+        with self._lock:
+            if (session, key) in self._entries:
+                self._remove((session, key))
+
+    def drop_session(self, session):
+        """Forgets everything stored for a session (e.g. on logout)."""
+        with self._lock:
+            self._drop_session(session)
+
+    def usage(self):
+        """Memory and disk use across all sessions."""
+        with self._lock:
+            spilled = [e for e in self._entries.values() if not e.in_memory]
+            disk = sum(os.path.getsize(e.path) for e in self._entries.values() if e.path and os.path.exists(e.path))
+            return {"sessions": len(self._last_seen), "values": len(self._entries), "memory_bytes": self.memory_bytes,
+                    "spilled_values": len(spilled), "spilled_bytes": sum(e.size for e in spilled), "disk_bytes": disk,
+                    **self.stats}
+
+
+# --- MEMORY PROFILE: 500 SIMULATED SESSIONS ---
+if __name__ == "__main__":
+    import gc
+    import random
+    import tracemalloc
+
+    SESSIONS, ACTIVE, CHAT_TURNS, HOT_MESSAGES = 500, 50, 30, 12
+    rng = random.Random(7)
+    words = ("tax regime deduction section salary income rebate cess refund advance interest exemption "
+             "slab taxable gross standard professional old new liability investment").split()
+
+    def text(n_words):
+        return " ".join(rng.choice(words) for _ in range(n_words)) + f" Rs. {rng.randint(1, 10**6):,}."
+
+    def session_values():
+        messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": text(15 if i % 2 == 0 else 110)}
+                    for i in range(CHAT_TURNS * 2)]
+        return {
+            "calculation_response": text(1400), # TaxLogic chain-of-thought essay
+            "investment_advice": text(600),
+            "messages": messages,
+            "uploaded_file": os.urandom(300 * 1024), # A scanned Form 16
+        }
+
+    # Before: every session keeps everything in st.session_state for as long as it lives
+    gc.collect()
+    tracemalloc.start()
+    before = {f"s{i}": session_values() for i in range(SESSIONS)}
+    before_bytes = tracemalloc.get_traced_memory()[0]
+    del before
+    gc.collect()
+    tracemalloc.stop()
+
+    # After: file bytes are released once queued (they live in the jobs table), the latest chat turns
+    # stay in session_state and the rest goes through the store
+    gc.collect()
+    tracemalloc.start()
+    store = SessionStore()
+    state, put_seconds = {}, 0.0
+    for i in range(SESSIONS):
+        values = session_values()
+        start = time.perf_counter()
+        state[f"s{i}"] = {"messages": values["messages"][-HOT_MESSAGES:]}
+        for key in ("calculation_response", "investment_advice"):
+            state[f"s{i}"][key] = store.put(f"s{i}", key, values[key])
+        store.put(f"s{i}", "chat_archive", values["messages"][:-HOT_MESSAGES])
+        put_seconds += time.perf_counter() - start
+        del values
+    after_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Reruns of the most recent sessions: their values come back from memory or disk
+    reads, start = 0, time.perf_counter()
+    for i in range(ACTIVE): # The oldest sessions, so most reads come from disk
+        for key in ("calculation_response", "investment_advice", "chat_archive"):
+            store.get(f"s{i}", key)
+            reads += 1
+    read_seconds = time.perf_counter() - start
+    usage = store.usage()
+
+    mb = 1024 * 1024
+    print(f"--- Session memory profile: {SESSIONS} sessions, {CHAT_TURNS}-turn chats, 300 KB upload each ---")
+    print(f"Before (everything in session_state): {before_bytes / mb:8.1f} MB")
+    print(f"After  (session store + handles):     {after_bytes / mb:8.1f} MB  "
+          f"(store budget {GLOBAL_BUDGET_BYTES / mb:.0f} MB, {SESSION_BUDGET_BYTES // 1024} KB per session)")
+    print(f"Store: {usage['memory_bytes'] / mb:.1f} MB in memory, {usage['spilled_values']} values spilled "
+          f"({usage['spilled_bytes'] / mb:.1f} MB -> {usage['disk_bytes'] / mb:.1f} MB compressed on disk)")
+    print(f"Put: {put_seconds / (SESSIONS * 3) * 1e6:.0f} µs per value | "
+          f"reads by {ACTIVE} returning sessions: {read_seconds / reads * 1e6:.0f} µs per value, "
+          f"{usage['disk_loads']} from disk")
+    shutil.rmtree(store.spill_dir, ignore_errors=True)
+# --- END MEMORY PROFILE ---
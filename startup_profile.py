@@ -0,0 +1,105 @@
+# Startup profile: module import cost at first paint and per-rerun setup overhead, before vs after.
+# Run from the project folder:  python startup_profile.py
+# Uses a throwaway .streamlit/config.yaml and database in a temp folder.
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# What app.py imported at the top before the lazy-import change, vs what it imports now
+EAGER_IMPORTS = ("import streamlit, google.generativeai, fpdf, pandas, plotly.graph_objects, plotly.express, "
+                 "streamlit_calendar, streamlit_authenticator, yaml")
+LAZY_IMPORTS = "import streamlit, streamlit_authenticator, yaml, db_utils, tax_calendar, prompts, job_queue"
+
+# The per-rerun setup app.py used to run on every rerun, vs the cached version
+OLD_SETUP = """
+import streamlit as st, yaml, streamlit_authenticator as stauth, db_utils
+db_utils.create_tables()
+with open('.streamlit/config.yaml') as f:
+    config = yaml.load(f, Loader=yaml.SafeLoader)
+stauth.Authenticate(config['credentials'], config['cookie']['name'], config['cookie']['key'], config['cookie']['expiry_days'])
+"""
+NEW_SETUP = """
+import streamlit as st, yaml, streamlit_authenticator as stauth, db_utils
+
+@st.cache_resource
+def init_database():
+    db_utils.create_tables()
+    return True
+
+@st.cache_resource
+def load_auth_config():
+    with open('.streamlit/config.yaml') as f:
+        return yaml.load(f, Loader=yaml.SafeLoader)
+
+init_database()
+config = load_auth_config()
+if 'authenticator' not in st.session_state:
+    st.session_state.authenticator = stauth.Authenticate(
+        config['credentials'], config['cookie']['name'], config['cookie']['key'], config['cookie']['expiry_days'])
+"""
+
+
+def _time_import(statement, repeats=3):
+    """Median wall time of a fresh interpreter running `statement`."""
+    env = dict(os.environ, PYTHONPATH=HERE)
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", statement], check=True, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def _time_reruns(app_test, reruns=10):
+    """(first run, median rerun) wall time for an AppTest."""
+    start = time.perf_counter()
+    app_test.run()
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app_test.run()
+        times.append(time.perf_counter() - start)
+    return first, statistics.median(times)
+
+
+def _write_config(folder):
+    import bcrypt
+    import yaml
+    os.makedirs(os.path.join(folder, ".streamlit"), exist_ok=True)
+    config = {
+        "credentials": {"usernames": {"demo": {"email": "demo@example.com", "name": "Demo",
+                                               "password": bcrypt.hashpw(b"demo", bcrypt.gensalt()).decode()}}},
+        "cookie": {"name": "taxbuddy_profile", "key": "profile-key-" + "x" * 20, "expiry_days": 1},
+    }
+    with open(os.path.join(folder, ".streamlit", "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+
+
+if __name__ == "__main__":
+    from streamlit.testing.v1 import AppTest
+
+    print("--- 1. Module import cost at first paint (fresh interpreter, median of 3) ---")
+    eager, lazy = _time_import(EAGER_IMPORTS), _time_import(LAZY_IMPORTS)
+    print(f"Before (eager imports): {eager * 1000:7.0f} ms")
+    print(f"After  (lazy imports):  {lazy * 1000:7.0f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_config(tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, HERE)
+
+        print("\n--- 2. Per-rerun setup overhead (config, authenticator, schema), median of 10 reruns ---")
+        for label, script in (("Before (every rerun)", OLD_SETUP), ("After  (cached)", NEW_SETUP)):
+            _, rerun = _time_reruns(AppTest.from_string(script, default_timeout=60))
+            print(f"{label}: {rerun * 1000:7.1f} ms")
+
+        print("\n--- 3. app.py login page (this process) ---")
+        first, rerun = _time_reruns(AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=60))
+        print(f"First paint: {first * 1000:7.0f} ms | Rerun: {rerun * 1000:7.1f} ms")
@@ -0,0 +1,230 @@
+import abc
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# --- SETTINGS ---
+BUSY_TIMEOUT_SECONDS = 30 # How long a writer waits on another process's lock before failing
+MAX_BATCH = 256 # Most writes folded into one group commit
+DEFAULT_BACKEND = os.environ.get("TAXBUDDY_STORAGE", "sqlite")
+# --- END SETTINGS ---
+
+
+# --- BACKEND INTERFACE ---
+class StorageBackend(abc.ABC):
+    """What db_utils needs from a database. A server database can implement this later.
+
+    write(fn) runs fn(conn) inside a write transaction and returns fn's result;
+    the connection must support conn.execute(sql, params) with '?' placeholders and name-indexable rows.
+    """
+
+    @abc.abstractmethod
+    def write(self, fn):
+        """Runs fn(conn) in a write transaction and returns its result."""
+
+    def close(self):
+        pass
+
+
+_FACTORIES = {} # name -> factory(url)
+_INSTANCES = {} # (name, url) -> backend
+_INSTANCES_LOCK = threading.Lock()
+
+
+def register_backend(name, factory):
+    """Makes a backend selectable by name (TAXBUDDY_STORAGE)."""
+    _FACTORIES[name] = factory
+
+
+def get_backend(url, name=None):
+    """Returns the process-wide backend for `url`, creating it on first use."""
+    name = name or DEFAULT_BACKEND
+    key = (name, url)
+    backend = _INSTANCES.get(key)
+    if backend is None:
+        with _INSTANCES_LOCK:
+            backend = _INSTANCES.get(key)
+            if backend is None:
+                if name not in _FACTORIES:
+                    raise ValueError(f"Unknown storage backend '{name}'. Registered: {', '.join(_FACTORIES)}")
+                backend = _INSTANCES[key] = _FACTORIES[name](url)
+    return backend
+# --- END INTERFACE ---
+
+
+# --- SQLITE BACKEND: ONE WRITER THREAD, GROUP COMMITS ---
+class _WriteRequest:
+    __slots__ = ("fn", "done", "result", "error")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SQLiteBackend(StorageBackend):
+    """Serializes all of a process's writes through one connection and commits them in batches.
+
+    Callers block until their write is committed, so the API stays synchronous. While one
+    commit is in flight, new writes queue up and go into the next transaction together.
+    WAL mode lets reads (plain connections from db_utils) run alongside the writer and lets
+    several replicas share the file; BUSY_TIMEOUT covers cross-process lock waits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        self.stats = {"writes": 0, "commits": 0, "largest_batch": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable at checkpoints; safe with WAL
+        self._thread = threading.Thread(target=self._writer_loop, name=f"sqlite-writer:{path}", daemon=True)
+        self._thread.start()
+
+    def write(self, fn):
+        request = _WriteRequest(fn)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _writer_loop(self):
+        conn = self._conn
+        while True:
+            batch = self._next_batch()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for request in batch:
+                    # A savepoint per write, so one bad write doesn't roll back its batch-mates
+                    conn.execute("SAVEPOINT write_op")
+                    try:
+                        request.result = request.fn(conn)
+                        conn.execute("RELEASE write_op")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_op")
+                        conn.execute("RELEASE write_op")
+                        request.error = e
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for request in batch:
+                    request.result, request.error = None, request.error or e
+            self.stats["writes"] += len(batch)
+            self.stats["commits"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            for request in batch:
+                request.done.set()
+
+
+register_backend("sqlite", SQLiteBackend)
+# --- END SQLITE BACKEND ---
+
+
+# --- LOAD TEST: CONCURRENT SESSIONS, ONE PROCESS EACH ---
+def _session(path, username, n_ops):
+    """A session in its own process, writing through this process's backend like an app replica."""
+    import datetime
+    import db_utils
+    db_utils.DB_NAME = path
+    errors = []
+    for i in range(n_ops):
+        try:
+            if i % 3 == 0:
+                db_utils.add_deduction(username, "80C", f"SIP #{i}", 1000.0, datetime.date.today())
+            elif i % 3 == 1:
+                db_utils.add_user_event(username, f"Reminder #{i}", datetime.date.today())
+            else:
+                db_utils.save_calculation(username, {"assessment_year": "2025-26", "gross_total_income": 1000000 + i})
+            db_utils.get_deductions_summary(username) # Interleaved read, as a rerun would do
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    return errors, db_utils.get_storage().stats
+
+
+def _naive_session(path, username, n_ops):
+    """Baseline, like the original db_utils: a plain connection, a transaction per write, rollback journal."""
+    errors = []
+    conn = sqlite3.connect(path) # Default 5s busy timeout, as before
+    for i in range(n_ops):
+        try:
+            with conn:
+                conn.execute("INSERT INTO deductions (username, section, description, amount) VALUES (?, '80C', ?, 1000)",
+                             (username, f"SIP #{i}"))
+            conn.execute("SELECT section, SUM(amount) FROM deductions WHERE username = ? GROUP BY section", (username,)).fetchall()
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    conn.close()
+    return errors, None
+
+
+def _run_session(target, path, username, n_ops, start, results):
+    start.wait() # Every process is up before any writes, so they all contend
+    results.put(target(path, username, n_ops))
+
+
+def _create_naive_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE deductions (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, "
+                 "section TEXT NOT NULL, description TEXT, amount REAL NOT NULL, date_added DATE)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    import tempfile
+    import db_utils
+
+    parser = argparse.ArgumentParser(description="Load-test concurrent writers, one process (connection) per session")
+    parser.add_argument("--sessions", type=int, default=100, help="writer processes")
+    parser.add_argument("--ops", type=int, default=100, help="writes per session")
+    args = parser.parse_args()
+    sessions, ops = args.sessions, args.ops
+    ctx = multiprocessing.get_context("spawn") # Same start method as the job_queue workers
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, use_queue in (("naive (plain connection per process)", False), ("write queue + group commit", True)):
+            path = os.path.join(tmp, f"load_{int(use_queue)}.db")
+            if use_queue:
+                db_utils.DB_NAME = path
+                db_utils.create_tables()
+            else:
+                _create_naive_db(path)
+            start, results = ctx.Event(), ctx.Queue()
+            processes = [ctx.Process(target=_run_session,
+                                     args=(_session if use_queue else _naive_session, path, f"user{i}", ops, start, results))
+                         for i in range(sessions)]
+            for p in processes:
+                p.start()
+            time.sleep(2) # Let the interpreters finish importing
+            began = time.perf_counter()
+            start.set()
+            outcomes = [results.get() for _ in processes]
+            elapsed = time.perf_counter() - began
+            for p in processes:
+                p.join()
+            errors = [e for session_errors, _ in outcomes for e in session_errors]
+            locked = sum("locked" in e for e in errors)
+            total = sessions * ops - len(errors)
+            print(f"--- {label}: {sessions} processes x {ops} writes ---")
+            print(f"{total:,} writes in {elapsed:.2f}s -> {total / elapsed:,.0f} writes/s | "
+                  f"'database is locked' errors: {locked} | other errors: {len(errors) - locked}")
+            if use_queue:
+                commits = sum(stats['commits'] for _, stats in outcomes)
+                writes = sum(stats['writes'] for _, stats in outcomes)
+                print(f"{commits:,} commits across {sessions} writers, avg batch {writes / commits:.1f}")
+# --- END LOAD TEST ---
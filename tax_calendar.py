@@ -0,0 +1,116 @@
+import calendar as _calendar
+import datetime
+
+# --- STATUTORY DEADLINE RULES ---
+# year_offset is relative to the start year of the financial year (FY 2024-25 -> 2024)
+DEADLINE_RULES = [
+    {"title": "Advance Tax (1st)", "month": 6, "day": 15, "year_offset": 0, "color": "#0000FF", "advance_tax_pct": 0.15,
+     "description": "First installment of Advance Tax (15% of estimated tax)."},
+    {"title": "Advance Tax (2nd)", "month": 9, "day": 15, "year_offset": 0, "color": "#0000FF", "advance_tax_pct": 0.45,
+     "description": "Second installment of Advance Tax (45% cumulative)."},
+    {"title": "Advance Tax (3rd)", "month": 12, "day": 15, "year_offset": 0, "color": "#0000FF", "advance_tax_pct": 0.75,
+     "description": "Third installment of Advance Tax (75% cumulative)."},
+    {"title": "Advance Tax (4th)", "month": 3, "day": 15, "year_offset": 1, "color": "#0000FF", "advance_tax_pct": 1.0,
+     "description": "Fourth (and final) installment of Advance Tax (100%)."},
+    {"title": "Tax Saving Deadline", "month": 3, "day": 31, "year_offset": 1, "color": "#FFA500",
+     "description": "Deadline for tax-saving investments (ELSS, PPF, etc.) for the financial year."},
+    {"title": "Form 16 Issued", "month": 6, "day": 15, "year_offset": 1, "color": "#808080",
+     "description": "Employers must issue Form 16 for the financial year."},
+    {"title": "ITR Filing Deadline", "month": 7, "day": 31, "year_offset": 1, "color": "#FF0000",
+     "description": "ITR filing deadline for individuals (non-audit)."},
+    {"title": "Belated/Revised ITR Deadline", "month": 12, "day": 31, "year_offset": 1, "color": "#FF0000",
+     "description": "Last date to file a belated or revised return."},
+]
+
+USER_EVENT_COLOR = "#008000" # Green for user events
+RECURRENCE_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+# --- END RULES ---
+
+
+def financial_year_of(date):
+    """Start year of the financial year containing `date` (April to March)."""
+    return date.year if date.month >= 4 else date.year - 1
+
+def fy_label(start_year):
+    """'FY 2024-25 / AY 2025-26' style label."""
+    return f"FY {start_year}-{(start_year + 1) % 100:02d} / AY {start_year + 1}-{(start_year + 2) % 100:02d}"
+
+
+def statutory_deadlines(fy_start_year):
+    """Generates the statutory deadlines for one financial year from DEADLINE_RULES."""
+    events = []
+    for rule in DEADLINE_RULES:
+        date = datetime.date(fy_start_year + rule["year_offset"], rule["month"], rule["day"])
+        events.append({"title": rule["title"], "start": date.isoformat(), "color": rule["color"],
+                       "description": rule["description"]})
+    return sorted(events, key=lambda e: e["start"])
+
+
+def advance_tax_due_dates(fy_start_year):
+    """[(rule title, due date, cumulative share of the year's tax)] for the advance tax installments."""
+    installments = [
+        (rule["title"], datetime.date(fy_start_year + rule["year_offset"], rule["month"], rule["day"]), rule["advance_tax_pct"])
+        for rule in DEADLINE_RULES if "advance_tax_pct" in rule
+    ]
+    return sorted(installments, key=lambda installment: installment[1])
+
+
+def deadlines_in_window(window_start, window_end):
+    """Statutory deadlines for every financial year whose events can fall inside the window."""
+    # Deadlines run up to ~21 months after FY start, so look back two years
+    first_fy = financial_year_of(window_start) - 2
+    last_fy = financial_year_of(window_end)
+    return [e for fy in range(first_fy, last_fy + 1) for e in statutory_deadlines(fy)
+            if window_start.isoformat() <= e["start"] <= window_end.isoformat()]
+
+
+# --- RECURRENCE EXPANSION ---
+def _add_months(date, months, anchor_day):
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    return datetime.date(year, month, min(anchor_day, _calendar.monthrange(year, month)[1]))
+
+
+def _as_date(val):
+    if val is None or isinstance(val, datetime.date):
+        return val
+    return datetime.date.fromisoformat(str(val)[:10])
+
+
+def expand_recurrence(start_date, recurrence, until_date, window_start, window_end):
+    """Yields occurrence dates of a repeating event that fall inside the window."""
+    step = RECURRENCE_MONTHS[recurrence]
+    start_date, until_date = _as_date(start_date), _as_date(until_date)
+    last = min(window_end, until_date) if until_date else window_end
+    # Jump straight to the first occurrence near the window instead of walking from start_date
+    months_ahead = max(0, (window_start.year - start_date.year) * 12 + window_start.month - start_date.month - step)
+    n = months_ahead // step
+    current = _add_months(start_date, n * step, start_date.day)
+    while current <= last:
+        if current >= window_start:
+            yield current
+        n += 1
+        current = _add_months(start_date, n * step, start_date.day)
+# --- END RECURRENCE ---
+
+
+def window_events(one_off_rows, recurring_rows, window_start, window_end, personal_deadlines=None):
+    """Materializes the widget event list for the visible window only.
+
+    `personal_deadlines` (e.g. from advance_tax.installment_events) replace the generic
+    statutory event whose title matches their `rule_title` on the same date.
+    """
+    personal = {(e["rule_title"], e["start"]): e for e in personal_deadlines or []}
+    events = [personal.get((e["title"], e["start"]), e) for e in deadlines_in_window(window_start, window_end)]
+    for row in one_off_rows:
+        events.append({"title": row['title'], "start": str(row['start_date']), "color": USER_EVENT_COLOR})
+    for row in recurring_rows:
+        for date in expand_recurrence(row['start_date'], row['recurrence'], row['until_date'], window_start, window_end):
+            events.append({"title": f"🔁 {row['title']}", "start": date.isoformat(), "color": USER_EVENT_COLOR})
+    return events
+
+
+def default_window(anchor):
+    """Visible range for a month view around `anchor` (includes the leading/trailing weeks)."""
+    first = anchor.replace(day=1)
+    return first - datetime.timedelta(days=7), _add_months(first, 1, 1) + datetime.timedelta(days=13)
@@ -0,0 +1,295 @@
+import numpy as np
+
+import rule_packs
+
+# --- REGIME RULES (from rules/<assessment year>.json; see rule_packs.py) ---
+# Functions given extracted_data use the pack for its assessment year. These constants are the
+# default pack's, for callers that have no document year (payroll, advance tax).
+_DEFAULT_RULES = rule_packs.default_pack()
+STANDARD_DEDUCTION = _DEFAULT_RULES.standard_deduction["New"]
+PROFESSIONAL_TAX_CAP = _DEFAULT_RULES.professional_tax_cap
+SEC_80C_CAP = _DEFAULT_RULES.section_caps["80C"]
+SEC_80D_CAP = _DEFAULT_RULES.section_caps["80D"] # Self & family, below 60
+SEC_80CCD_1B_CAP = _DEFAULT_RULES.section_caps["80CCD(1B)"] # Additional NPS contribution
+CESS_RATE = _DEFAULT_RULES.cess_rate
+# --- END REGIME RULES ---
+
+
+# --- VECTORIZED SLAB EVALUATION ---
+def slab_tax(taxable_income, compiled):
+    """Applies compiled slabs to a scalar or array of taxable incomes (before rebate and cess).
+
+    `compiled` is a RulePack.compiled entry; each income's slab is found by binary search over
+    the breakpoints, so the cost no longer grows with the number of slabs.
+    """
+    starts, accrued, rates = compiled
+    income = np.maximum(np.asarray(taxable_income, dtype=float), 0)
+    slab = np.searchsorted(starts, income, side="right") - 1
+    return accrued[slab] + (income - starts[slab]) * rates[slab]
+
+
+def regime_tax_breakdown(taxable_income, regime, rules=None):
+    """(slab tax, Sec 87A rebate, cess, final tax) for 'Old' or 'New' regime under a RulePack; vectorized."""
+    rules = rules or _DEFAULT_RULES
+    regime = "Old" if regime == "Old" else "New"
+    rebate_limit, rebate_max = rules.rebate[regime]
+
+    income = np.maximum(np.asarray(taxable_income, dtype=float), 0)
+    tax = slab_tax(income, rules.compiled[regime])
+    rebate = np.where(income <= rebate_limit, np.minimum(tax, rebate_max), 0)
+    final = np.round((tax - rebate) * (1 + rules.cess_rate), 2)
+    return tax, rebate, final - (tax - rebate), final
+
+
+def regime_tax(taxable_income, regime, rules=None):
+    """Final tax (after Sec 87A rebate and cess) for 'Old' or 'New' regime; vectorized."""
+    return regime_tax_breakdown(taxable_income, regime, rules)[3]
+# --- END SLAB EVALUATION ---
+
+
+# --- HELPERS OVER extracted_data ---
+def _amount(val):
+    try:
+        return float(val) if val is not None else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+def gross_total_income(extracted_data):
+    """Sums all income_sources in the extracted JSON."""
+    sources = (extracted_data or {}).get('income_sources') or []
+    return sum(_amount(s.get('amount')) for s in sources)
+
+def deductions_by_section(extracted_data):
+    """Totals deductions_claimed per section (e.g. {'80C': 120000.0})."""
+    totals = {}
+    for d in (extracted_data or {}).get('deductions_claimed') or []:
+        section = d.get('section')
+        if section:
+            totals[section] = totals.get(section, 0.0) + _amount(d.get('amount'))
+    return totals
+
+
+def calculate_hra_exemption(basic_salary, da, hra_received, rent_paid, city_type):
+    """Calculates HRA exemption."""
+    salary_for_hra = basic_salary + da
+    rent_paid_over_salary = rent_paid - (0.10 * salary_for_hra)
+
+    if city_type == "Metro":
+        city_allowance = 0.50 * salary_for_hra
+    else:
+        city_allowance = 0.40 * salary_for_hra
+
+    exemption = max(0, min(hra_received, rent_paid_over_salary, city_allowance))
+    return exemption
+# --- END HELPERS ---
+
+
+# --- DEDUCTION ALLOCATION OPTIMIZER ---
+def _grid(headroom, step):
+    """Candidate amounts from 0 to headroom (inclusive) in fixed steps."""
+    if headroom <= 0:
+        return np.zeros(1)
+    return np.unique(np.append(np.arange(0, headroom, step), headroom))
+
+
+def find_break_even(gross_income, base_deductions, new_regime_tax, step=500, rules=None):
+    """Smallest total old-regime deduction (over standard ded. + P-Tax) at which Old beats or ties New."""
+    candidates = np.arange(0, max(gross_income, 0) + step, step)
+    old_tax = regime_tax(gross_income - base_deductions - candidates, "Old", rules)
+    hits = np.nonzero(old_tax <= new_regime_tax)[0]
+    return float(candidates[hits[0]]) if hits.size else None
+
+
+def optimize_deductions(extracted_data, professional_tax=0, hra=None,
+                        sec_80d_cap=None, step=5000, rules=None):
+    """Searches 80C / 80D / NPS top-ups on a grid and returns the cheapest plan across both regimes.
+
+    `hra` is an optional dict of calculate_hra_exemption() keyword arguments.
+    Ties on tax are broken by the smallest additional investment.
+    Rules come from the document's assessment year unless a RulePack is given.
+    """
+    rules = rules or rule_packs.pack_for(extracted_data)
+    caps = rules.section_caps
+    sec_80d_cap = caps["80D"] if sec_80d_cap is None else sec_80d_cap
+    gross = gross_total_income(extracted_data)
+    claimed = deductions_by_section(extracted_data)
+    hra_exemption = calculate_hra_exemption(**hra) if hra else 0.0
+
+    p_tax = min(professional_tax, rules.professional_tax_cap)
+    base_old = rules.standard_deduction["Old"] + p_tax
+    base_new = rules.standard_deduction["New"] + p_tax
+    # Capped view of what's already claimed, so headroom never goes negative
+    existing_80c = min(claimed.get('80C', 0.0), caps["80C"])
+    existing_80d = min(claimed.get('80D', 0.0), sec_80d_cap)
+    existing_nps = min(claimed.get('80CCD(1B)', 0.0), caps["80CCD(1B)"])
+    other_sections = capped_total({k: v for k, v in claimed.items() if k not in ('80C', '80D', '80CCD(1B)')}, caps)
+    existing_chapter_via = existing_80c + existing_80d + existing_nps + other_sections
+
+    add_80c = _grid(caps["80C"] - existing_80c, step)
+    add_80d = _grid(sec_80d_cap - existing_80d, step)
+    add_nps = _grid(caps["80CCD(1B)"] - existing_nps, step)
+
+    # Full cartesian grid, evaluated in one shot
+    g_80c, g_80d, g_nps = np.meshgrid(add_80c, add_80d, add_nps, indexing='ij')
+    extra = (g_80c + g_80d + g_nps).ravel()
+    old_deductions = base_old + hra_exemption + existing_chapter_via + extra
+    old_tax = regime_tax(gross - old_deductions, "Old", rules)
+
+    new_tax = float(regime_tax(gross - base_new, "New", rules))
+
+    # Lexicographic (tax, investment) minimum
+    best = np.lexsort((extra, old_tax))[0]
+    best_old_tax = float(old_tax[best])
+
+    current_old_tax = float(old_tax[0]) # Grid origin == no extra investment
+    if best_old_tax < new_tax:
+        regime, tax = "Old", best_old_tax
+        allocation = {
+            "80C": float(g_80c.ravel()[best]),
+            "80D": float(g_80d.ravel()[best]),
+            "80CCD(1B)": float(g_nps.ravel()[best]),
+        }
+    else:
+        regime, tax = "New", new_tax
+        allocation = {"80C": 0.0, "80D": 0.0, "80CCD(1B)": 0.0}
+
+    break_even = find_break_even(gross, base_old, new_tax, rules=rules)
+
+    return {
+        "gross_total_income": gross,
+        "recommended_regime": regime,
+        "tax_liability": tax,
+        "additional_investment": sum(allocation.values()),
+        "allocation": allocation,
+        "hra_exemption": hra_exemption,
+        "old_regime_tax_current": current_old_tax,
+        "old_regime_tax_optimized": best_old_tax,
+        "new_regime_tax_liability": new_tax,
+        "break_even_old_regime_deductions": break_even,
+        "plans_evaluated": int(extra.size),
+        "rules_assessment_year": rules.assessment_year,
+    }
+# --- END OPTIMIZER ---
+
+
+# --- WHAT-IF CALCULATOR (incremental, local) ---
+# Sections with a statutory cap (default pack); everything else is taken as entered
+SECTION_CAPS = _DEFAULT_RULES.section_caps
+
+
+def taxes_paid(extracted_data):
+    """Sums TDS and advance tax from the extracted JSON."""
+    paid = (extracted_data or {}).get('taxes_paid') or {}
+    return _amount(paid.get('tds')) + _amount(paid.get('advance_tax'))
+
+
+def capped_total(deductions, caps):
+    """Sum of {section: amount} with each section held to its cap (uncapped sections as entered)."""
+    return sum(min(amount, caps.get(section, amount)) for section, amount in deductions.items())
+
+
+def summarize(gross, paid, old_tax, new_tax):
+    """The final_calc_json fields TaxLogic returns, from both regimes' final tax."""
+    final_due = round(min(old_tax, new_tax) - paid, 2)
+    return {
+        "gross_total_income": gross,
+        "total_taxes_paid": paid,
+        "old_regime_tax_liability": old_tax,
+        "new_regime_tax_liability": new_tax,
+        "recommended_regime": "Old" if old_tax < new_tax else "New",
+        "tax_saving_with_recommendation": round(abs(old_tax - new_tax), 2),
+        "final_amount_due_under_recommendation": final_due,
+        "status": "Tax Due" if final_due > 0 else ("Refund Due" if final_due < 0 else "No Tax Due"),
+    }
+
+
+class WhatIfCalculator:
+    """Recomputes both regimes for slider changes, reusing partial results whose inputs are unchanged.
+
+    Dependency graph: gross <- extra_income; hra <- (basic, hra_received, rent, city);
+    chapter_via <- deductions; old_tax <- (gross, hra, chapter_via); new_tax <- gross.
+    """
+
+    def __init__(self, extracted_data, professional_tax=0, sec_80d_cap=None, rules=None):
+        self.rules = rules or rule_packs.pack_for(extracted_data)
+        self.income_from_document = gross_total_income(extracted_data)
+        self.taxes_paid = taxes_paid(extracted_data)
+        p_tax = min(professional_tax, self.rules.professional_tax_cap)
+        self.base_old = self.rules.standard_deduction["Old"] + p_tax
+        self.base_new = self.rules.standard_deduction["New"] + p_tax
+        self.caps = dict(self.rules.section_caps)
+        if sec_80d_cap is not None:
+            self.caps["80D"] = sec_80d_cap
+        self._partials = {} # name -> (input key, value)
+        self.recomputed = [] # partials recomputed on the last update()
+
+    def _cached(self, name, key, compute):
+        hit = self._partials.get(name)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        value = compute()
+        self._partials[name] = (key, value)
+        self.recomputed.append(name)
+        return value
+
+    def update(self, deductions, extra_income=0.0, rent_paid=0.0, basic_salary=0.0,
+               hra_received=0.0, city_type="Metro"):
+        """Returns a final_calc_json-shaped dict for the given slider values."""
+        self.recomputed = []
+        deduction_key = tuple(sorted(deductions.items()))
+
+        gross = self._cached("gross", extra_income,
+                             lambda: self.income_from_document + extra_income)
+        hra_exemption = self._cached(
+            "hra", (basic_salary, hra_received, rent_paid, city_type),
+            lambda: calculate_hra_exemption(basic_salary, 0.0, hra_received, rent_paid, city_type) if rent_paid > 0 else 0.0
+        )
+        chapter_via = self._cached("chapter_via", deduction_key, lambda: capped_total(deductions, self.caps))
+        old_tax = self._cached(
+            "old_tax", (gross, hra_exemption, chapter_via),
+            lambda: float(regime_tax(gross - self.base_old - hra_exemption - chapter_via, "Old", self.rules))
+        )
+        new_tax = self._cached("new_tax", gross,
+                               lambda: float(regime_tax(gross - self.base_new, "New", self.rules)))
+
+        return dict(summarize(gross, self.taxes_paid, old_tax, new_tax), hra_exemption=hra_exemption)
+# --- END WHAT-IF CALCULATOR ---
+
+
+# --- SAVED REPORT RECOMPUTE ---
+# Keys of a saved final_calc_json that recompute_reports() replaces
+RECOMPUTED_FIELDS = ("old_regime_tax_liability", "new_regime_tax_liability", "recommended_regime",
+                     "tax_saving_with_recommendation", "final_amount_due_under_recommendation", "status",
+                     "rules_assessment_year")
+
+
+def recompute_reports(calc_jsons, sec_80d_cap=None):
+    """Recomputes saved summaries (final_calc_json) under the rules of each one's own assessment year.
+
+    Uses what a report keeps: gross_total_income, total_taxes_paid, deductions_used_for_old_regime
+    and professional_tax (0 for reports saved before it was recorded). Reports are grouped by
+    rule pack and each group is evaluated in one vectorized pass. Returns updated copies, in order.
+    """
+    groups = {}
+    for i, calc in enumerate(calc_jsons):
+        groups.setdefault(rule_packs.pack_for_year(calc.get('assessment_year')), []).append(i)
+
+    results = [None] * len(calc_jsons)
+    for rules, indexes in groups.items():
+        caps = dict(rules.section_caps)
+        if sec_80d_cap is not None:
+            caps["80D"] = sec_80d_cap
+        reports = [calc_jsons[i] for i in indexes]
+        gross = np.array([_amount(c.get('gross_total_income')) for c in reports])
+        p_tax = np.minimum([_amount(c.get('professional_tax')) for c in reports], rules.professional_tax_cap)
+        claimed = [deductions_by_section({'deductions_claimed': c.get('deductions_used_for_old_regime')}) for c in reports]
+        chapter_via = np.array([capped_total(sections, caps) for sections in claimed])
+        old_tax = regime_tax(gross - rules.standard_deduction["Old"] - p_tax - chapter_via, "Old", rules)
+        new_tax = regime_tax(gross - rules.standard_deduction["New"] - p_tax, "New", rules)
+        for i, calc, old, new in zip(indexes, reports, old_tax, new_tax):
+            summary = summarize(_amount(calc.get('gross_total_income')), _amount(calc.get('total_taxes_paid')),
+                                float(old), float(new))
+            results[i] = dict(calc, **{key: summary[key] for key in RECOMPUTED_FIELDS[:-1]},
+                              rules_assessment_year=rules.assessment_year)
+    return results
+# --- END SAVED REPORT RECOMPUTE ---